@@ -0,0 +1,134 @@
+"""Steps/sec of both `configs/cnn` models for the compile options of `train.py`.
+
+Usage, from the root of the repository :
+
+```bash
+python -m benchmarks.compile_options --steps 50
+```
+
+Each combination of `jit_compile` and `steps_per_execution` is trained on
+synthetic images with the shape given in `configs/datas`, and the throughput of
+the second epoch (once the graph is traced and compiled) is reported.
+"""
+import csv
+import itertools
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import tensorflow as tf
+import typer
+from hydra.experimental import compose, initialize
+from loguru import logger
+
+from src.utils import config_to_hydra_dict, load_obj, set_seed
+
+app = typer.Typer()
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    """Record the wall time of each epoch.
+
+    Args:
+        tf.keras.callbacks.Callback (Callback): Keras base callback.
+    """
+
+    def __init__(self) -> None:
+        """Initialization of the timer."""
+        super().__init__()
+        self.durations: List[float] = []
+        self.start = 0.0
+
+    def on_epoch_begin(self, epoch, logs=None) -> None:
+        """Start the timer.
+
+        Args:
+            epoch ([type]): Index of the epoch.
+            logs ([type], optional): Unused. Defaults to None.
+        """
+        self.start = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None) -> None:
+        """Stop the timer and save the duration of the epoch.
+
+        Args:
+            epoch ([type]): Index of the epoch.
+            logs ([type], optional): Unused. Defaults to None.
+        """
+        self.durations.append(time.perf_counter() - self.start)
+
+
+def steps_per_second(
+    cnn_name: str, jit_compile: bool, steps_per_execution: int, steps: int
+) -> float:
+    """Train a `cnn` config on synthetic datas and measure its throughput.
+
+    Args:
+        cnn_name (str): Name of the config in `configs/cnn`.
+        jit_compile (bool): Enable XLA JIT compilation.
+        steps_per_execution (int): Number of batches per `tf.function` call.
+        steps (int): Number of timed training steps.
+
+    Returns:
+        The number of training steps per second during the second epoch.
+    """
+    with initialize(config_path="../configs"):
+        config = compose(config_name="params", overrides=[f"cnn={cnn_name}"])
+    conf_dict = config_to_hydra_dict(config)
+    set_seed(config.prepare.seed)
+
+    batch_size = config.datasets.params.batch_size
+    images = tf.random.uniform((batch_size, *config.datas.img_shape))
+    labels = tf.one_hot(tf.zeros(batch_size, dtype=tf.int32), config.datas.n_classes)
+    ds = tf.data.Dataset.from_tensors((images, labels)).repeat()
+
+    tf.keras.backend.clear_session()
+    tf.config.optimizer.set_jit(jit_compile)
+
+    model = load_obj(config.cnn.class_name)(**conf_dict["cnn.params"])
+    model.compile(
+        optimizer=load_obj(config.optimizer.class_name)(
+            **conf_dict["optimizer.params"]
+        ),
+        loss=load_obj(config.losses.class_name)(**conf_dict["losses.params"]),
+        metrics=[load_obj(config.metrics.class_name)()],
+        steps_per_execution=steps_per_execution,
+    )
+
+    timer = EpochTimer()
+    model.fit(ds, epochs=2, steps_per_epoch=steps, callbacks=[timer], verbose=0)
+
+    return steps / timer.durations[-1]
+
+
+@app.command()
+def main(
+    steps: int = typer.Option(50, help="Timed steps per configuration."),
+    cnn_names: List[str] = typer.Option(["resnet", "wide_resnet"], help="Models."),
+    spe_values: List[int] = typer.Option([1, 8, 32], help="steps_per_execution."),
+    output: Path = typer.Option(Path("benchmarks/compile_options.csv")),
+) -> None:
+    """Benchmark every combination of model, `jit_compile` and `steps_per_execution`."""
+    rows: List[Dict[str, object]] = []
+    for cnn_name, jit_compile, spe in itertools.product(
+        cnn_names, [False, True], spe_values
+    ):
+        throughput = steps_per_second(cnn_name, jit_compile, spe, steps)
+        logger.info(f"{cnn_name} jit={jit_compile} spe={spe} : {throughput:.2f} it/s")
+        rows.append(
+            {
+                "cnn": cnn_name,
+                "jit_compile": jit_compile,
+                "steps_per_execution": spe,
+                "steps_per_sec": round(throughput, 3),
+            }
+        )
+
+    with open(output, "w", newline="") as saved_csv:
+        writer = csv.DictWriter(saved_csv, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    app()
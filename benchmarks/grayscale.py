@@ -0,0 +1,149 @@
+"""Accuracy and throughput of the grayscale mode, for both `configs/cnn` models.
+
+Usage, from the root of the repository, once `make_dataset.py` has been run :
+
+```bash
+python -m benchmarks.grayscale --epochs 3
+```
+
+For RGB and grayscale images, the input pipeline throughput of the train split
+and the memory of its decoded images are measured, then each model is trained
+on the train split, and its throughput and validation accuracy are reported.
+"""
+import csv
+import itertools
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+import tensorflow as tf
+import typer
+from hydra.experimental import compose, initialize
+from loguru import logger
+
+from benchmarks.compile_options import EpochTimer
+from src.tensorize import Tensorize
+from src.utils import config_to_hydra_dict, get_img_shape, load_obj, set_seed
+
+app = typer.Typer()
+
+
+def pipeline_throughput(
+    ts: Tensorize, data_path: str, batch_size: int
+) -> Dict[str, float]:
+    """Measure the decoding of a split.
+
+    Args:
+        ts (Tensorize): Dataset creation, with the image shape of the mode.
+        data_path (str): Path of the csv file of the split.
+        batch_size (int): Batch size.
+
+    Returns:
+        The images decoded per second and the memory of the decoded images, in MB.
+    """
+    dataset = ts.create_dataset(data_path, batch_size, 1, 1, False)
+    n_images = 0
+    n_bytes = 0
+    start = time.perf_counter()
+    for images, _ in dataset:
+        n_images += len(images)
+        n_bytes += images.numpy().nbytes
+    duration = time.perf_counter() - start
+    return {"images_per_sec": n_images / duration, "decoded_mb": n_bytes / 2 ** 20}
+
+
+def train_and_evaluate(
+    cnn_name: str, grayscale: bool, epochs: int
+) -> Dict[str, float]:
+    """Train a `cnn` config in a color mode, and evaluate it.
+
+    Args:
+        cnn_name (str): Name of the config in `configs/cnn`.
+        grayscale (bool): Decode the images in a single channel.
+        epochs (int): Training epochs.
+
+    Returns:
+        The pipeline measures, the training images per second of the last epoch,
+        and the validation accuracy.
+    """
+    with initialize(config_path="../configs"):
+        config = compose(
+            config_name="params",
+            overrides=[f"cnn={cnn_name}", f"datas.grayscale={grayscale}"],
+        )
+    config.datas.img_shape = get_img_shape(config.datas.img_shape, grayscale)
+    conf_dict = config_to_hydra_dict(config)
+    set_seed(config.prepare.seed)
+    tf.keras.backend.clear_session()
+
+    params = config.datasets.params
+    ts = Tensorize(
+        n_classes=config.datas.n_classes,
+        img_shape=get_img_shape(params.img_shape, grayscale),
+        random_seed=config.prepare.seed,
+    )
+    measures = pipeline_throughput(
+        ts, config.datasets.prepared_dataset.train, params.batch_size
+    )
+    ds = ts.create_dataset(
+        config.datasets.prepared_dataset.train,
+        params.batch_size,
+        1,
+        params.prefetch,
+        params.augment,
+    )
+    ds_val = ts.create_dataset(
+        config.datasets.prepared_dataset.val, params.batch_size, 1, 1, False
+    )
+
+    model = load_obj(config.cnn.class_name)(**conf_dict["cnn.params"])
+    model.compile(
+        optimizer=load_obj(config.optimizer.class_name)(
+            **conf_dict["optimizer.params"]
+        ),
+        loss=load_obj(config.losses.class_name)(**conf_dict["losses.params"]),
+        metrics=[load_obj(config.metrics.class_name)()],
+    )
+    timer = EpochTimer()
+    model.fit(ds, epochs=epochs, callbacks=[timer], verbose=0)
+    n_train = sum(len(labels) for _, labels in ds)
+    _, accuracy = model.evaluate(ds_val, verbose=0)
+
+    measures.update(
+        {
+            "train_images_per_sec": n_train / timer.durations[-1],
+            "val_accuracy": accuracy,
+            "n_params": int(np.sum([np.prod(w.shape) for w in model.weights])),
+        }
+    )
+    return measures
+
+
+@app.command()
+def main(
+    epochs: int = typer.Option(3, help="Training epochs per configuration."),
+    cnn_names: List[str] = typer.Option(["resnet", "wide_resnet"], help="Models."),
+    output: Path = typer.Option(Path("benchmarks/grayscale.csv")),
+) -> None:
+    """Compare the RGB and the grayscale modes of every model."""
+    rows: List[Dict[str, object]] = []
+    for cnn_name, grayscale in itertools.product(cnn_names, [False, True]):
+        measures = train_and_evaluate(cnn_name, grayscale, epochs)
+        logger.info(f"{cnn_name} grayscale={grayscale} : {measures}")
+        rows.append(
+            {
+                "cnn": cnn_name,
+                "grayscale": grayscale,
+                **{name: round(value, 4) for name, value in measures.items()},
+            }
+        )
+
+    with open(output, "w", newline="") as saved_csv:
+        writer = csv.DictWriter(saved_csv, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    app()
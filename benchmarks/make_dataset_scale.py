@@ -0,0 +1,190 @@
+"""Time and peak memory of each step of `make_dataset.py` on large trees.
+
+Usage, from the root of the repository :
+
+```bash
+python -m benchmarks.make_dataset_scale --sizes 10000 --sizes 100000
+python -m benchmarks.make_dataset_scale --update-baseline
+```
+
+For each size, a synthetic tree of class subfolders filled with empty `.jpg`
+files is created in a temporary directory. `get_files_paths`,
+`get_images_paths_and_labels`, `create_train_val_test_datasets` and
+`save_as_csv` are timed separately, then run again under `tracemalloc` to
+record their peak memory, so that the tracing doesn't slow down the timings.
+
+The results are compared with `benchmarks/make_dataset_baseline.json`, and the
+command fails if a step is slower or uses more memory than its baseline, beyond
+the tolerance.
+"""
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import typer
+from loguru import logger
+
+from src.make_dataset import (
+    create_train_val_test_datasets,
+    get_files_paths,
+    get_images_paths_and_labels,
+    save_as_csv,
+)
+
+BASELINE = Path("benchmarks/make_dataset_baseline.json")
+
+app = typer.Typer()
+
+
+def make_tree(root: Path, n_files: int, n_classes: int = 2) -> None:
+    """Create a tree of class subfolders, filled with empty images.
+
+    Args:
+        root (Path): Root directory of the tree.
+        n_files (int): Total number of files, split evenly between the classes.
+        n_classes (int, optional): Number of class subfolders. Defaults to 2.
+    """
+    for class_idx in range(n_classes):
+        class_dir = root / f"class_{class_idx}"
+        class_dir.mkdir(parents=True)
+        for idx in range(class_idx, n_files, n_classes):
+            (class_dir / f"{idx:07d}.jpg").touch()
+
+
+def measure(function: Callable[..., Any], *args: Any) -> Tuple[Any, float, float]:
+    """Run a function twice, once timed and once under `tracemalloc`.
+
+    Args:
+        function (Callable[..., Any]): The function to measure.
+        *args (Any): Its arguments.
+
+    Returns:
+        The result of the function, its duration in seconds and its peak memory in
+        MB.
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    duration = time.perf_counter() - start
+
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, duration, peak / 2 ** 20
+
+
+def benchmark_size(n_files: int) -> Dict[str, Dict[str, float]]:
+    """Measure each step of `make_dataset.py` on a synthetic tree.
+
+    Args:
+        n_files (int): Number of images in the tree.
+
+    Returns:
+        The duration and the peak memory of each step.
+    """
+    root = Path(tempfile.mkdtemp())
+    try:
+        make_tree(root / "images", n_files)
+        logger.info(f"Tree of {n_files} files created in {root}")
+
+        results: Dict[str, Tuple[float, float]] = {}
+        (files_paths, subdirs), seconds, peak_mb = measure(
+            get_files_paths, root / "images"
+        )
+        results["get_files_paths"] = (seconds, peak_mb)
+        (images, labels), seconds, peak_mb = measure(
+            get_images_paths_and_labels, files_paths, subdirs
+        )
+        results["get_images_paths_and_labels"] = (seconds, peak_mb)
+        datasets, seconds, peak_mb = measure(
+            create_train_val_test_datasets, images, labels
+        )
+        results["create_train_val_test_datasets"] = (seconds, peak_mb)
+        _, seconds, peak_mb = measure(
+            save_as_csv, datasets[0], datasets[1], root / "train.csv"
+        )
+        results["save_as_csv"] = (seconds, peak_mb)
+    finally:
+        shutil.rmtree(root)
+
+    return {
+        step: {"seconds": round(seconds, 4), "peak_mb": round(peak_mb, 2)}
+        for step, (seconds, peak_mb) in results.items()
+    }
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, Dict[str, float]]],
+    baseline: Dict[str, Dict[str, Dict[str, float]]],
+    tolerance: float,
+) -> List[str]:
+    """Compare the measures with the baseline.
+
+    Args:
+        results (Dict[str, Dict[str, Dict[str, float]]]): Measures, by size, step
+            and metric.
+        baseline (Dict[str, Dict[str, Dict[str, float]]]): Baseline measures, with
+            the same structure.
+        tolerance (float): Allowed relative increase, 0.25 for 25%.
+
+    Returns:
+        The description of each measure above its baseline.
+    """
+    regressions = []
+    for size, steps in results.items():
+        for step, measures in steps.items():
+            for metric, value in measures.items():
+                reference = baseline.get(size, {}).get(step, {}).get(metric)
+                if reference is not None and value > reference * (1 + tolerance):
+                    regressions.append(
+                        f"{step} on {size} files : {metric} {value} > {reference}"
+                    )
+    return regressions
+
+
+@app.command()
+def main(
+    sizes: List[int] = typer.Option([10000, 100000, 1000000], help="Tree sizes."),
+    tolerance: float = typer.Option(0.25, help="Allowed relative increase."),
+    update_baseline: bool = typer.Option(False, help="Save the results as baseline."),
+    baseline: Path = typer.Option(BASELINE, help="Baseline json."),
+) -> None:
+    """Benchmark `make_dataset.py` on each tree size and check the baseline."""
+    results = {}
+    for n_files in sizes:
+        results[str(n_files)] = benchmark_size(n_files)
+        for step, measures in results[str(n_files)].items():
+            per_file = 1e6 * measures["seconds"] / n_files
+            logger.info(
+                f"{n_files:>8} files, {step} : {measures['seconds']:.3f} s "
+                f"({per_file:.2f} us/file), {measures['peak_mb']:.1f} MB"
+            )
+
+    if update_baseline:
+        previous = json.loads(baseline.read_text()) if baseline.exists() else {}
+        previous.update(results)
+        baseline.write_text(json.dumps(previous, indent=2))
+        logger.info(f"Baseline saved in {baseline}")
+        return
+
+    if not baseline.exists():
+        logger.warning(f"No baseline in {baseline}, run with --update-baseline.")
+        return
+
+    regressions = find_regressions(
+        results, json.loads(baseline.read_text()), tolerance
+    )
+    for regression in regressions:
+        logger.error(f"Regression : {regression}")
+    if regressions:
+        raise typer.Exit(code=1)
+    logger.info("No regression compared to the baseline.")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,102 @@
+"""Step-time overhead of logging the training metrics to MLflow at every step.
+
+Usage, from the root of the repository :
+
+```bash
+python -m benchmarks.metric_logging --steps 500
+```
+
+A small model is trained on synthetic datas, in a temporary `mlruns` store,
+without logging, with a synchronous `mlflow.log_metrics` call at every step,
+and with the buffered logger of `src/metric_logger.py`. The mean step time of
+each mode and its overhead compared to no logging are reported.
+"""
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import mlflow
+import numpy as np
+import tensorflow as tf
+import typer
+from loguru import logger
+
+from src.callbacks import BufferedMetrics
+from src.metric_logger import BufferedMetricLogger
+
+app = typer.Typer()
+
+
+class SyncMetrics(tf.keras.callbacks.Callback):
+    """Log the batch metrics synchronously, like a per-step autolog.
+
+    Args:
+        tf.keras.callbacks.Callback (Callback): Keras base callback.
+    """
+
+    def on_train_batch_end(
+        self, batch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Log the batch metrics.
+
+        Args:
+            batch (int): Index of the step in the epoch.
+            logs (Optional[Dict[str, float]], optional): Metrics of the batch.
+                Defaults to None.
+        """
+        mlflow.log_metrics(logs or {}, step=batch)
+
+
+def mean_step_time(mode: str, steps: int) -> float:
+    """Train a small model with the given logging mode.
+
+    Args:
+        mode (str): "none", "sync" or "buffered".
+        steps (int): Number of training steps.
+
+    Returns:
+        The mean step time, in milliseconds.
+    """
+    inputs = tf.keras.Input((32,))
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(inputs)
+    model = tf.keras.Model(inputs, outputs)
+    model.compile(optimizer="adam", loss="categorical_crossentropy", metrics=["acc"])
+
+    images = np.random.rand(steps * 8, 32)
+    labels = tf.keras.utils.to_categorical(np.random.randint(2, size=steps * 8))
+
+    with mlflow.start_run() as run:
+        callbacks: List[tf.keras.callbacks.Callback] = []
+        metric_logger = None
+        if mode == "sync":
+            callbacks.append(SyncMetrics())
+        elif mode == "buffered":
+            metric_logger = BufferedMetricLogger(run.info.run_id, flush_interval=5)
+            callbacks.append(BufferedMetrics(metric_logger, every_n_steps=1))
+
+        start = time.perf_counter()
+        model.fit(
+            images, labels, batch_size=8, epochs=1, callbacks=callbacks, verbose=0
+        )
+        if metric_logger is not None:
+            metric_logger.close()
+        duration = time.perf_counter() - start
+
+    return duration / steps * 1000
+
+
+@app.command()
+def main(steps: int = typer.Option(500, help="Training steps per mode.")) -> None:
+    """Compare the step time without logging, with sync and buffered logging."""
+    mlflow.set_tracking_uri(f"file://{tempfile.mkdtemp()}/mlruns")
+    mean_step_time("none", 10)
+
+    modes = ["none", "sync", "buffered"]
+    step_times = {mode: mean_step_time(mode, steps) for mode in modes}
+    for mode, step_time in step_times.items():
+        overhead = step_time - step_times["none"]
+        logger.info(f"{mode:>8} : {step_time:.3f} ms/step, overhead {overhead:.3f} ms")
+
+
+if __name__ == "__main__":
+    app()
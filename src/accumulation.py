@@ -0,0 +1,118 @@
+from typing import Dict, Tuple
+
+import tensorflow as tf
+
+
+class GradientAccumulator(object):
+    """Accumulate gradients over several micro-batches before an optimizer step.
+
+    The effective batch size becomes `batch_size * accumulation_steps` while only
+    `batch_size` images are in memory at once. The loss of each micro-batch is
+    divided by `accumulation_steps`, so that the accumulated gradient is the mean
+    over the effective batch, and `optimizer.iterations` (thus learning rate
+    schedules) only counts the real optimizer steps.
+
+    The BatchNormalization statistics are still computed on each micro-batch.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, model: tf.keras.Model, accumulation_steps: int) -> None:
+        """Initialization of the accumulator.
+
+        Args:
+            model (tf.keras.Model): The (built) model to train.
+            accumulation_steps (int): Number of micro-batches per optimizer step.
+        """
+        self.model = model
+        self.accumulation_steps = accumulation_steps
+        self.step = tf.Variable(0, trainable=False, dtype=tf.int64)
+        self.gradients = [
+            tf.Variable(tf.zeros_like(variable), trainable=False)
+            for variable in model.trainable_variables
+        ]
+
+    def train_step(self, data: Tuple[tf.Tensor, tf.Tensor]) -> Dict[str, tf.Tensor]:
+        """Replacement of `tf.keras.Model.train_step`.
+
+        Works with any optimizer of `configs/optimizer`, wrapped or not in a
+        `LossScaleOptimizer`.
+
+        Args:
+            data (Tuple[tf.Tensor, tf.Tensor]): A micro-batch of images and labels.
+
+        Returns:
+            The current values of the metrics of the model.
+        """
+        images, labels = data
+        model = self.model
+        optimizer = model.optimizer
+        loss_scaled = isinstance(optimizer, tf.keras.mixed_precision.LossScaleOptimizer)
+
+        with tf.GradientTape() as tape:
+            predictions = model(images, training=True)
+            loss = model.compiled_loss(
+                labels, predictions, regularization_losses=model.losses
+            )
+            micro_batch_loss = loss / self.accumulation_steps
+            if loss_scaled:
+                micro_batch_loss = optimizer.get_scaled_loss(micro_batch_loss)
+
+        gradients = tape.gradient(micro_batch_loss, model.trainable_variables)
+        if loss_scaled:
+            gradients = optimizer.get_unscaled_gradients(gradients)
+
+        for accumulated, gradient in zip(self.gradients, gradients):
+            accumulated.assign_add(gradient)
+        self.step.assign_add(1)
+
+        tf.cond(
+            tf.equal(self.step % self.accumulation_steps, 0),
+            self.apply_gradients,
+            lambda: tf.constant(False),
+        )
+
+        model.compiled_metrics.update_state(labels, predictions)
+        return {metric.name: metric.result() for metric in model.metrics}
+
+    def apply_gradients(self) -> tf.Tensor:
+        """Apply the accumulated gradients and reset them.
+
+        Returns:
+            A dummy tensor, needed by `tf.cond`.
+        """
+        gradients = [accumulated.read_value() for accumulated in self.gradients]
+        self.model.optimizer.apply_gradients(
+            zip(gradients, self.model.trainable_variables)
+        )
+        for accumulated in self.gradients:
+            accumulated.assign(tf.zeros_like(accumulated))
+
+        return tf.constant(True)
+
+
+def accumulate_gradients(
+    model: tf.keras.Model, accumulation_steps: int
+) -> tf.keras.Model:
+    """Make `model.fit` accumulate the gradients over `accumulation_steps` batches.
+
+    Only the `train_step` of this instance is replaced, the model stays a plain
+    functional model, so it is saved and reloaded (MLflow, `best_run.py`) as
+    before.
+
+    Args:
+        model (tf.keras.Model): The model to train, before `model.compile`.
+        accumulation_steps (int): Number of micro-batches per optimizer step, 1
+            keeps the default Keras `train_step`.
+
+    Returns:
+        The same model.
+    """
+    if accumulation_steps > 1:
+        accumulator = GradientAccumulator(model, accumulation_steps)
+        model.train_step = accumulator.train_step
+
+    return model
@@ -0,0 +1,316 @@
+from pathlib import Path
+from typing import List
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import typer
+import yaml
+from loguru import logger
+
+from embeddings import get_embedding_model, normalize
+from make_dataset import save_as_csv
+from predict import get_shards, iter_images, load_inference_model
+from tensorize import Tensorize
+from tta import with_tta
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+
+STRATEGIES = {"entropy", "margin"}
+
+app = typer.Typer()
+
+
+class MCDropout(tf.keras.layers.Dropout):
+    """Dropout layer which stays active at inference, for MC-dropout.
+
+    Args:
+        tf.keras.layers.Dropout (Dropout): Keras dropout layer.
+    """
+
+    def call(self, inputs: tf.Tensor, training=None) -> tf.Tensor:
+        """Apply the dropout, whatever the training mode.
+
+        Args:
+            inputs (tf.Tensor): Input tensor.
+            training ([type], optional): Unused. Defaults to None.
+
+        Returns:
+            The input with dropped units.
+        """
+        return super().call(inputs, training=True)
+
+
+def add_mc_dropout(model: tf.keras.Model, rate: float) -> tf.keras.Model:
+    """Insert a `MCDropout` layer before the last dense layer of a classifier.
+
+    The layers after the dense layer are applied in sequence, so the head must be
+    a chain of layers, like the head of the `configs/cnn` models. The layers, and
+    their weights, are shared with the classifier.
+
+    Args:
+        model (tf.keras.Model): Classifier without dropout layer.
+        rate (float): Fraction of the features dropped.
+
+    Raises:
+        ValueError: The model has no dense layer.
+
+    Returns:
+        The classifier with dropout.
+    """
+    dense_indexes = [
+        idx
+        for idx, layer in enumerate(model.layers)
+        if isinstance(layer, tf.keras.layers.Dense)
+    ]
+    if not dense_indexes:
+        raise ValueError(f"No dense layer in {model.name} to add a dropout before.")
+
+    outputs = MCDropout(rate)(model.layers[dense_indexes[-1]].input)
+    for layer in model.layers[dense_indexes[-1] :]:
+        outputs = layer(outputs)
+    return tf.keras.Model(model.inputs, outputs, name=f"{model.name}_dropout")
+
+
+def with_mc_dropout(
+    model: tf.keras.Model, n_samples: int, rate: float = 0.2
+) -> tf.keras.Model:
+    """Average the predictions of several dropout masks, in a single forward pass.
+
+    The dropout layers of the model are replaced by `MCDropout` layers, or a
+    `MCDropout` layer is added before the last dense layer if the model has no
+    dropout, like the `configs/cnn` models. Each batch is repeated `n_samples`
+    times, so each copy of an image gets its own dropout mask. The batch
+    normalization layers stay in inference mode.
+
+    Args:
+        model (tf.keras.Model): Classifier.
+        n_samples (int): Number of dropout masks per image.
+        rate (float, optional): Rate of the dropout added to a model without
+            dropout. Defaults to 0.2.
+
+    Returns:
+        The model averaging the probabilities of the dropout masks.
+    """
+
+    def clone_layer(layer: tf.keras.layers.Layer) -> tf.keras.layers.Layer:
+        if isinstance(layer, tf.keras.layers.Dropout):
+            return MCDropout.from_config(layer.get_config())
+        return layer.__class__.from_config(layer.get_config())
+
+    if any(isinstance(layer, tf.keras.layers.Dropout) for layer in model.layers):
+        mc_model = tf.keras.models.clone_model(model, clone_function=clone_layer)
+        mc_model.set_weights(model.get_weights())
+    else:
+        logger.info(f"No dropout layer in {model.name}, dropout of {rate} added")
+        mc_model = add_mc_dropout(model, rate)
+
+    inputs = tf.keras.Input(model.input_shape[1:])
+    repeated = tf.keras.layers.Lambda(
+        lambda images: tf.tile(images, [n_samples, 1, 1, 1])
+    )(inputs)
+    predictions = mc_model(repeated, training=False)
+    outputs = tf.keras.layers.Lambda(
+        lambda probabilities: tf.reduce_mean(
+            tf.reshape(probabilities, [n_samples, -1, probabilities.shape[-1]]),
+            axis=0,
+        )
+    )(predictions)
+    return tf.keras.Model(inputs, outputs, name=f"{model.name}_mc{n_samples}")
+
+
+def get_uncertainty(probabilities: np.ndarray, strategy: str) -> np.ndarray:
+    """Score the uncertainty of the predictions, the higher the more uncertain.
+
+    Args:
+        probabilities (np.ndarray): Probabilities of the classes, (N, classes).
+        strategy (str): "entropy" of the probabilities, or "margin" between the two
+            most probable classes (1 - margin is returned).
+
+    Raises:
+        ValueError: Unknown strategy.
+
+    Returns:
+        The uncertainties, (N,).
+    """
+    if strategy == "entropy":
+        clipped = np.clip(probabilities, 1e-12, 1)
+        return -(clipped * np.log(clipped)).sum(axis=1)
+    if strategy == "margin":
+        two_best = np.sort(probabilities, axis=1)[:, -2:]
+        return 1 - (two_best[:, 1] - two_best[:, 0])
+    raise ValueError(f"Unknown strategy {strategy}, use one of {STRATEGIES}.")
+
+
+class TopCandidates(object):
+    """Keep the most uncertain images seen so far, with their embeddings.
+
+    Only `capacity` images are kept, so the memory doesn't depend on the size of
+    the pool.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        """Initialization of the candidates.
+
+        Args:
+            capacity (int): Maximum number of candidates kept.
+        """
+        self.capacity = capacity
+        self.filenames = np.array([], dtype=object)
+        self.uncertainties = np.array([], dtype=np.float32)
+        self.embeddings = np.zeros((0, 0), dtype=np.float16)
+
+    def add(
+        self, filenames: List[str], uncertainties: np.ndarray, embeddings: np.ndarray
+    ) -> None:
+        """Merge a batch of scored images with the candidates.
+
+        Args:
+            filenames (List[str]): Paths of the images.
+            uncertainties (np.ndarray): Uncertainties of the images.
+            embeddings (np.ndarray): Normalized embeddings of the images.
+        """
+        if not len(self.embeddings):
+            self.embeddings = np.zeros((0, embeddings.shape[1]), dtype=np.float16)
+        filenames_array = np.array(filenames, dtype=object)
+        all_filenames = np.concatenate([self.filenames, filenames_array])
+        all_uncertainties = np.concatenate([self.uncertainties, uncertainties])
+        all_embeddings = np.concatenate(
+            [self.embeddings, embeddings.astype(np.float16)]
+        )
+        kept = np.argsort(-all_uncertainties, kind="stable")[: self.capacity]
+        self.filenames = all_filenames[kept]
+        self.uncertainties = all_uncertainties[kept]
+        self.embeddings = all_embeddings[kept]
+
+
+def k_center_greedy(embeddings: np.ndarray, n_selected: int) -> np.ndarray:
+    """Select diverse points, each one the farthest from the already selected ones.
+
+    The first point is the first row, the most uncertain candidate.
+
+    Args:
+        embeddings (np.ndarray): Normalized embeddings, (N, D).
+        n_selected (int): Number of points to select.
+
+    Returns:
+        The indexes of the selected points, in selection order.
+    """
+    embeddings = embeddings.astype(np.float32)
+    n_selected = min(n_selected, len(embeddings))
+    selected = [0]
+    # cosine distance to the closest selected point
+    distances = 1 - embeddings @ embeddings[0]
+    for _ in range(n_selected - 1):
+        farthest = int(distances.argmax())
+        selected.append(farthest)
+        distances = np.minimum(distances, 1 - embeddings @ embeddings[farthest])
+    return np.array(selected)
+
+
+def get_scoring_model(
+    model: tf.keras.Model, tta: int, mc_samples: int, mc_rate: float = 0.2
+) -> tf.keras.Model:
+    """Give the model predicting the probabilities and the embeddings.
+
+    Without MC-dropout and TTA, both outputs come from a single forward pass of the
+    classifier.
+
+    Args:
+        model (tf.keras.Model): Classifier.
+        tta (int): Test-time augmentation factor, 0 to disable.
+        mc_samples (int): Number of MC-dropout samples, 0 to disable.
+        mc_rate (float, optional): Rate of the dropout added to a model without
+            dropout. Defaults to 0.2.
+
+    Returns:
+        The model of the probabilities and of the embeddings, as two outputs.
+    """
+    embedding_model = get_embedding_model(model)
+    if not mc_samples and not tta:
+        return tf.keras.Model(model.inputs, [model.output, embedding_model.output])
+
+    probability_model = model
+    if mc_samples:
+        probability_model = with_mc_dropout(probability_model, mc_samples, mc_rate)
+    if tta:
+        probability_model = with_tta(probability_model, tta, "mean")
+    inputs = tf.keras.Input(model.input_shape[1:])
+    return tf.keras.Model(inputs, [probability_model(inputs), embedding_model(inputs)])
+
+
+@app.command()
+def main(
+    pool: Path = typer.Argument(..., help="Unlabeled images folder, or manifest."),
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    budget: int = typer.Option(1000, help="Number of images to label."),
+    strategy: str = typer.Option("entropy", help="entropy or margin."),
+    candidates_factor: int = typer.Option(10, help="Candidates per selected image."),
+    tta: int = typer.Option(0, help="Test-time augmentation factor, 0 to disable."),
+    mc_samples: int = typer.Option(0, help="MC-dropout samples, 0 to disable."),
+    mc_rate: float = typer.Option(0.2, help="Dropout rate if the model has none."),
+    shard_size: int = typer.Option(10000, help="Images scored at once."),
+    batch_size: int = typer.Option(256, help="Batch size."),
+    output: Path = typer.Option(Path("datas/to_label.csv"), help="Manifest."),
+) -> None:
+    """Select the most informative unlabeled images to label.
+
+    The pool is scored shard by shard, and only the `budget * candidates_factor`
+    most uncertain images are kept. Among them, `budget` diverse images are
+    selected by k-center greedy in embedding space. The selected images are saved
+    in the format of `make_dataset.py`, with empty labels, in selection order, and
+    their uncertainties in a `_scores.csv` file next to it.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy {strategy}, use one of {STRATEGIES}.")
+
+    scoring_model = get_scoring_model(
+        load_inference_model(model), tta, mc_samples, mc_rate
+    )
+    ts = Tensorize(n_classes, scoring_model.input_shape[1:], random_seed)
+    candidates = TopCandidates(budget * candidates_factor)
+
+    for idx, shard in enumerate(get_shards(iter_images(pool), shard_size)):
+        dataset = ts.create_inference_dataset(shard, batch_size, prefetch=2)
+        probabilities = []
+        embeddings = []
+        for images in dataset:
+            batch_probabilities, batch_embeddings = scoring_model.predict_on_batch(
+                images
+            )
+            probabilities.append(batch_probabilities)
+            embeddings.append(normalize(batch_embeddings))
+        candidates.add(
+            shard,
+            get_uncertainty(np.concatenate(probabilities), strategy),
+            np.concatenate(embeddings),
+        )
+        logger.info(f"Shard {idx + 1} scored")
+
+    selected = k_center_greedy(candidates.embeddings, budget)
+    selected_files = [Path(name).absolute() for name in candidates.filenames[selected]]
+    output.parent.mkdir(parents=True, exist_ok=True)
+    save_as_csv(selected_files, [""] * len(selected_files), output)
+    pd.DataFrame(
+        {
+            "filename": selected_files,
+            "uncertainty": candidates.uncertainties[selected],
+            "rank": np.arange(len(selected)),
+        }
+    ).to_csv(output.with_name(f"{output.stem}_scores.csv"), index=False)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,58 +1,224 @@
+import json
+import os
+import shutil
+from functools import lru_cache
 from pathlib import Path
+from typing import Any, Dict, List, Tuple
 
-import mlflow
 import tensorflow as tf
 import yaml
 from loguru import logger
+from mlflow.tracking import MlflowClient
 from tensorflow.keras.models import load_model
 
-from utils import get_sorted_runs
+from utils import (
+    get_changed_runs,
+    get_last_runs,
+    get_local_store,
+    get_runs_fingerprint,
+    get_sorted_runs,
+)
 
 with open("configs/params.yaml") as reproducibility_params:
     mlflow_config = yaml.safe_load(reproducibility_params)["mlflow"]
 
 experiment_name = mlflow_config["experiment_name"]
 
+# Local cache of the best runs and of the models exported as SavedModel.
+CACHE_DIR = Path("models/cache")
+# Number of models kept loaded in memory.
+MODELS_LRU_SIZE = 4
+
+
+class BestRunResolver(object):
+    """Find the best run of an experiment, without searching all runs every time.
+
+    The best run of each (experiment, metric) is cached in a json file, with the
+    fingerprint of the runs of the experiment. As long as no run has been created,
+    has finished or has been deleted, the cached run is returned without reading
+    the store. When some runs changed, only the active ones are read and compared
+    to the cached best run. A full search is only done the first time, after a
+    deletion, when the cached best run has been deleted, or for a remote tracking
+    store.
 
-def load_model_artifact() -> tf.keras.Model:
-    """Load artifacts for a particular `run_id`.
     Args:
-        run_id (str): ID of the run to load model artifacts from.
-    Returns:
-        Artifacts needed for inference.
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
     """
 
-    all_runs = get_sorted_runs(
-        experiment_name=experiment_name,
-        order_by=["metrics.val_loss ASC"],
-    )
+    def __init__(self, cache_path: Path = CACHE_DIR / "best_runs.json") -> None:
+        """Initialization of the resolver.
+
+        Args:
+            cache_path (Path, optional): Json file of the cached best runs.
+                Defaults to CACHE_DIR / "best_runs.json".
+        """
+        self.cache_path = cache_path
+        self.client = MlflowClient()
+
+    def resolve(
+        self, experiment: str, metric: str = "val_loss", mode: str = "min"
+    ) -> str:
+        """Give the best finished run of an experiment.
+
+        Args:
+            experiment (str): Name of the experiment.
+            metric (str, optional): Metric used to rank the runs. Defaults to
+                "val_loss".
+            mode (str, optional): "min" or "max". Defaults to "min".
+
+        Raises:
+            ValueError: No finished run in the experiment.
+
+        Returns:
+            The ID of the best run.
+        """
+        experiment_id = self.client.get_experiment_by_name(experiment).experiment_id
+        store = get_local_store()
+        if store is None:
+            return self._search(experiment, metric, mode)[0]
+
+        experiment_dir = store / experiment_id
+        n_runs, last_modification = get_runs_fingerprint(experiment_dir)
+
+        cache = self._read_cache()
+        key = f"{experiment_id}/{metric}/{mode}"
+        cached = cache.get(key)
+
+        if cached is None or n_runs < cached["n_runs"]:
+            run_id, best_value = self._search(experiment, metric, mode)
+        elif (
+            n_runs > cached["n_runs"]
+            or last_modification > cached["last_modification"]
+        ):
+            run_id, best_value = self._update(
+                experiment,
+                cached,
+                get_changed_runs(
+                    experiment_dir,
+                    cached["last_modification"],
+                    cached.get("last_runs", []),
+                ),
+            )
+        else:
+            return cached["run_id"]
+
+        cache[key] = {
+            "run_id": run_id,
+            "value": best_value,
+            "n_runs": n_runs,
+            "last_modification": last_modification,
+            "last_runs": get_last_runs(experiment_dir, last_modification),
+            "metric": metric,
+            "mode": mode,
+        }
+        self._write_cache(cache)
+        logger.info(f"Best run id is : {run_id} ({metric} = {best_value})")
+
+        return run_id
+
+    def _search(self, experiment: str, metric: str, mode: str) -> Tuple[str, float]:
+        order = "ASC" if mode == "min" else "DESC"
+        best_runs = get_sorted_runs(
+            experiment_name=experiment,
+            order_by=[f"metrics.{metric} {order}"],
+            top_k=1,
+            filter_string="attributes.status = 'FINISHED'",
+            columns=[f"metrics.{metric}"],
+        )
+        if best_runs.empty:
+            raise ValueError(f"No finished run in the experiment {experiment}.")
+        best_run = best_runs.iloc[0]
+
+        return best_run["run_id"], float(best_run[f"metrics.{metric}"])
+
+    def _update(
+        self, experiment: str, cached: Dict[str, Any], changed_runs: List[str]
+    ) -> Tuple[str, float]:
+        sign = 1 if cached["mode"] == "min" else -1
+        run_id, best_value = cached["run_id"], cached["value"]
+        if run_id in changed_runs:
+            # the file store soft-deletes a run by rewriting its meta.yaml
+            best_run = self.client.get_run(run_id)
+            if (
+                best_run.info.lifecycle_stage != "active"
+                or best_run.info.status != "FINISHED"
+            ):
+                return self._search(experiment, cached["metric"], cached["mode"])
+
+        for changed_run in changed_runs:
+            run = self.client.get_run(changed_run)
+            run_value = run.data.metrics.get(cached["metric"])
+            if (
+                run.info.lifecycle_stage != "active"
+                or run.info.status != "FINISHED"
+                or run_value is None
+            ):
+                continue
+            if sign * run_value < sign * best_value:
+                run_id, best_value = changed_run, run_value
+
+        return run_id, best_value
+
+    def _read_cache(self) -> Dict[str, Any]:
+        if not self.cache_path.is_file():
+            return {}
+        return json.loads(self.cache_path.read_text())
+
+    def _write_cache(self, cache: Dict[str, Any]) -> None:
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_path.write_text(json.dumps(cache, indent=2))
+
+
+@lru_cache(maxsize=MODELS_LRU_SIZE)
+def load_run_model(run_id: str) -> tf.keras.Model:
+    """Load the model of a run, the loaded models are kept in memory.
+
+    The first time a run is loaded, its `.h5` artifact is exported as a SavedModel
+    in the local cache. The next processes load this SavedModel directly.
+
+    Args:
+        run_id (str): ID of the run.
 
-    print(
-        all_runs[
-            [
-                "run_id",
-                "tags.mlflow.runName",
-                "metrics.val_categorical_accuracy",
-                "metrics.val_loss",
-            ]
-        ],
-    )
+    Returns:
+        The model of the run.
+    """
+    saved_model_dir = CACHE_DIR / "models" / run_id
+    if saved_model_dir.is_dir():
+        logger.info(f"Loading cached SavedModel from {saved_model_dir}")
+        return load_model(str(saved_model_dir), compile=False)
+
+    model_path = MlflowClient().download_artifacts(run_id, "model/data/model.h5")
+    model = load_model(model_path, compile=False)
+    logger.info(f"Model loaded from {model_path}")
+
+    # export in a temporary folder first, so that a concurrent process never sees
+    # an incomplete SavedModel. The rename fails if another process has exported
+    # the run in the meantime, its export is then kept.
+    tmp_dir = saved_model_dir.with_name(f"{run_id}.tmp{os.getpid()}")
+    model.save(str(tmp_dir), save_format="tf")
+    try:
+        os.replace(tmp_dir, saved_model_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir)
+        logger.info(f"SavedModel already exported by another process, {run_id}")
+        return load_model(str(saved_model_dir), compile=False)
+    logger.info(f"Model exported as SavedModel in {saved_model_dir}")
 
-    best_run = all_runs.iloc[0]["run_id"]
+    return model
 
-    logger.info(f"Best run id is : {best_run}")
 
-    # Load model
-    run = mlflow.get_run(run_id=best_run)
-    homedir = Path(run.info.artifact_uri).parent.parent.parent.parent
+resolver = BestRunResolver()
 
-    root = Path(run.info.artifact_uri).relative_to(homedir)
-    model_url = Path(root) / Path("model/data") / "model.h5"
 
-    model = load_model(model_url)
-    logger.info(f"Model loaded from {run.info}")
+def load_model_artifact() -> tf.keras.Model:
+    """Load the model of the best run of the experiment, lowest `val_loss`.
 
-    return model
+    Returns:
+        The model of the best run.
+    """
+    return load_run_model(resolver.resolve(experiment_name))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,361 @@
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import mlflow
+import numpy as np
+import tensorflow as tf
+from loguru import logger
+from tensorflow.core.profiler.protobuf import xplane_pb2
+
+from metric_logger import BufferedMetricLogger
+from utils import get_rss
+
+
+class StepTimer(tf.keras.callbacks.Callback):
+    """Split the wall time of each training step in input wait and compute.
+
+    The training dataset has to be wrapped with `StepTimer.wrap`, which adds a
+    synchronous stamp after the last stage (prefetch) of the `Tensorize` pipeline :
+    the stamp is taken when the train step receives its batch. For each step :
+
+    - input wait is the time between the beginning of the step and the stamp,
+    - compute is the time between the stamp and the end of the step.
+
+    At the end of each epoch, the p50/p95 of these times, the fraction of the time
+    spent waiting for the input, the images/sec and the RSS of the process are
+    logged to the active MLflow run.
+
+    With `steps_per_execution > 1`, only the wait of the first batch of each
+    execution is measured.
+
+    Args:
+        tf.keras.callbacks.Callback (Callback): Keras base callback.
+    """
+
+    def __init__(self) -> None:
+        """Initialization of the callback."""
+        super().__init__()
+        self.stamps: List[float] = []
+        self.batch_sizes: List[int] = []
+        self.step_begin = 0.0
+        self.n_stamps = 0
+        self.step_times: List[float] = []
+        self.input_waits: List[float] = []
+        self.rss: List[int] = []
+
+    def wrap(self, dataset: tf.data.Dataset) -> tf.data.Dataset:
+        """Add the stamp at the end of a dataset of (images, labels) batches.
+
+        Args:
+            dataset (tf.data.Dataset): The training dataset.
+
+        Returns:
+            The same dataset, stamped.
+        """
+
+        def stamp(images: tf.Tensor, labels: tf.Tensor):
+            stamped = tf.py_function(
+                self._record_batch, [tf.shape(images)[0]], tf.float64
+            )
+            with tf.control_dependencies([stamped]):
+                return tf.identity(images), labels
+
+        return dataset.map(stamp)
+
+    def _record_batch(self, batch_size: tf.Tensor) -> float:
+        now = time.perf_counter()
+        self.stamps.append(now)
+        self.batch_sizes.append(int(batch_size))
+        return now
+
+    def on_epoch_begin(
+        self, epoch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Reset the measures.
+
+        Args:
+            epoch (int): Index of the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        self.stamps.clear()
+        self.batch_sizes.clear()
+        self.step_times.clear()
+        self.input_waits.clear()
+        self.rss.clear()
+
+    def on_train_batch_begin(
+        self, batch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Start the timer of the step.
+
+        Args:
+            batch (int): Index of the step in the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        self.step_begin = time.perf_counter()
+        self.n_stamps = len(self.stamps)
+
+    def on_train_batch_end(
+        self, batch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Stop the timer of the step.
+
+        Args:
+            batch (int): Index of the step in the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        step_end = time.perf_counter()
+        self.step_times.append(step_end - self.step_begin)
+        if len(self.stamps) > self.n_stamps:
+            self.input_waits.append(self.stamps[self.n_stamps] - self.step_begin)
+        self.rss.append(get_rss())
+
+    def on_epoch_end(
+        self, epoch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Log the aggregated measures of the epoch to the active MLflow run.
+
+        Args:
+            epoch (int): Index of the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        if mlflow.active_run() is not None:
+            mlflow.log_metrics(self.summary(), step=epoch)
+
+    def summary(self) -> Dict[str, float]:
+        """Aggregate the measures of the current epoch.
+
+        Returns:
+            The aggregated measures, times are in milliseconds.
+        """
+        if not self.step_times:
+            return {}
+
+        step_times = np.array(self.step_times)
+        input_waits = np.clip(np.array(self.input_waits or [0.0]), 0, None)
+
+        return {
+            "step_time_p50_ms": float(np.percentile(step_times, 50) * 1000),
+            "step_time_p95_ms": float(np.percentile(step_times, 95) * 1000),
+            "input_wait_p50_ms": float(np.percentile(input_waits, 50) * 1000),
+            "input_wait_p95_ms": float(np.percentile(input_waits, 95) * 1000),
+            "input_bound_fraction": float(input_waits.sum() / step_times.sum()),
+            "images_per_sec": float(sum(self.batch_sizes) / step_times.sum()),
+            "rss_max_mb": max(self.rss) / 2 ** 20,
+        }
+
+
+class BufferedMetrics(tf.keras.callbacks.Callback):
+    """Log the Keras metrics to MLflow through a `BufferedMetricLogger`.
+
+    Replaces the metrics logging of `mlflow.tensorflow.autolog` : the epoch metrics
+    are logged with the epoch as step, like autolog does, and the buffer is flushed
+    at the end of each epoch.
+
+    Args:
+        tf.keras.callbacks.Callback (Callback): Keras base callback.
+    """
+
+    def __init__(
+        self, metric_logger: BufferedMetricLogger, every_n_steps: int = 0
+    ) -> None:
+        """Initialization of the callback.
+
+        Args:
+            metric_logger (BufferedMetricLogger): Logger of the MLflow run.
+            every_n_steps (int, optional): Also log the batch metrics, prefixed by
+                "batch_", every n training steps. 0 to disable. Defaults to 0.
+        """
+        super().__init__()
+        self.metric_logger = metric_logger
+        self.every_n_steps = every_n_steps
+        self.global_step = 0
+
+    def on_train_batch_end(
+        self, batch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Buffer the batch metrics, every `every_n_steps` steps.
+
+        Args:
+            batch (int): Index of the step in the epoch.
+            logs (Optional[Dict[str, float]], optional): Metrics of the batch.
+                Defaults to None.
+        """
+        self.global_step += 1
+        if self.every_n_steps and self.global_step % self.every_n_steps == 0:
+            self.metric_logger.log_metrics(
+                {f"batch_{key}": log_value for key, log_value in (logs or {}).items()},
+                step=self.global_step,
+            )
+
+    def on_epoch_end(
+        self, epoch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Buffer the epoch metrics and flush the buffer.
+
+        Args:
+            epoch (int): Index of the epoch.
+            logs (Optional[Dict[str, float]], optional): Metrics of the epoch.
+                Defaults to None.
+        """
+        self.metric_logger.log_metrics(logs or {}, step=epoch)
+        self.metric_logger.flush()
+
+
+def get_self_times(xplane_path: Path) -> Dict[str, float]:
+    """Compute the self-time of every op of a profiler trace.
+
+    The events of each thread (XLine) of the trace are nested, the self-time of
+    an event is its duration minus the duration of the events it directly
+    contains. Events are grouped by name, the op type for TensorFlow ops
+    ("name:type") and the iterator name for tf.data.
+
+    Args:
+        xplane_path (Path): `.xplane.pb` file written by the profiler.
+
+    Returns:
+        A dictionnary op -> total self-time in milliseconds.
+    """
+    xspace = xplane_pb2.XSpace()
+    xspace.ParseFromString(xplane_path.read_bytes())
+
+    self_times: Dict[str, float] = defaultdict(float)
+    for plane in xspace.planes:
+        for line in plane.lines:
+            # open events, as [name, end, self-time], in picoseconds
+            stack: List[List[Any]] = []
+            for event in sorted(line.events, key=lambda event: event.offset_ps):
+                while stack and stack[-1][1] <= event.offset_ps:
+                    name, _, self_ps = stack.pop()
+                    self_times[name] += self_ps / 1e9
+                if stack:
+                    stack[-1][2] -= event.duration_ps
+                name = plane.event_metadata[event.metadata_id].name
+                if "::" not in name:
+                    name = name.split(":")[-1]
+                end = event.offset_ps + event.duration_ps
+                stack.append([name, end, event.duration_ps])
+            for name, _, self_ps in stack:
+                self_times[name] += self_ps / 1e9
+
+    return dict(self_times)
+
+
+def summarize_trace(logdir: Path, top_k: int = 20) -> str:
+    """Give the top ops by self-time of the traces found in `logdir`.
+
+    Args:
+        logdir (Path): Log directory given to the profiler.
+        top_k (int, optional): Number of ops in the summary. Defaults to 20.
+
+    Returns:
+        The summary, one op per line.
+    """
+    self_times: Dict[str, float] = defaultdict(float)
+    for xplane_path in logdir.glob("**/*.xplane.pb"):
+        for name, self_time in get_self_times(xplane_path).items():
+            self_times[name] += self_time
+
+    total = sum(self_times.values()) or 1.0
+    top_ops = sorted(self_times.items(), key=lambda op: op[1], reverse=True)[:top_k]
+    lines = [f"{'op':<50} {'self-time (ms)':>15} {'%':>6}"]
+    lines.extend(
+        f"{name[:50]:<50} {self_time:>15.3f} {100 * self_time / total:>6.2f}"
+        for name, self_time in top_ops
+    )
+    return "\n".join(lines)
+
+
+class ProfilerWindow(tf.keras.callbacks.Callback):
+    """Capture a TensorFlow profiler trace for a window of training steps.
+
+    The trace, which includes the host ops and the tf.data iterators, and a short
+    summary of the top ops by self-time are saved as artifacts of the active
+    MLflow run, in the `profile` folder.
+
+    Args:
+        tf.keras.callbacks.Callback (Callback): Keras base callback.
+    """
+
+    def __init__(self, epoch: int, start_step: int, stop_step: int) -> None:
+        """Initialization of the callback.
+
+        Args:
+            epoch (int): Epoch to profile, starting from 1.
+            start_step (int): First profiled step of the epoch, starting from 0.
+            stop_step (int): Step where the profiling stops (excluded).
+        """
+        super().__init__()
+        self.epoch = epoch - 1
+        self.start_step = start_step
+        self.stop_step = stop_step
+        self.current_epoch = -1
+        self.logdir = Path(tempfile.mkdtemp(prefix="profile_"))
+        self.profiling = False
+
+    def on_epoch_begin(
+        self, epoch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Keep track of the current epoch.
+
+        Args:
+            epoch (int): Index of the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        self.current_epoch = epoch
+
+    def on_train_batch_begin(
+        self, batch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Start the profiler at the first step of the window.
+
+        Args:
+            batch (int): Index of the step in the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        if self.current_epoch == self.epoch and batch == self.start_step:
+            logger.info(f"Profiling steps {self.start_step} to {self.stop_step}")
+            options = tf.profiler.experimental.ProfilerOptions(
+                host_tracer_level=2, python_tracer_level=0, device_tracer_level=1
+            )
+            tf.profiler.experimental.start(str(self.logdir), options=options)
+            self.profiling = True
+
+    def on_train_batch_end(
+        self, batch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Stop the profiler after the last step of the window.
+
+        Args:
+            batch (int): Index of the step in the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        if self.profiling and batch + 1 >= self.stop_step:
+            self.stop()
+
+    def on_epoch_end(
+        self, epoch: int, logs: Optional[Dict[str, float]] = None
+    ) -> None:
+        """Stop the profiler if the epoch is shorter than the window.
+
+        Args:
+            epoch (int): Index of the epoch.
+            logs (Optional[Dict[str, float]], optional): Unused. Defaults to None.
+        """
+        if self.profiling:
+            self.stop()
+
+    def stop(self) -> None:
+        """Stop the profiler and save the trace and its summary to MLflow."""
+        tf.profiler.experimental.stop()
+        self.profiling = False
+
+        summary = summarize_trace(self.logdir)
+        logger.info(f"Top ops by self-time :\n{summary}")
+        (self.logdir / "profile_summary.txt").write_text(summary)
+
+        if mlflow.active_run() is not None:
+            mlflow.log_artifacts(str(self.logdir), artifact_path="profile")
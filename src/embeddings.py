@@ -0,0 +1,452 @@
+from pathlib import Path
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import typer
+import yaml
+from loguru import logger
+
+from predict import list_images, load_inference_model
+from tensorize import Tensorize
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+
+EMBEDDINGS_DIR = Path("models/embeddings")
+POOLING_LAYERS = {"GlobalAvgPool2D", "GlobalAveragePooling2D"}
+# Rows of the embeddings matrix loaded at once by the exact search.
+SEARCH_BLOCK = 65536
+
+app = typer.Typer()
+
+
+def get_embedding_model(model: tf.keras.Model) -> tf.keras.Model:
+    """Cut a classifier at its last global average pooling layer.
+
+    Args:
+        model (tf.keras.Model): Classifier, ResNet or Wide ResNet.
+
+    Raises:
+        ValueError: The model has no global average pooling layer.
+
+    Returns:
+        The model giving the embeddings of the images.
+    """
+    pooling = [
+        layer for layer in model.layers if layer.__class__.__name__ in POOLING_LAYERS
+    ]
+    if not pooling:
+        raise ValueError(f"No global average pooling layer in {model.name}.")
+    return tf.keras.Model(model.inputs, pooling[-1].output)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Normalize vectors to unit length, so that dot products are cosines.
+
+    Args:
+        vectors (np.ndarray): Vectors, (N, D).
+
+    Returns:
+        The normalized vectors, as float32.
+    """
+    vectors = vectors.astype(np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def extract_embeddings(
+    embedding_model: tf.keras.Model,
+    ts: Tensorize,
+    filenames: List[str],
+    destination: Path,
+    batch_size: int = 256,
+) -> np.memmap:
+    """Extract the normalized embeddings of images in a float16 memory-mapped file.
+
+    The embeddings are written batch by batch, so only a batch is in memory.
+
+    Args:
+        embedding_model (tf.keras.Model): Model giving the embeddings.
+        ts (Tensorize): Pipeline decoding the images.
+        filenames (List[str]): Paths of the images.
+        destination (Path): `.npy` file of the embeddings.
+        batch_size (int, optional): Batch size. Defaults to 256.
+
+    Returns:
+        The memory-mapped embeddings, (N, D).
+    """
+    embeddings = np.lib.format.open_memmap(
+        destination,
+        mode="w+",
+        dtype=np.float16,
+        shape=(len(filenames), embedding_model.output_shape[-1]),
+    )
+    dataset = ts.create_inference_dataset(filenames, batch_size, prefetch=2)
+    start = 0
+    for images in dataset:
+        batch = normalize(embedding_model.predict_on_batch(images))
+        embeddings[start : start + len(batch)] = batch
+        start += len(batch)
+    embeddings.flush()
+
+    return embeddings
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Give the columns of the k highest scores of each row, best first.
+
+    Args:
+        scores (np.ndarray): Scores, (queries, candidates).
+        k (int): Number of columns to keep.
+
+    Returns:
+        The indexes of the columns, (queries, min(k, candidates)).
+    """
+    k = min(k, scores.shape[1])
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1)
+    return np.take_along_axis(best, order, axis=1)
+
+
+def exact_search(
+    embeddings: np.ndarray, queries: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Find the k most similar embeddings of each query, by cosine similarity.
+
+    The embeddings are read by blocks of SEARCH_BLOCK rows, the top-k of each block
+    are merged with the top-k of the previous blocks.
+
+    Args:
+        embeddings (np.ndarray): Normalized embeddings, (N, D), memory-mapped.
+        queries (np.ndarray): Normalized queries, (Q, D).
+        k (int): Number of neighbours.
+
+    Returns:
+        The indexes and the similarities of the neighbours, (Q, k).
+    """
+    best_indexes = np.zeros((len(queries), 0), dtype=np.int64)
+    best_scores = np.zeros((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(embeddings), SEARCH_BLOCK):
+        block = embeddings[start : start + SEARCH_BLOCK].astype(np.float32)
+        scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+        block_indexes = np.broadcast_to(
+            start + np.arange(len(block)), (len(queries), len(block))
+        )
+        indexes = np.concatenate([best_indexes, block_indexes], axis=1)
+        columns = top_k(scores, k)
+        best_scores = np.take_along_axis(scores, columns, axis=1)
+        best_indexes = np.take_along_axis(indexes, columns, axis=1)
+
+    return best_indexes, best_scores
+
+
+class IVFIndex(object):
+    """Approximate nearest neighbours index, with inverted lists (IVF).
+
+    The embeddings are clustered by a spherical k-means on a sample, and each
+    embedding is stored in the list of its closest centroid. A query is only
+    compared to the embeddings of the lists of its `n_probe` closest centroids,
+    so a search reads about `n_probe / n_lists` of the embeddings.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray
+    ) -> None:
+        """Initialization of the index.
+
+        Args:
+            centroids (np.ndarray): Normalized centroids of the lists, (L, D).
+            order (np.ndarray): Indexes of the embeddings, sorted by list.
+            offsets (np.ndarray): Start of each list in `order`, (L + 1,).
+        """
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+
+    @classmethod
+    def build(
+        cls,
+        embeddings: np.ndarray,
+        n_lists: int,
+        n_iterations: int = 10,
+        sample_size: int = 100000,
+    ) -> "IVFIndex":
+        """Cluster the embeddings and fill the inverted lists.
+
+        Args:
+            embeddings (np.ndarray): Normalized embeddings, (N, D), memory-mapped.
+            n_lists (int): Number of lists, about sqrt(N).
+            n_iterations (int, optional): Iterations of the k-means. Defaults to 10.
+            sample_size (int, optional): Embeddings used by the k-means. Defaults
+                to 100000.
+
+        Returns:
+            The index.
+        """
+        rng = np.random.default_rng(random_seed)
+        sample_indexes = np.sort(
+            rng.choice(len(embeddings), min(sample_size, len(embeddings)), False)
+        )
+        sample = embeddings[sample_indexes].astype(np.float32)
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+        for _ in range(n_iterations):
+            assignments = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            empty = np.bincount(assignments, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]
+            centroids = normalize(sums)
+
+        assignments = np.concatenate(
+            [
+                (embeddings[start : start + SEARCH_BLOCK] @ centroids.T).argmax(axis=1)
+                for start in range(0, len(embeddings), SEARCH_BLOCK)
+            ]
+        )
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.concatenate(
+            [[0], np.bincount(assignments, minlength=n_lists).cumsum()]
+        )
+        return cls(centroids, order, offsets)
+
+    def search(
+        self, embeddings: np.ndarray, queries: np.ndarray, k: int, n_probe: int = 8
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the approximate k most similar embeddings of each query.
+
+        Args:
+            embeddings (np.ndarray): Normalized embeddings, (N, D), memory-mapped.
+            queries (np.ndarray): Normalized queries, (Q, D).
+            k (int): Number of neighbours.
+            n_probe (int, optional): Number of lists searched. Defaults to 8.
+
+        Returns:
+            The indexes and the similarities of the neighbours, (Q, k). Missing
+            neighbours have an index of -1.
+        """
+        probes = top_k(queries @ self.centroids.T, n_probe)
+        indexes = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for query_idx, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.sort(
+                np.concatenate(
+                    [
+                        self.order[self.offsets[idx] : self.offsets[idx + 1]]
+                        for idx in lists
+                    ]
+                )
+            )
+            if not len(candidates):
+                continue
+            scores = embeddings[candidates].astype(np.float32) @ query
+            best = top_k(scores[np.newaxis], k)[0]
+            indexes[query_idx, : len(best)] = candidates[best]
+            similarities[query_idx, : len(best)] = scores[best]
+
+        return indexes, similarities
+
+    def save(self, destination: Path) -> None:
+        """Save the index as a `.npz` file.
+
+        Args:
+            destination (Path): Path of the file.
+        """
+        np.savez(
+            destination,
+            centroids=self.centroids,
+            order=self.order,
+            offsets=self.offsets,
+        )
+
+    @classmethod
+    def load(cls, path: Path) -> "IVFIndex":
+        """Load an index saved by `save`.
+
+        Args:
+            path (Path): Path of the file.
+
+        Returns:
+            The index.
+        """
+        arrays = np.load(path)
+        return cls(arrays["centroids"], arrays["order"], arrays["offsets"])
+
+
+class SimilaritySearcher(object):
+    """Search the patches similar to an image, for a query API.
+
+    The embedding model, the memory-mapped embeddings, their filenames and the
+    IVF index are loaded once, so a search only embeds the query and reads the
+    probed lists of the index.
+
+    Usage:
+    ```python
+    searcher = SimilaritySearcher.load(EMBEDDINGS_DIR, approximate=True)
+    similar_patches = searcher.search(Path("patch.jpg"), k=10)
+    ```
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        filenames: np.ndarray,
+        embedding_model: Optional[tf.keras.Model] = None,
+        index: Optional[IVFIndex] = None,
+        n_probe: int = 8,
+    ) -> None:
+        """Initialization of the searcher.
+
+        Args:
+            embeddings (np.ndarray): Normalized embeddings, (N, D), memory-mapped.
+            filenames (np.ndarray): Paths of the images of the embeddings, (N,).
+            embedding_model (Optional[tf.keras.Model], optional): Model giving the
+                embeddings, None to only search vectors. Defaults to None.
+            index (Optional[IVFIndex], optional): Index of the embeddings, None for
+                an exact search. Defaults to None.
+            n_probe (int, optional): Lists searched by the index. Defaults to 8.
+        """
+        self.embeddings = embeddings
+        self.filenames = filenames
+        self.embedding_model = embedding_model
+        self.index = index
+        self.n_probe = n_probe
+        self.ts = None
+        if embedding_model is not None:
+            self.ts = Tensorize(
+                n_classes, embedding_model.input_shape[1:], random_seed
+            )
+
+    @classmethod
+    def load(
+        cls,
+        embeddings_dir: Path,
+        model: str = "best",
+        approximate: bool = False,
+        n_probe: int = 8,
+    ) -> "SimilaritySearcher":
+        """Load the files written by `extract` and `build`, and the model.
+
+        Args:
+            embeddings_dir (Path): Embeddings folder.
+            model (str, optional): Model path, MLflow run ID, or best. Defaults to
+                "best".
+            approximate (bool, optional): Use the IVF index. Defaults to False.
+            n_probe (int, optional): Lists searched by the index. Defaults to 8.
+
+        Returns:
+            The searcher.
+        """
+        embeddings = np.load(embeddings_dir / "embeddings.npy", mmap_mode="r")
+        filenames = pd.read_csv(embeddings_dir / "filenames.csv")[
+            "filename"
+        ].to_numpy()
+        index = IVFIndex.load(embeddings_dir / "ivf_index.npz") if approximate else None
+        embedding_model = get_embedding_model(load_inference_model(model))
+        return cls(embeddings, filenames, embedding_model, index, n_probe)
+
+    def search(
+        self, query: Union[Path, np.ndarray], k: int = 10
+    ) -> List[Tuple[str, float]]:
+        """Find the patches most similar to an image, or to an embedding.
+
+        Args:
+            query (Union[Path, np.ndarray]): Path of a JPEG image, or embedding of
+                the image, (D,).
+            k (int, optional): Number of similar patches. Defaults to 10.
+
+        Raises:
+            ValueError: An image is searched without embedding model.
+
+        Returns:
+            The filenames and the similarities of the patches, most similar first.
+        """
+        if isinstance(query, np.ndarray):
+            vector = query[np.newaxis]
+        elif self.embedding_model is None or self.ts is None:
+            raise ValueError("No embedding model, only embeddings can be searched.")
+        else:
+            vector = self.embedding_model.predict_on_batch(
+                self.ts.parse_image(str(query))[tf.newaxis]
+            )
+        queries = normalize(np.asarray(vector))
+
+        if self.index is None:
+            indexes, similarities = exact_search(self.embeddings, queries, k)
+        else:
+            indexes, similarities = self.index.search(
+                self.embeddings, queries, k, self.n_probe
+            )
+        return [
+            (str(self.filenames[idx]), float(similarity))
+            for idx, similarity in zip(indexes[0], similarities[0])
+            if idx >= 0
+        ]
+
+
+@app.command()
+def extract(
+    source: Path = typer.Argument(..., help="Images folder, or csv manifest."),
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    output_dir: Path = typer.Option(EMBEDDINGS_DIR, help="Output folder."),
+    batch_size: int = typer.Option(256, help="Batch size."),
+) -> None:
+    """Extract the embeddings of a folder, or a manifest, of images."""
+    filenames = list_images(source)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"filename": filenames}).to_csv(
+        output_dir / "filenames.csv", index=False
+    )
+    embedding_model = get_embedding_model(load_inference_model(model))
+    ts = Tensorize(n_classes, embedding_model.input_shape[1:], random_seed)
+    extract_embeddings(
+        embedding_model, ts, filenames, output_dir / "embeddings.npy", batch_size
+    )
+    logger.info(f"Embeddings of {len(filenames)} images saved in {output_dir}")
+
+
+@app.command()
+def build(
+    output_dir: Path = typer.Option(EMBEDDINGS_DIR, help="Embeddings folder."),
+    n_lists: int = typer.Option(0, help="Number of lists, 0 for sqrt(N)."),
+) -> None:
+    """Build the approximate index of the extracted embeddings."""
+    embeddings = np.load(output_dir / "embeddings.npy", mmap_mode="r")
+    n_lists = n_lists or int(np.sqrt(len(embeddings)))
+    IVFIndex.build(embeddings, n_lists).save(output_dir / "ivf_index.npz")
+    logger.info(f"Index of {n_lists} lists saved in {output_dir}")
+
+
+@app.command()
+def query(
+    image_path: Path = typer.Argument(..., help="Patch to search."),
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    output_dir: Path = typer.Option(EMBEDDINGS_DIR, help="Embeddings folder."),
+    k: int = typer.Option(10, help="Number of similar patches."),
+    approximate: bool = typer.Option(False, help="Use the IVF index."),
+    n_probe: int = typer.Option(8, help="Lists searched by the IVF index."),
+) -> None:
+    """Print the most similar patches of the extracted images."""
+    searcher = SimilaritySearcher.load(output_dir, model, approximate, n_probe)
+    for filename, similarity in searcher.search(image_path, k):
+        typer.echo(f"{similarity:.4f} {filename}")
+
+
+if __name__ == "__main__":
+    app()
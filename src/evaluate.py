@@ -0,0 +1,306 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import typer
+import yaml
+from loguru import logger
+
+from predict import (
+    get_class_index,
+    get_class_names,
+    get_model_id,
+    load_inference_model,
+    predict_shard,
+)
+from prediction_cache import PredictionCache
+from tensorize import Tensorize
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+with open("configs/evaluate/evaluate.yaml") as evaluate_params:
+    evaluate_config = yaml.safe_load(evaluate_params)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+output_dir = Path(evaluate_config["output_dir"])
+
+# Rows of the test manifest, and of the predictions csv, read at once.
+CHUNK_SIZE = 10000
+
+app = typer.Typer()
+
+
+def classify(
+    probabilities: np.ndarray, crack_class: int, threshold: Optional[float]
+) -> np.ndarray:
+    """Give the predicted class of each image.
+
+    Args:
+        probabilities (np.ndarray): Probabilities of the classes, (N, classes).
+        crack_class (int): Index of the crack class.
+        threshold (Optional[float]): An image is a crack if the probability of the
+            crack class is above it, otherwise it is the most probable other class.
+            None to predict the most probable class.
+
+    Returns:
+        The predicted classes.
+    """
+    if threshold is None:
+        return probabilities.argmax(axis=1)
+    others = probabilities.copy()
+    others[:, crack_class] = -np.inf
+    return np.where(
+        probabilities[:, crack_class] >= threshold, crack_class, others.argmax(axis=1)
+    )
+
+
+def encode_labels(labels: pd.Series, class_names: List[str]) -> np.ndarray:
+    """Give the index of the class of each label.
+
+    Args:
+        labels (pd.Series): Names of the true classes of the images.
+        class_names (List[str]): Names of the classes, in the order of the model
+            outputs.
+
+    Raises:
+        ValueError: Some labels are not a class of the model.
+
+    Returns:
+        The indexes of the classes.
+    """
+    labels = labels.astype(str)
+    unknown_labels = set(labels.unique()) - set(class_names)
+    if unknown_labels:
+        raise ValueError(
+            f"Unknown labels {sorted(unknown_labels)}, the classes are {class_names}."
+        )
+    label_indexes = {name: idx for idx, name in enumerate(class_names)}
+    return labels.map(label_indexes).to_numpy()
+
+
+class StreamingMetrics(object):
+    """Classification metrics accumulated batch by batch, with a bounded memory.
+
+    The confusion matrix is updated with each batch, and the scores of each class
+    are accumulated in histograms of `n_bins` bins, for the positive and the
+    negative images of the class (one-vs-rest). The ROC and PR curves are computed
+    from these histograms, with one point per bin, so the memory doesn't depend on
+    the number of images.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        class_names: List[str],
+        crack_class: int,
+        threshold: Optional[float] = None,
+        n_bins: int = 1000,
+    ) -> None:
+        """Initialization of the metrics.
+
+        Args:
+            class_names (List[str]): Names of the classes.
+            crack_class (int): Index of the crack class.
+            threshold (Optional[float], optional): Threshold of the crack class,
+                see `classify`. Defaults to None.
+            n_bins (int, optional): Number of score bins. Defaults to 1000.
+        """
+        self.class_names = class_names
+        self.crack_class = crack_class
+        self.threshold = threshold
+        self.n_bins = n_bins
+        n_classes = len(class_names)
+        self.confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+        self.positives = np.zeros((n_classes, n_bins), dtype=np.int64)
+        self.negatives = np.zeros((n_classes, n_bins), dtype=np.int64)
+
+    def update(self, labels: np.ndarray, probabilities: np.ndarray) -> None:
+        """Add a batch of predictions.
+
+        Args:
+            labels (np.ndarray): True classes of the images.
+            probabilities (np.ndarray): Probabilities of the classes, (N, classes).
+        """
+        n_classes = len(self.class_names)
+        predicted = classify(probabilities, self.crack_class, self.threshold)
+        self.confusion += np.bincount(
+            labels * n_classes + predicted, minlength=n_classes ** 2
+        ).reshape(n_classes, n_classes)
+
+        bins = np.clip((probabilities * self.n_bins).astype(int), 0, self.n_bins - 1)
+        for class_idx in range(n_classes):
+            is_class = labels == class_idx
+            self.positives[class_idx] += np.bincount(
+                bins[is_class, class_idx], minlength=self.n_bins
+            )
+            self.negatives[class_idx] += np.bincount(
+                bins[~is_class, class_idx], minlength=self.n_bins
+            )
+
+    def curves(self, class_idx: int) -> pd.DataFrame:
+        """Give the ROC and PR curves of a class, one-vs-rest.
+
+        Args:
+            class_idx (int): Index of the class.
+
+        Returns:
+            The threshold, fpr, tpr (recall) and precision at each bin edge, by
+            decreasing threshold.
+        """
+        true_positives = self.positives[class_idx][::-1].cumsum()
+        false_positives = self.negatives[class_idx][::-1].cumsum()
+        n_positives = max(true_positives[-1], 1)
+        n_negatives = max(false_positives[-1], 1)
+        predicted_positives = true_positives + false_positives
+        # the precision is 1 above the highest score, where nothing is predicted
+        precision = np.where(
+            predicted_positives > 0,
+            true_positives / np.maximum(predicted_positives, 1),
+            1,
+        )
+
+        return pd.DataFrame(
+            {
+                "threshold": np.arange(self.n_bins - 1, -1, -1) / self.n_bins,
+                "fpr": false_positives / n_negatives,
+                "tpr": true_positives / n_positives,
+                "precision": precision,
+            }
+        )
+
+    def summary(self) -> Dict[str, float]:
+        """Aggregate the metrics of all the batches.
+
+        Returns:
+            The accuracy, and the precision, recall, f1-score, ROC AUC and PR AUC of
+            each class.
+        """
+        true_positives = np.diag(self.confusion)
+        precisions = true_positives / np.maximum(self.confusion.sum(axis=0), 1)
+        recalls = true_positives / np.maximum(self.confusion.sum(axis=1), 1)
+        f1_scores = 2 * precisions * recalls / np.maximum(precisions + recalls, 1e-12)
+
+        metrics = {
+            "accuracy": float(true_positives.sum() / max(self.confusion.sum(), 1)),
+            "n_images": int(self.confusion.sum()),
+        }
+        for class_idx, name in enumerate(self.class_names):
+            curves = self.curves(class_idx)
+            fpr = np.concatenate([[0], curves["fpr"]])
+            tpr = np.concatenate([[0], curves["tpr"]])
+            precision = np.concatenate([[1], curves["precision"]])
+            metrics.update(
+                {
+                    f"{name}_precision": float(precisions[class_idx]),
+                    f"{name}_recall": float(recalls[class_idx]),
+                    f"{name}_f1": float(f1_scores[class_idx]),
+                    f"{name}_roc_auc": float(np.trapz(tpr, fpr)),
+                    f"{name}_pr_auc": float(np.trapz(precision, tpr)),
+                }
+            )
+        return metrics
+
+
+@app.command()
+def predict(
+    manifest: Path = typer.Option(
+        Path(datasets_config["prepared_dataset"]["test"]), help="Test manifest."
+    ),
+    model: str = typer.Option(evaluate_config["model"], help="Model to evaluate."),
+    use_cache: bool = typer.Option(True, help="Reuse the cached predictions."),
+) -> None:
+    """Predict the test manifest and save the per-image predictions.
+
+    The manifest is streamed through the inference pipeline, and the predictions
+    are appended to `predictions.csv` chunk by chunk. Images already predicted by
+    the same model are read from the prediction cache.
+    """
+    class_names = get_class_names()
+    inference_model = load_inference_model(model)
+    ts = Tensorize(n_classes, inference_model.input_shape[1:], random_seed)
+    cache = PredictionCache() if use_cache else None
+    model_id = get_model_id(model)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    destination = output_dir / "predictions.csv"
+    probability_columns = [f"prob_{name}" for name in class_names]
+    header = ["filename", "label", "prediction", *probability_columns]
+    pd.DataFrame(columns=header).to_csv(destination, index=False)
+
+    for chunk in pd.read_csv(
+        manifest, usecols=["filename", "label"], chunksize=CHUNK_SIZE
+    ):
+        predictions = predict_shard(
+            inference_model,
+            ts,
+            chunk["filename"].tolist(),
+            class_names,
+            evaluate_config["batch_size"],
+            evaluate_config["prefetch"],
+            cache,
+            model_id,
+        )
+        output = pd.DataFrame(
+            {
+                "filename": chunk["filename"].to_numpy(),
+                "label": chunk["label"].to_numpy(),
+                "prediction": predictions["prediction"].to_numpy(),
+            }
+        )
+        output[probability_columns] = predictions[probability_columns].to_numpy()
+        output[header].to_csv(destination, mode="a", header=False, index=False)
+
+    logger.info(f"Predictions saved in {destination}")
+
+
+@app.command()
+def report(
+    threshold: float = typer.Option(
+        evaluate_config["threshold"], help="Crack probability threshold."
+    ),
+) -> None:
+    """Compute the metrics, ROC and PR curves from the saved predictions.
+
+    The model is not run again, so changing the threshold only costs a read of
+    `predictions.csv`.
+    """
+    class_names = get_class_names()
+    crack_class = get_class_index(class_names, evaluate_config["crack_label"])
+    metrics = StreamingMetrics(
+        class_names, crack_class, threshold, evaluate_config["n_bins"]
+    )
+    probability_columns = [f"prob_{name}" for name in class_names]
+
+    for chunk in pd.read_csv(output_dir / "predictions.csv", chunksize=CHUNK_SIZE):
+        metrics.update(
+            encode_labels(chunk["label"], class_names),
+            chunk[probability_columns].to_numpy(),
+        )
+
+    summary = metrics.summary()
+    logger.info(f"Metrics : {summary}")
+    (output_dir / "metrics.json").write_text(json.dumps(summary, indent=2))
+
+    curves = metrics.curves(crack_class)
+    curves[["threshold", "fpr", "tpr"]].to_csv(output_dir / "roc.csv", index=False)
+    curves.rename(columns={"tpr": "recall"})[
+        ["threshold", "recall", "precision"]
+    ].to_csv(output_dir / "pr.csv", index=False)
+    pd.DataFrame(metrics.confusion, index=class_names, columns=class_names).to_csv(
+        output_dir / "confusion_matrix.csv"
+    )
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,115 @@
+from pathlib import Path
+from typing import Dict, List
+
+import tensorflow as tf
+import typer
+import yaml
+from loguru import logger
+
+from predict import get_class_names, get_model_id, load_inference_model
+from tensorize import Tensorize
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+
+# Images decoded in parallel by the serving signature.
+PARALLEL_DECODES = 16
+
+app = typer.Typer()
+
+
+class ServingModule(tf.Module):
+    """Classifier taking a batch of encoded JPEG images.
+
+    The decoding, the conversion to float and the resizing of
+    `Tensorize.parse_image` are done in the graph, so a client only sends the
+    bytes of the images.
+
+    Args:
+        tf.Module (Module): TensorFlow base module.
+    """
+
+    def __init__(
+        self, model: tf.keras.Model, ts: Tensorize, class_names: List[str]
+    ) -> None:
+        """Initialization of the module.
+
+        Args:
+            model (tf.keras.Model): Trained classifier.
+            ts (Tensorize): Pipeline giving the preprocessing of the images.
+            class_names (List[str]): Names of the classes, in the order of the
+                model outputs.
+        """
+        super().__init__()
+        self.model = model
+        self.ts = ts
+        self.label_names = tf.constant(class_names)
+
+    @tf.function(input_signature=[tf.TensorSpec([None], tf.string, name="images")])
+    def serve(self, images: tf.Tensor) -> Dict[str, tf.Tensor]:
+        """Predict a batch of encoded JPEG images.
+
+        Args:
+            images (tf.Tensor): Bytes of the JPEG images, shape (N,).
+
+        Returns:
+            The probabilities of the classes, the predicted label of each image, and
+            the names of the classes.
+        """
+        decoded = tf.map_fn(
+            self.ts.decode_image,
+            images,
+            fn_output_signature=tf.TensorSpec(self.ts.img_shape, tf.float32),
+            parallel_iterations=PARALLEL_DECODES,
+        )
+        probabilities = self.model(decoded, training=False)
+        return {
+            "probabilities": probabilities,
+            "labels": tf.gather(self.label_names, tf.argmax(probabilities, axis=1)),
+            "label_names": self.label_names,
+        }
+
+
+def export(
+    model: tf.keras.Model, ts: Tensorize, class_names: List[str], destination: Path
+) -> None:
+    """Export a classifier as a SavedModel taking encoded JPEG images.
+
+    Args:
+        model (tf.keras.Model): Trained classifier.
+        ts (Tensorize): Pipeline giving the preprocessing of the images.
+        class_names (List[str]): Names of the classes.
+        destination (Path): Folder of the SavedModel.
+    """
+    module = ServingModule(model, ts, class_names)
+    tf.saved_model.save(
+        module, str(destination), signatures={"serving_default": module.serve}
+    )
+    logger.info(f"SavedModel exported in {destination}")
+
+
+@app.command()
+def main(
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    output_dir: Path = typer.Option(Path("models/export"), help="Output folder."),
+) -> None:
+    """Export a trained model with in-graph JPEG decoding.
+
+    The SavedModel is written in `output_dir/<model ID>`, its `serving_default`
+    signature takes a batch of JPEG strings.
+    """
+    model_id = get_model_id(model)
+    destination = output_dir / Path(model_id.split("@")[0]).stem
+    inference_model = load_inference_model(model)
+    ts = Tensorize(n_classes, inference_model.input_shape[1:], random_seed)
+    export(inference_model, ts, get_class_names(), destination)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,277 @@
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import typer
+from loguru import logger
+
+from predict import get_class_index, get_class_names, load_inference_model
+
+app = typer.Typer()
+
+
+def extract_tiles(strip: tf.Tensor, tile_size: int, stride: int) -> tf.Tensor:
+    """Extract all the tiles of a strip of image, without a loop over the tiles.
+
+    Args:
+        strip (tf.Tensor): Strip of image, format is (H,W,C).
+        tile_size (int): Side of the square tiles, in pixels.
+        stride (int): Distance between two tiles, in pixels.
+
+    Returns:
+        The tiles, format is (rows, columns, tile_size, tile_size, C).
+    """
+    patches = tf.image.extract_patches(
+        strip[tf.newaxis],
+        sizes=[1, tile_size, tile_size, 1],
+        strides=[1, stride, stride, 1],
+        rates=[1, 1, 1, 1],
+        padding="VALID",
+    )[0]
+    rows, columns = tf.shape(patches)[0], tf.shape(patches)[1]
+    return tf.reshape(patches, [rows, columns, tile_size, tile_size, -1])
+
+
+def box_sum(grid: np.ndarray, size: int) -> np.ndarray:
+    """Sum each value of a grid over the `size` x `size` cells below and right of it.
+
+    This is the "full" 2D convolution of the grid with a square of ones, computed
+    with cumulative sums.
+
+    Args:
+        grid (np.ndarray): 2D grid.
+        size (int): Side of the square.
+
+    Returns:
+        Grid of shape `grid.shape + size - 1`.
+    """
+    padded = np.pad(grid, size)
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    summed = (
+        integral[size:, size:]
+        - integral[:-size, size:]
+        - integral[size:, :-size]
+        + integral[:-size, :-size]
+    )
+    return summed[: grid.shape[0] + size - 1, : grid.shape[1] + size - 1]
+
+
+def stitch(tile_probabilities: np.ndarray, tile_size: int, stride: int) -> np.ndarray:
+    """Stitch the probabilities of overlapping tiles in a heatmap.
+
+    The heatmap has a cell per `stride` x `stride` pixels, the value of a cell is
+    the mean probability of the tiles covering it.
+
+    Args:
+        tile_probabilities (np.ndarray): Probabilities of the tiles, as a
+            (rows, columns) grid.
+        tile_size (int): Side of the tiles, in pixels.
+        stride (int): Distance between two tiles, in pixels.
+
+    Returns:
+        The heatmap.
+    """
+    cells_per_tile = -(-tile_size // stride)
+    sums = box_sum(tile_probabilities, cells_per_tile)
+    counts = box_sum(np.ones_like(tile_probabilities), cells_per_tile)
+    return sums / counts
+
+
+def get_regions(
+    heatmap: np.ndarray, threshold: float, cell_size: int
+) -> List[Dict[str, float]]:
+    """Give the bounding boxes of the connected regions above a threshold.
+
+    Args:
+        heatmap (np.ndarray): Heatmap of the crack probabilities.
+        threshold (float): Minimum probability of a crack cell.
+        cell_size (int): Side of a cell of the heatmap, in pixels.
+
+    Returns:
+        The regions, with their bounding box in pixels and their maximum
+        probability.
+    """
+    mask = heatmap > threshold
+    visited = np.zeros_like(mask)
+    regions = []
+    for start in zip(*np.nonzero(mask)):
+        if visited[start]:
+            continue
+        visited[start] = True
+        queue = deque([start])
+        cells = []
+        while queue:
+            row, col = queue.popleft()
+            cells.append((row, col))
+            for neighbour in (
+                (row - 1, col),
+                (row + 1, col),
+                (row, col - 1),
+                (row, col + 1),
+            ):
+                inside = all(
+                    0 <= index < size for index, size in zip(neighbour, mask.shape)
+                )
+                if inside and mask[neighbour] and not visited[neighbour]:
+                    visited[neighbour] = True
+                    queue.append(neighbour)
+        rows, cols = np.array(cells).T
+        regions.append(
+            {
+                "x_min": int(cols.min() * cell_size),
+                "y_min": int(rows.min() * cell_size),
+                "x_max": int((cols.max() + 1) * cell_size),
+                "y_max": int((rows.max() + 1) * cell_size),
+                "max_probability": float(heatmap[rows, cols].max()),
+            }
+        )
+    return regions
+
+
+def predict_tiles(
+    model: tf.keras.Model,
+    image_path: Path,
+    tile_size: int,
+    stride: int,
+    crack_class: int,
+    rows_per_strip: int = 8,
+    batch_size: int = 128,
+) -> np.ndarray:
+    """Predict the crack probability of every tile of a large JPEG image.
+
+    The image is decoded strip by strip, a strip holding `rows_per_strip` rows of
+    tiles, so only a strip is in memory. The tiles of a strip are resized to the
+    input shape of the model and predicted in batches.
+
+    Args:
+        model (tf.keras.Model): Patch classifier.
+        image_path (Path): Path of the JPEG image.
+        tile_size (int): Side of the tiles, in pixels of the image.
+        stride (int): Distance between two tiles, in pixels.
+        crack_class (int): Index of the crack class in the model outputs.
+        rows_per_strip (int, optional): Rows of tiles decoded at once. Defaults to 8.
+        batch_size (int, optional): Tiles per model call. Defaults to 128.
+
+    Raises:
+        ValueError: The image is smaller than a tile.
+
+    Returns:
+        The probabilities of the tiles, as a (rows, columns) grid.
+    """
+    contents = tf.io.read_file(str(image_path))
+    height, width, _ = tf.image.extract_jpeg_shape(contents).numpy()
+    if min(height, width) < tile_size:
+        raise ValueError(f"Image of {height}x{width} smaller than {tile_size} tiles.")
+
+    n_rows = (height - tile_size) // stride + 1
+    n_columns = (width - tile_size) // stride + 1
+    used_width = (n_columns - 1) * stride + tile_size
+    img_shape = model.input_shape[1:]
+    model_size = [img_shape[0], img_shape[1]]
+
+    strips = []
+    for first_row in range(0, n_rows, rows_per_strip):
+        strip_rows = min(rows_per_strip, n_rows - first_row)
+        strip_height = (strip_rows - 1) * stride + tile_size
+        strip = tf.image.decode_and_crop_jpeg(
+            contents,
+            [first_row * stride, 0, strip_height, used_width],
+            channels=img_shape[2],
+        )
+        strip = tf.image.convert_image_dtype(strip, tf.float32)
+        tiles = extract_tiles(strip, tile_size, stride)
+        tiles = tf.reshape(tiles, [-1, tile_size, tile_size, img_shape[2]])
+        if tile_size != img_shape[0] or tile_size != img_shape[1]:
+            tiles = tf.image.resize(tiles, model_size)
+        probabilities = model.predict(tiles, batch_size=batch_size)
+        strips.append(probabilities[:, crack_class].reshape(strip_rows, n_columns))
+        logger.info(f"Rows {first_row + strip_rows}/{n_rows} of tiles predicted")
+
+    return np.concatenate(strips)
+
+
+def save_heatmap(heatmap: np.ndarray, destination: Path) -> None:
+    """Save the heatmap as a grayscale png, white for a probability of 1.
+
+    Args:
+        heatmap (np.ndarray): The heatmap.
+        destination (Path): Path of the png file.
+    """
+    pixels = np.round(heatmap * 255).astype(np.uint8)[..., np.newaxis]
+    tf.io.write_file(str(destination), tf.io.encode_png(pixels))
+
+
+def get_heatmap(
+    model: tf.keras.Model,
+    image_path: Path,
+    tile_size: int,
+    stride: int,
+    crack_class: int,
+    threshold: float = 0.5,
+    rows_per_strip: int = 8,
+) -> Tuple[np.ndarray, List[Dict[str, float]]]:
+    """Compute the crack heatmap and the crack regions of a large image.
+
+    Args:
+        model (tf.keras.Model): Patch classifier.
+        image_path (Path): Path of the JPEG image.
+        tile_size (int): Side of the tiles, in pixels of the image.
+        stride (int): Distance between two tiles, in pixels.
+        crack_class (int): Index of the crack class in the model outputs.
+        threshold (float, optional): Minimum probability of a crack region.
+            Defaults to 0.5.
+        rows_per_strip (int, optional): Rows of tiles decoded at once. Defaults to 8.
+
+    Returns:
+        The heatmap, a cell per `stride` pixels, and the crack regions.
+    """
+    tile_probabilities = predict_tiles(
+        model, image_path, tile_size, stride, crack_class, rows_per_strip
+    )
+    heatmap = stitch(tile_probabilities, tile_size, stride)
+    return heatmap, get_regions(heatmap, threshold, stride)
+
+
+@app.command()
+def main(
+    image_path: Path = typer.Argument(..., help="Full-size JPEG image."),
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    tile_size: int = typer.Option(0, help="Side of the tiles, 0 for the model's."),
+    stride: int = typer.Option(0, help="Stride of the tiles, 0 for half a tile."),
+    threshold: float = typer.Option(0.5, help="Crack probability threshold."),
+    rows_per_strip: int = typer.Option(8, help="Rows of tiles decoded at once."),
+    crack_label: str = typer.Option("Positive", help="Name of the crack class."),
+    output_dir: Path = typer.Option(Path("heatmaps"), help="Output folder."),
+) -> None:
+    """Compute the crack heatmap and the crack regions of a full-size image.
+
+    The heatmap is saved as `.npy` and `.png`, and the regions as csv.
+    """
+    crack_class = get_class_index(get_class_names(), crack_label)
+    inference_model = load_inference_model(model)
+    tile_size = tile_size or inference_model.input_shape[1]
+    stride = stride or tile_size // 2
+    heatmap, regions = get_heatmap(
+        inference_model,
+        image_path,
+        tile_size,
+        stride,
+        crack_class,
+        threshold,
+        rows_per_strip,
+    )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    np.save(output_dir / f"{image_path.stem}_heatmap.npy", heatmap)
+    save_heatmap(heatmap, output_dir / f"{image_path.stem}_heatmap.png")
+    pd.DataFrame(
+        regions, columns=["x_min", "y_min", "x_max", "y_max", "max_probability"]
+    ).to_csv(output_dir / f"{image_path.stem}_regions.csv", index=False)
+    logger.info(f"{len(regions)} crack regions found, saved in {output_dir}")
+
+
+if __name__ == "__main__":
+    app()
@@ -7,7 +7,7 @@ from typing import List, Optional, Tuple
 import typer
 import yaml
 from loguru import logger
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import StratifiedKFold, train_test_split
 
 from utils import set_seed
 
@@ -21,9 +21,11 @@ raw_dataset_address = address["raw_dataset"]
 train_dataset_address = address["prepared_dataset"]["train"]
 val_dataset_address = address["prepared_dataset"]["val"]
 test_dataset_address = address["prepared_dataset"]["test"]
+folds_dataset_address = address["prepared_dataset"]["folds"]
 
 random_seed = config["seed"]
 split = config["split"]
+n_folds = config["n_folds"]
 
 app = typer.Typer()
 
@@ -123,13 +125,20 @@ def get_images_paths_and_labels(
     return images, labels
 
 
-def save_as_csv(filenames: List[Path], labels: List[str], destination: Path) -> None:
+def save_as_csv(
+    filenames: List[Path],
+    labels: List[str],
+    destination: Path,
+    folds: Optional[List[int]] = None,
+) -> None:
     """Save two lists of observations, labels as a csv files.
 
     Args:
         filenames (List[str]): Liste des adresses des images, première colonne.
         labels (List[str]): Liste des labels correspondants, seconde colonne.
         destination (Path): adresse du dossier où est sauvegardé le csv.
+        folds (Optional[List[int]], optional): Fold de validation croisée de chaque
+            image, troisième colonne si donnée. Defaults to None.
     """
     labels_distribution = Counter(labels)
 
@@ -137,10 +146,33 @@ def save_as_csv(filenames: List[Path], labels: List[str], destination: Path) ->
     logger.info(f"Labels distribution {labels_distribution}.")
 
     header = ["filename", "label"]
+    rows = zip(filenames, labels)
+    if folds is not None:
+        header.append("fold")
+        rows = zip(filenames, labels, folds)  # type: ignore
     with open(destination, "w", newline="") as saved_csv:
         writer = csv.writer(saved_csv, delimiter=",")
         writer.writerow(header)
-        writer.writerows(zip(filenames, labels))
+        writer.writerows(rows)
+
+
+def assign_folds(labels: List[str], folds: Optional[int] = n_folds) -> List[int]:
+    """Assign each observation to a fold of a stratified k-fold cross-validation.
+
+    Args:
+        labels (List[str]): Labels of the observations.
+        folds (Optional[int], optional): Number of folds. Defaults to n_folds.
+
+    Returns:
+        The fold of each observation, from 0 to `folds - 1`, each fold having the
+        same distribution of labels.
+    """
+    assignments = [0] * len(labels)
+    kfold = StratifiedKFold(n_splits=folds, shuffle=True, random_state=random_seed)
+    for fold, (_, fold_indexes) in enumerate(kfold.split(labels, labels)):
+        for idx in fold_indexes:
+            assignments[idx] = fold
+    return assignments
 
 
 observations_list = List[Path]
@@ -233,6 +265,11 @@ def main() -> None:
     save_as_csv(datasets_components[2], datasets_components[3], val_dataset_address)
     save_as_csv(datasets_components[4], datasets_components[5], test_dataset_address)
 
+    # the cross-validation uses the train and val images, the test ones are kept
+    cv_images = [*datasets_components[0], *datasets_components[2]]
+    cv_labels = [*datasets_components[1], *datasets_components[3]]
+    save_as_csv(cv_images, cv_labels, folds_dataset_address, assign_folds(cv_labels))
+
 
 if __name__ == "__main__":
     app()
@@ -0,0 +1,161 @@
+import atexit
+import threading
+import time
+from typing import Dict, List, Optional
+
+import tensorflow as tf
+from loguru import logger
+from mlflow.entities import Metric, Param
+from mlflow.tracking import MlflowClient
+from tensorflow.keras import backend
+from tensorflow.keras.optimizers.schedules import LearningRateSchedule
+
+# Maximum number of metrics in a single `log_batch` call of MLflow.
+MAX_METRICS_PER_BATCH = 1000
+
+
+class BufferedMetricLogger(object):
+    """Log MLflow metrics asynchronously, in batches.
+
+    `log_metrics` only appends the metrics to an in-memory buffer. A background
+    thread sends the buffer to the tracking store with a single `log_batch` call
+    every `flush_interval` seconds, instead of writing the files of the `mlruns`
+    store at every call. The buffer is also flushed by `flush` (at each epoch end
+    for example), when the logger is closed, and at the exit of the interpreter.
+
+    Usage:
+    ```python
+    with BufferedMetricLogger(run.info.run_id, flush_interval=30) as metric_logger:
+        metric_logger.log_metrics({"loss": 0.1}, step=1)
+    ```
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        run_id: str,
+        flush_interval: float = 30,
+        client: Optional[MlflowClient] = None,
+    ) -> None:
+        """Initialization of the logger, starts the background thread.
+
+        Args:
+            run_id (str): ID of the MLflow run the metrics are logged to.
+            flush_interval (float, optional): Seconds between two flushes of the
+                background thread. Defaults to 30.
+            client (Optional[MlflowClient], optional): Client of the tracking store.
+                Defaults to the client of the current tracking URI.
+        """
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        self.client = client or MlflowClient()
+        self.buffer: List[Metric] = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def log_metrics(self, metrics: Dict[str, float], step: int) -> None:
+        """Add metrics to the buffer.
+
+        Args:
+            metrics (Dict[str, float]): Names and values of the metrics.
+            step (int): Step of the metrics.
+        """
+        timestamp = int(time.time() * 1000)
+        new_metrics = [
+            Metric(key, float(metric_value), timestamp, step)
+            for key, metric_value in metrics.items()
+        ]
+        with self.lock:
+            self.buffer.extend(new_metrics)
+
+    def log_fit_params(
+        self, model: tf.keras.Model, epochs: int, batch_size: int
+    ) -> None:
+        """Log the parameters and the summary of a compiled model, right away.
+
+        These are the parameters mlflow autolog logs, which is disabled when the
+        metrics are buffered.
+
+        Args:
+            model (tf.keras.Model): Compiled model.
+            epochs (int): Number of epochs of the training.
+            batch_size (int): Batch size of the training.
+        """
+        # the LossScaleOptimizer of mixed precision wraps the optimizer
+        optimizer = getattr(model.optimizer, "inner_optimizer", model.optimizer)
+        params = {
+            "epochs": epochs,
+            "batch_size": batch_size,
+            "optimizer_name": optimizer.__class__.__name__,
+        }
+        learning_rate = optimizer.learning_rate
+        if isinstance(learning_rate, LearningRateSchedule):
+            params["opt_learning_rate"] = learning_rate.__class__.__name__
+        else:
+            params["opt_learning_rate"] = float(backend.get_value(learning_rate))
+        logged = [Param(key, str(param)) for key, param in params.items()]
+        self.client.log_batch(self.run_id, params=logged)
+
+        summary: List[str] = []
+        model.summary(print_fn=summary.append)
+        self.client.log_text(self.run_id, "\n".join(summary), "model_summary.txt")
+
+    def flush(self) -> None:
+        """Send all the buffered metrics to the tracking store.
+
+        If the tracking store fails, the metrics which have not been sent are put
+        back in the buffer before raising.
+        """
+        with self.flush_lock:
+            with self.lock:
+                metrics, self.buffer = self.buffer, []
+            while metrics:
+                try:
+                    self.client.log_batch(
+                        self.run_id, metrics=metrics[:MAX_METRICS_PER_BATCH]
+                    )
+                except Exception:
+                    with self.lock:
+                        self.buffer = metrics + self.buffer
+                    raise
+                metrics = metrics[MAX_METRICS_PER_BATCH:]
+
+    def close(self) -> None:
+        """Stop the background thread and flush the remaining metrics."""
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        self.thread.join()
+        self.flush()
+        atexit.unregister(self.close)
+
+    def __enter__(self) -> "BufferedMetricLogger":
+        """Use the logger as a context manager.
+
+        Returns:
+            The logger itself.
+        """
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        """Close the logger, even if an exception has been raised.
+
+        Args:
+            exc_info ([type]): Unused exception infos.
+        """
+        self.close()
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as error:
+                logger.warning(f"MLflow metrics flush failed : {error}")
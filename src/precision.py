@@ -0,0 +1,110 @@
+from pathlib import Path
+from typing import Set
+
+import tensorflow as tf
+from loguru import logger
+
+# Name of the config in `configs/precision` -> name of the Keras policy.
+KERAS_POLICIES = {
+    "float32": "float32",
+    "bfloat16": "mixed_bfloat16",
+    "mixed_float16": "mixed_float16",
+}
+# CPU flags of /proc/cpuinfo meaning a native bfloat16 support.
+BF16_CPU_FLAGS = {"avx512_bf16", "amx_bf16"}
+# Minimal CUDA compute capability with Tensor Cores.
+MIN_FLOAT16_CAPABILITY = (7, 0)
+
+
+def get_cpu_flags(cpuinfo: Path = Path("/proc/cpuinfo")) -> Set[str]:
+    """Read the instruction set extensions supported by the CPU.
+
+    Args:
+        cpuinfo (Path, optional): File describing the CPU. Defaults to
+            Path("/proc/cpuinfo").
+
+    Returns:
+        The set of CPU flags, empty if the file can't be read (non Linux OS).
+    """
+    try:
+        lines = cpuinfo.read_text().splitlines()
+    except OSError:
+        return set()
+
+    for line in lines:
+        if line.startswith("flags"):
+            return set(line.split(":", 1)[1].split())
+    return set()
+
+
+def detect_policy() -> str:
+    """Choose the fastest precision policy for the available hardware.
+
+    - A GPU with Tensor Cores (compute capability >= 7.0) uses `mixed_float16`.
+    - A CPU with native bfloat16 instructions (AVX512-BF16, AMX) uses
+      `mixed_bfloat16`.
+    - Otherwise `float32`, as float16 is emulated, and slower, on CPU.
+
+    Returns:
+        The name of the Keras policy.
+    """
+    gpus = tf.config.list_physical_devices("GPU")
+    if gpus:
+        details = tf.config.experimental.get_device_details(gpus[0])
+        capability = details.get("compute_capability", MIN_FLOAT16_CAPABILITY)
+        if capability >= MIN_FLOAT16_CAPABILITY:
+            return "mixed_float16"
+        return "float32"
+
+    if get_cpu_flags() & BF16_CPU_FLAGS:
+        return "mixed_bfloat16"
+    return "float32"
+
+
+def set_precision_policy(name: str) -> tf.keras.mixed_precision.Policy:
+    """Set the global Keras precision policy.
+
+    Args:
+        name (str): One of "float32", "bfloat16", "mixed_float16" or "auto".
+
+    Raises:
+        ValueError: Unknown precision name.
+
+    Returns:
+        The policy which has been set.
+    """
+    if name == "auto":
+        policy_name = detect_policy()
+    elif name in KERAS_POLICIES:
+        policy_name = KERAS_POLICIES[name]
+    else:
+        raise ValueError(f"Unknown precision {name}, use one of {KERAS_POLICIES}.")
+
+    policy = tf.keras.mixed_precision.Policy(policy_name)
+    tf.keras.mixed_precision.set_global_policy(policy)
+
+    logger.info(f"Precision policy : {policy.name} (asked {name})")
+    logger.info(f"Compute dtype : {policy.compute_dtype}")
+    logger.info(f"Variable dtype : {policy.variable_dtype}")
+
+    return policy
+
+
+def wrap_optimizer(
+    optimizer: tf.keras.optimizers.Optimizer, policy: tf.keras.mixed_precision.Policy
+) -> tf.keras.optimizers.Optimizer:
+    """Add dynamic loss scaling to the optimizer, only when it is needed.
+
+    float16 gradients can underflow, so `mixed_float16` needs loss scaling.
+    bfloat16 has the same exponent range than float32 and doesn't.
+
+    Args:
+        optimizer (tf.keras.optimizers.Optimizer): The optimizer to wrap.
+        policy (tf.keras.mixed_precision.Policy): The global precision policy.
+
+    Returns:
+        The optimizer, wrapped in a `LossScaleOptimizer` if needed.
+    """
+    if policy.compute_dtype == "float16":
+        return tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    return optimizer
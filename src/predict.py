@@ -0,0 +1,344 @@
+import csv
+import itertools
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+import typer
+import yaml
+from loguru import logger
+from tensorflow.keras.models import load_model
+
+from best_run import experiment_name, load_model_artifact, load_run_model, resolver
+from prediction_cache import PredictionCache, get_preprocessing_key, predict_with_cache
+from tensorize import Tensorize
+from utils import set_threads
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".JPG", ".JPEG"}
+
+app = typer.Typer()
+
+
+def load_inference_model(model: str) -> tf.keras.Model:
+    """Load a model from a path, a MLflow run ID, or the best run of the experiment.
+
+    Args:
+        model (str): Path of a `.h5` model or of a SavedModel, ID of a MLflow run,
+            or "best" for the best run of the experiment.
+
+    Returns:
+        The model.
+    """
+    if Path(model).exists():
+        logger.info(f"Loading model from {model}")
+        return load_model(model, compile=False)
+    if model == "best":
+        return load_model_artifact()
+    return load_run_model(model)
+
+
+def get_model_id(model: str) -> str:
+    """Give a stable ID of a model, used as key of the prediction cache.
+
+    Args:
+        model (str): Path of a model, ID of a MLflow run, or "best".
+
+    Returns:
+        The MLflow run ID, or the path and the modification time of the model.
+    """
+    if Path(model).exists():
+        path = Path(model).resolve()
+        return f"{path}@{path.stat().st_mtime}"
+    if model == "best":
+        return resolver.resolve(experiment_name)
+    return model
+
+
+def get_class_names() -> List[str]:
+    """Give the names of the classes, in the order of the model outputs.
+
+    The labels are encoded in alphabetical order by `Tensorize.load_labels`, so
+    the names are read from the prepared training set, if it exists.
+
+    Returns:
+        The names of the classes.
+    """
+    train_csv = Path(datasets_config["prepared_dataset"]["train"])
+    if train_csv.is_file():
+        return sorted(pd.read_csv(train_csv, usecols=["label"])["label"].unique())
+    return [str(idx) for idx in range(n_classes)]
+
+
+def get_class_index(class_names: List[str], name: str) -> int:
+    """Give the index of a class in the model outputs.
+
+    Args:
+        class_names (List[str]): Names of the classes, as given by
+            `get_class_names`.
+        name (str): Name of the class.
+
+    Raises:
+        ValueError: The class is not one of the classes of the model.
+
+    Returns:
+        The index of the class.
+    """
+    if name not in class_names:
+        raise ValueError(f"Unknown class {name}, use one of {class_names}.")
+    return class_names.index(name)
+
+
+def iter_images(source: Path, chunk_size: int = 100000) -> Iterator[str]:
+    """Iterate over the images of a directory tree, or of a manifest.
+
+    The paths are never all held in memory: the directories are walked depth
+    first, each one listed in alphabetical order, its images before its
+    subdirectories, and the manifest is read `chunk_size` rows at a time.
+
+    Args:
+        source (Path): Directory, searched recursively, or csv file with a
+            "filename" column.
+        chunk_size (int, optional): Rows of the manifest read at once.
+            Defaults to 100000.
+
+    Yields:
+        The paths of the images.
+    """
+    if not source.is_dir():
+        for chunk in pd.read_csv(source, usecols=["filename"], chunksize=chunk_size):
+            yield from chunk["filename"].tolist()
+        return
+
+    directories = [str(source)]
+    while directories:
+        with os.scandir(directories.pop()) as scanned:
+            entries = sorted(scanned, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir():
+                subdirectories.append(entry.path)
+            elif os.path.splitext(entry.name)[1] in IMAGE_EXTENSIONS:
+                yield entry.path
+        directories.extend(reversed(subdirectories))
+
+
+def list_images(source: Path) -> List[str]:
+    """List the images of a directory tree, or of a manifest.
+
+    Args:
+        source (Path): Directory, searched recursively, or csv file with a
+            "filename" column.
+
+    Returns:
+        The paths of the images, in the order of `iter_images`.
+    """
+    return list(iter_images(source))
+
+
+def get_shards(filenames: Iterable[str], shard_size: int) -> Iterator[List[str]]:
+    """Split the images in shards of consecutive images.
+
+    Only the current shard is held in memory if `filenames` is an iterator.
+
+    Args:
+        filenames (Iterable[str]): Paths of the images.
+        shard_size (int): Number of images per shard.
+
+    Yields:
+        The paths of the images of each shard.
+    """
+    iterator = iter(filenames)
+    shard = list(itertools.islice(iterator, shard_size))
+    while shard:
+        yield shard
+        shard = list(itertools.islice(iterator, shard_size))
+
+
+def snapshot_listing(
+    source: Path, output_dir: Path, shard_size: int
+) -> Tuple[Path, int]:
+    """Save the listing of the images on the first run, and reuse it on resume.
+
+    A shard holds consecutive images of the listing, so if images were added to,
+    or removed from, the source between a stopped run and its resume, a new
+    listing would shift the shards which are not written yet. The listing is thus
+    written once in `output_dir`, and `listing.json` is written after it.
+
+    Args:
+        source (Path): Images folder, or csv manifest.
+        output_dir (Path): Folder of the shards.
+        shard_size (int): Number of images per shard.
+
+    Raises:
+        ValueError: The shards were written with another shard size, or without a
+            listing.
+
+    Returns:
+        The path of the listing, a manifest of the images, and its number of images.
+    """
+    listing = output_dir / "listing.csv"
+    infos_path = output_dir / "listing.json"
+    if infos_path.exists():
+        infos = json.loads(infos_path.read_text())
+        if infos["shard_size"] != shard_size:
+            raise ValueError(
+                f"The shards of {output_dir} hold {infos['shard_size']} images, "
+                + f"not {shard_size}."
+            )
+        logger.info(f"Resuming from {listing}, new images of {source} are ignored")
+        return listing, infos["n_images"]
+    if any(output_dir.glob("part-*")):
+        raise ValueError(f"Shards in {output_dir} without a listing, can't resume.")
+
+    n_images = 0
+    tmp_listing = listing.with_name(f"{listing.name}.tmp")
+    with open(tmp_listing, "w", newline="") as listing_csv:
+        writer = csv.writer(listing_csv)
+        writer.writerow(["filename"])
+        for filename in iter_images(source):
+            writer.writerow([filename])
+            n_images += 1
+    os.replace(tmp_listing, listing)
+    infos_path.write_text(
+        json.dumps(
+            {"source": str(source), "shard_size": shard_size, "n_images": n_images}
+        )
+    )
+    return listing, n_images
+
+
+def predict_shard(
+    model: tf.keras.Model,
+    ts: Tensorize,
+    filenames: List[str],
+    class_names: List[str],
+    batch_size: int,
+    prefetch: int,
+    cache: Optional[PredictionCache] = None,
+    model_id: str = "",
+) -> pd.DataFrame:
+    """Predict the classes of the images of a shard.
+
+    Args:
+        model (tf.keras.Model): The model.
+        ts (Tensorize): Pipeline decoding the images.
+        filenames (List[str]): Paths of the images of the shard.
+        class_names (List[str]): Names of the classes.
+        batch_size (int): Batch size.
+        prefetch (int): Number of batches prepared in advance.
+        cache (Optional[PredictionCache], optional): Cache of the predictions, only
+            the images missing from it are decoded and predicted. Defaults to None.
+        model_id (str, optional): ID of the model in the cache. Defaults to "".
+
+    Returns:
+        A dataframe with the filename, the predicted class and the probability of
+        each class.
+    """
+
+    def predict_fn(files: List[str]) -> np.ndarray:
+        return model.predict(ts.create_inference_dataset(files, batch_size, prefetch))
+
+    if cache is None:
+        probabilities = predict_fn(filenames)
+    else:
+        probabilities = predict_with_cache(
+            cache, filenames, model_id, get_preprocessing_key(ts.img_shape), predict_fn
+        )
+
+    predictions = pd.DataFrame(
+        probabilities, columns=[f"prob_{name}" for name in class_names]
+    )
+    predictions.insert(0, "filename", filenames)
+    predictions.insert(
+        1, "prediction", np.array(class_names)[probabilities.argmax(axis=1)]
+    )
+    return predictions
+
+
+def write_shard(predictions: pd.DataFrame, destination: Path) -> None:
+    """Write the predictions of a shard as csv or Parquet.
+
+    The file is written under a temporary name and then renamed, so that a shard
+    file only exists once it is complete.
+
+    Args:
+        predictions (pd.DataFrame): Predictions of the shard.
+        destination (Path): Path of the shard file, `.csv` or `.parquet`.
+    """
+    tmp_file = destination.with_name(f"{destination.name}.tmp")
+    if destination.suffix == ".parquet":
+        predictions.to_parquet(tmp_file, index=False)
+    else:
+        predictions.to_csv(tmp_file, index=False)
+    os.replace(tmp_file, destination)
+
+
+@app.command()
+def main(
+    source: Path = typer.Argument(..., help="Images folder, or csv manifest."),
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    output_dir: Path = typer.Option(Path("predictions"), help="Output folder."),
+    output_format: str = typer.Option("csv", help="csv or parquet."),
+    shard_size: int = typer.Option(10000, help="Number of images per shard."),
+    batch_size: int = typer.Option(128, help="Batch size."),
+    prefetch: int = typer.Option(2, help="Number of batches prepared in advance."),
+    n_threads: int = typer.Option(0, help="TensorFlow threads, 0 for all cores."),
+    use_cache: bool = typer.Option(True, help="Reuse the cached predictions."),
+    cache_size_mb: float = typer.Option(1024, help="Size of the prediction cache."),
+) -> None:
+    """Predict the classes of a folder, or a manifest, of images.
+
+    Predictions are written shard by shard in `output_dir`, as `part-<idx>` files,
+    so only one shard is held in memory. The shards already written are skipped,
+    so a stopped job resumes from its last completed shard, on the images listed
+    by its first run. Images already predicted by the same model are read from
+    the prediction cache.
+    """
+    set_threads(intra_op=n_threads, inter_op=0, cpus=[])
+    output_dir.mkdir(parents=True, exist_ok=True)
+    listing, n_images = snapshot_listing(source, output_dir, shard_size)
+    n_shards = -(-n_images // shard_size)
+    logger.info(f"{n_images} images found, {n_shards} shards")
+
+    class_names = get_class_names()
+    inference_model = load_inference_model(model)
+    ts = Tensorize(
+        n_classes, inference_model.input_shape[1:], random_seed, n_threads=n_threads
+    )
+    cache = PredictionCache(max_size_mb=cache_size_mb) if use_cache else None
+    model_id = get_model_id(model)
+
+    for idx, shard in enumerate(get_shards(iter_images(listing), shard_size)):
+        destination = output_dir / f"part-{idx:05d}.{output_format}"
+        if destination.exists():
+            logger.info(f"Shard {idx} already done, skipped")
+            continue
+        predictions = predict_shard(
+            inference_model,
+            ts,
+            shard,
+            class_names,
+            batch_size,
+            prefetch,
+            cache,
+            model_id,
+        )
+        write_shard(predictions, destination)
+        logger.info(f"Shard {idx + 1}/{n_shards} written in {destination}")
+
+
+if __name__ == "__main__":
+    app()
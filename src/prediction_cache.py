@@ -0,0 +1,257 @@
+import hashlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from loguru import logger
+
+CACHE_PATH = Path("models/cache/predictions.sqlite")
+
+# Maximum number of variables of a SQLite query.
+MAX_VARIABLES = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    image_hash TEXT,
+    model_id TEXT,
+    preprocessing TEXT,
+    probabilities BLOB,
+    size INTEGER,
+    last_access REAL,
+    PRIMARY KEY (image_hash, model_id, preprocessing)
+);
+CREATE INDEX IF NOT EXISTS predictions_access ON predictions (last_access);
+"""
+
+
+def hash_file(filename: str) -> str:
+    """Hash the content of a file.
+
+    Args:
+        filename (str): Path of the file.
+
+    Returns:
+        The hexadecimal digest of the content.
+    """
+    with open(filename, "rb") as image:
+        return hashlib.blake2b(image.read(), digest_size=16).hexdigest()
+
+
+def hash_files(filenames: Sequence[str], n_workers: int = 8) -> List[str]:
+    """Hash the content of files, reading them in parallel.
+
+    Args:
+        filenames (Sequence[str]): Paths of the files.
+        n_workers (int, optional): Number of reading threads. Defaults to 8.
+
+    Returns:
+        The digests, in the order of the files.
+    """
+    with ThreadPoolExecutor(n_workers) as executor:
+        return list(executor.map(hash_file, filenames, chunksize=64))
+
+
+def get_preprocessing_key(img_shape: Sequence[int]) -> str:
+    """Hash the preprocessing configuration of the images.
+
+    Args:
+        img_shape (Sequence[int]): Shape of the images given to the model.
+
+    Returns:
+        The hexadecimal digest of the configuration.
+    """
+    config = {"img_shape": list(img_shape), "decode": "jpeg", "resize": "bilinear"}
+    return hashlib.blake2b(
+        json.dumps(config, sort_keys=True).encode(), digest_size=8
+    ).hexdigest()
+
+
+class PredictionCache(object):
+    """Persistent cache of the predictions, keyed by image content and model.
+
+    A prediction is stored for an (image content hash, model ID, preprocessing
+    hash) key in a SQLite database, so an image is only predicted again if its
+    content, the model or the preprocessing changed, whatever its path. Lookups
+    and inserts are batched. When the stored predictions exceed `max_size_mb`,
+    the least recently used ones are evicted.
+
+    Usage:
+    ```python
+    cache = PredictionCache(max_size_mb=1024)
+    probabilities = predict_with_cache(cache, filenames, run_id, key, predict_fn)
+    ```
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, path: Path = CACHE_PATH, max_size_mb: float = 1024) -> None:
+        """Initialization of the cache.
+
+        Args:
+            path (Path, optional): SQLite file of the cache. Defaults to CACHE_PATH.
+            max_size_mb (float, optional): Maximum size of the stored predictions,
+                in MB. Defaults to 1024.
+        """
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(path))
+        self.connection.executescript(SCHEMA)
+        self.max_size = int(max_size_mb * 2 ** 20)
+        self.size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM predictions"
+        ).fetchone()[0]
+
+    def get_many(
+        self, image_hashes: Sequence[str], model_id: str, preprocessing: str
+    ) -> Dict[str, np.ndarray]:
+        """Look up the predictions of a batch of images.
+
+        Args:
+            image_hashes (Sequence[str]): Content hashes of the images.
+            model_id (str): ID of the model.
+            preprocessing (str): Hash of the preprocessing.
+
+        Returns:
+            The cached probabilities, by image hash. Misses are left out.
+        """
+        unique_hashes = list(set(image_hashes))
+        found: Dict[str, np.ndarray] = {}
+        for start in range(0, len(unique_hashes), MAX_VARIABLES):
+            chunk = unique_hashes[start : start + MAX_VARIABLES]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = self.connection.execute(
+                f"""
+                SELECT image_hash, probabilities FROM predictions
+                WHERE model_id = ? AND preprocessing = ?
+                AND image_hash IN ({placeholders})
+                """,
+                [model_id, preprocessing, *chunk],
+            ).fetchall()
+            found.update(
+                (image_hash, np.frombuffer(probabilities, dtype=np.float32))
+                for image_hash, probabilities in rows
+            )
+
+        with self.connection:
+            self.connection.executemany(
+                """
+                UPDATE predictions SET last_access = ?
+                WHERE image_hash = ? AND model_id = ? AND preprocessing = ?
+                """,
+                [
+                    (time.time(), image_hash, model_id, preprocessing)
+                    for image_hash in found
+                ],
+            )
+        return found
+
+    def put_many(
+        self,
+        image_hashes: Sequence[str],
+        model_id: str,
+        preprocessing: str,
+        probabilities: np.ndarray,
+    ) -> None:
+        """Store the predictions of a batch of images, then evict if needed.
+
+        Args:
+            image_hashes (Sequence[str]): Content hashes of the images.
+            model_id (str): ID of the model.
+            preprocessing (str): Hash of the preprocessing.
+            probabilities (np.ndarray): Probabilities of the images, (N, classes).
+        """
+        blobs = [row.tobytes() for row in probabilities.astype(np.float32)]
+        now = time.time()
+        with self.connection:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO predictions VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (image_hash, model_id, preprocessing, blob, len(blob), now)
+                    for image_hash, blob in zip(image_hashes, blobs)
+                ],
+            )
+            # all the predictions of a model have the same size
+            n_inserted = self.connection.total_changes - before
+            self.size += n_inserted * (len(blobs[0]) if blobs else 0)
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used predictions, down to 90% of the size."""
+        target = int(self.max_size * 0.9)
+        with self.connection:
+            while self.size > target:
+                mean_size = self.size / max(len(self), 1)
+                n_rows = max(int((self.size - target) / mean_size), 1)
+                self.connection.execute(
+                    """
+                    DELETE FROM predictions WHERE rowid IN
+                    (SELECT rowid FROM predictions ORDER BY last_access, rowid LIMIT ?)
+                    """,
+                    (n_rows,),
+                )
+                self.size = self.connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM predictions"
+                ).fetchone()[0]
+        logger.info(f"Prediction cache evicted down to {self.size / 2 ** 20:.1f} MB")
+
+    def __len__(self) -> int:
+        """Give the number of cached predictions.
+
+        Returns:
+            The number of cached predictions.
+        """
+        count = self.connection.execute("SELECT COUNT(*) FROM predictions")
+        return count.fetchone()[0]
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        self.connection.close()
+
+
+def predict_with_cache(
+    cache: PredictionCache,
+    filenames: Sequence[str],
+    model_id: str,
+    preprocessing: str,
+    predict_fn: Callable[[List[str]], np.ndarray],
+) -> np.ndarray:
+    """Predict a batch of images, only running the model on the cache misses.
+
+    The images are hashed before being decoded, only the images missing from the
+    cache go through `predict_fn`, and their predictions are added to the cache.
+
+    Args:
+        cache (PredictionCache): The cache.
+        filenames (Sequence[str]): Paths of the images.
+        model_id (str): ID of the model, the MLflow run ID for example.
+        preprocessing (str): Hash of the preprocessing.
+        predict_fn (Callable[[List[str]], np.ndarray]): Prediction of a list of
+            images, from their paths.
+
+    Returns:
+        The probabilities of the images, (N, classes).
+    """
+    image_hashes = hash_files(filenames)
+    cached = cache.get_many(image_hashes, model_id, preprocessing)
+    misses = [
+        idx for idx, image_hash in enumerate(image_hashes) if image_hash not in cached
+    ]
+    logger.info(f"Prediction cache : {len(cached)} hits, {len(misses)} misses")
+
+    predicted = {}
+    if misses:
+        probabilities = predict_fn([filenames[idx] for idx in misses])
+        miss_hashes = [image_hashes[idx] for idx in misses]
+        cache.put_many(miss_hashes, model_id, preprocessing, probabilities)
+        predicted = dict(zip(miss_hashes, probabilities.astype(np.float32)))
+
+    predicted.update(cached)
+    return np.stack([predicted[image_hash] for image_hash in image_hashes])
@@ -0,0 +1,528 @@
+import csv
+import subprocess
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import hydra
+import numpy as np
+import tensorflow as tf
+import typer
+import yaml
+from loguru import logger
+from tensorflow.keras.models import load_model
+
+from tensorize import Tensorize
+from utils import get_sorted_runs, set_seed
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+experiment_name = params["mlflow"]["experiment_name"]
+random_seed = params["prepare"]["seed"]
+
+# Layers whose output has the same channels as their (single) input.
+CHANNEL_PRESERVING_LAYERS = {
+    "Activation",
+    "AveragePooling2D",
+    "BatchNormalization",
+    "Dropout",
+    "GlobalAvgPool2D",
+    "GlobalAveragePooling2D",
+    "MaxPooling2D",
+    "ReLU",
+    "ZeroPadding2D",
+}
+# Layers merging several inputs element-wise, their inputs must share channels.
+MERGE_LAYERS = {"Add", "Average", "Maximum", "Minimum", "Multiply", "Subtract"}
+
+app = typer.Typer()
+
+
+class ChannelGroups(object):
+    """Union-find of the channel spaces of a functional Keras model.
+
+    Each layer output belongs to a channel group. A `Conv2D` creates a new group,
+    channel preserving layers (BN, ReLU, pooling, ...) forward the group of their
+    input, and merge layers (`Add`) fuse the groups of all their inputs, this is
+    how the residual connections tie the channels of several convolutions
+    together.
+
+    Groups containing the model input or the output of a `Dense` layer can not be
+    pruned.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, model: tf.keras.Model) -> None:
+        """Build the channel groups by walking the layers of `model`.
+
+        Args:
+            model (tf.keras.Model): Functional model to analyse.
+
+        Raises:
+            ValueError: A layer type is not supported by the pruning.
+        """
+        self.parents: Dict[int, int] = {}
+        self.frozen: Dict[int, bool] = {}
+        self.layer_group: Dict[str, int] = {}
+        self.layer_inputs: Dict[str, List[str]] = {}
+
+        for layer_config in model.get_config()["layers"]:
+            name = layer_config["name"]
+            class_name = layer_config["class_name"]
+            inbound = [
+                inbound_node[0]
+                for node in layer_config["inbound_nodes"]
+                for inbound_node in node
+            ]
+            self.layer_inputs[name] = inbound
+
+            if class_name == "InputLayer":
+                self.layer_group[name] = self._new_group(frozen=True)
+            elif class_name == "Conv2D":
+                self.layer_group[name] = self._new_group(frozen=False)
+            elif class_name == "Dense":
+                self.layer_group[name] = self._new_group(frozen=True)
+            elif class_name in CHANNEL_PRESERVING_LAYERS:
+                self.layer_group[name] = self.layer_group[inbound[0]]
+            elif class_name in MERGE_LAYERS:
+                root = self.layer_group[inbound[0]]
+                for other in inbound[1:]:
+                    root = self._union(root, self.layer_group[other])
+                self.layer_group[name] = root
+            else:
+                raise ValueError(
+                    f"Layer `{name}` of type {class_name} can't be pruned."
+                )
+
+    def group(self, layer_name: str) -> int:
+        """Give the channel group of the output of a layer.
+
+        Args:
+            layer_name (str): Name of the layer.
+
+        Returns:
+            The id of the group.
+        """
+        return self._find(self.layer_group[layer_name])
+
+    def input_group(self, layer_name: str) -> int:
+        """Give the channel group of the (first) input of a layer.
+
+        Args:
+            layer_name (str): Name of the layer.
+
+        Returns:
+            The id of the group.
+        """
+        return self.group(self.layer_inputs[layer_name][0])
+
+    def is_frozen(self, group: int) -> bool:
+        """Tell if a group must keep all its channels.
+
+        Args:
+            group (int): The id of the group.
+
+        Returns:
+            True if the group can't be pruned.
+        """
+        return self.frozen[self._find(group)]
+
+    def _new_group(self, frozen: bool) -> int:
+        group = len(self.parents)
+        self.parents[group] = group
+        self.frozen[group] = frozen
+        return group
+
+    def _find(self, group: int) -> int:
+        while self.parents[group] != group:
+            self.parents[group] = self.parents[self.parents[group]]
+            group = self.parents[group]
+        return group
+
+    def _union(self, first: int, second: int) -> int:
+        first, second = self._find(first), self._find(second)
+        if first != second:
+            self.parents[second] = first
+            self.frozen[first] = self.frozen[first] or self.frozen[second]
+        return first
+
+
+def _normalized(scores: np.ndarray) -> np.ndarray:  # type: ignore
+    return scores / (scores.mean() + 1e-12)
+
+
+def rank_channels(
+    model: tf.keras.Model, groups: ChannelGroups, criterion: str = "l1"
+) -> Dict[int, np.ndarray]:  # type: ignore
+    """Give an importance score to every channel of every prunable group.
+
+    With the "l1" criterion, the score of a channel is the L1 norm of the filters
+    producing it. With the "bn_gamma" criterion, it is the absolute value of the
+    BatchNormalization scales applied to it, groups without BN fall back to "l1".
+
+    As a group can be produced or normalized by several layers (residual
+    connections), the scores of each layer are normalized by their mean before
+    being summed, so that no layer dominates because of its scale.
+
+    Args:
+        model (tf.keras.Model): The model to prune.
+        groups (ChannelGroups): The channel groups of `model`.
+        criterion (str, optional): "l1" or "bn_gamma". Defaults to "l1".
+
+    Raises:
+        ValueError: Unknown criterion.
+
+    Returns:
+        A dictionnary group id -> scores of the channels of the group.
+    """
+    if criterion not in {"l1", "bn_gamma"}:
+        raise ValueError(f"Unknown pruning criterion {criterion}.")
+
+    l1_scores: Dict[int, np.ndarray] = {}  # type: ignore
+    gamma_scores: Dict[int, np.ndarray] = {}  # type: ignore
+
+    for layer in model.layers:
+        group = groups.group(layer.name)
+        if groups.is_frozen(group):
+            continue
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            kernel = layer.get_weights()[0].astype(np.float32)
+            score = _normalized(np.abs(kernel).sum(axis=(0, 1, 2)))
+            l1_scores[group] = l1_scores.get(group, 0) + score
+        elif isinstance(layer, tf.keras.layers.BatchNormalization) and layer.scale:
+            gamma = np.abs(layer.gamma.numpy().astype(np.float32))
+            gamma_scores[group] = gamma_scores.get(group, 0) + _normalized(gamma)
+
+    if criterion == "bn_gamma":
+        l1_scores.update(gamma_scores)
+
+    return l1_scores
+
+
+def select_channels(
+    scores: Dict[int, np.ndarray],  # type: ignore
+    ratio: float,
+    min_channels: int = 4,
+) -> Dict[int, np.ndarray]:  # type: ignore
+    """Select the channels to keep in each group.
+
+    Args:
+        scores (Dict[int, np.ndarray]): Scores given by `rank_channels`.
+        ratio (float): Fraction of the channels to remove in each group.
+        min_channels (int, optional): Minimum number of channels kept in a group.
+            Defaults to 4.
+
+    Returns:
+        A dictionnary group id -> sorted indices of the channels to keep.
+    """
+    keep = {}
+    for group, score in scores.items():
+        n_channels = len(score)
+        n_keep = max(min(min_channels, n_channels), round(n_channels * (1 - ratio)))
+        keep[group] = np.sort(np.argsort(-score, kind="stable")[:n_keep])
+    return keep
+
+
+def prune_model(
+    model: tf.keras.Model,
+    ratio: float,
+    criterion: str = "l1",
+    min_channels: int = 4,
+) -> tf.keras.Model:
+    """Physically remove the least important channels of a model.
+
+    The convolutions keep fewer filters, the BatchNormalization, the following
+    convolutions and the `Dense` head drop the matching inputs, and the channels
+    tied by residual `Add` connections are removed consistently. The returned model
+    is a new, smaller, dense Keras model with the remaining weights copied from
+    `model`, ready to be fine-tuned.
+
+    Args:
+        model (tf.keras.Model): Functional model to prune, for example a
+            `get_cnn` from `model.resnet` or `model.wide_resnet`.
+        ratio (float): Fraction of the channels to remove in each group.
+        criterion (str, optional): "l1" or "bn_gamma". Defaults to "l1".
+        min_channels (int, optional): Minimum number of channels kept in a group.
+            Defaults to 4.
+
+    Returns:
+        The pruned model.
+    """
+    groups = ChannelGroups(model)
+    keep = select_channels(
+        rank_channels(model, groups, criterion), ratio, min_channels=min_channels
+    )
+
+    def clone_function(layer: tf.keras.layers.Layer) -> tf.keras.layers.Layer:
+        layer_config = layer.get_config()
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            group = groups.group(layer.name)
+            if group in keep:
+                layer_config["filters"] = len(keep[group])
+        return layer.__class__.from_config(layer_config)
+
+    pruned = tf.keras.models.clone_model(model, clone_function=clone_function)
+
+    for layer in model.layers:
+        weights = layer.get_weights()
+        if not weights:
+            continue
+        out_keep = keep.get(groups.group(layer.name))
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            in_keep = keep.get(groups.input_group(layer.name))
+            if in_keep is not None:
+                weights[0] = weights[0][:, :, in_keep, :]
+            if out_keep is not None:
+                weights = [weights[0][..., out_keep]] + [
+                    bias[out_keep] for bias in weights[1:]
+                ]
+        elif isinstance(layer, tf.keras.layers.Dense):
+            in_keep = keep.get(groups.input_group(layer.name))
+            if in_keep is not None:
+                weights[0] = weights[0][in_keep, :]
+        elif out_keep is not None:
+            weights = [weight[out_keep] for weight in weights]
+        pruned.get_layer(layer.name).set_weights(weights)
+
+    logger.info(
+        f"Pruned {ratio:.0%} of the channels : {model.count_params()} -> "
+        + f"{pruned.count_params()} parameters."
+    )
+
+    return pruned
+
+
+def count_flops(model: tf.keras.Model) -> int:
+    """Count the floating point operations of a forward pass for one image.
+
+    Only the convolutions and the dense layers are counted, a multiply-accumulate
+    counts as two operations.
+
+    Args:
+        model (tf.keras.Model): The model to analyse.
+
+    Returns:
+        The number of FLOPs.
+    """
+    flops = 0
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.Conv2D):
+            kernel_height, kernel_width, in_channels, out_channels = layer.kernel.shape
+            _, height, width, _ = layer.output_shape
+            flops += (
+                2 * height * width * kernel_height * kernel_width
+            ) * in_channels * out_channels
+        elif isinstance(layer, tf.keras.layers.Dense):
+            in_features, out_features = layer.kernel.shape
+            flops += 2 * in_features * out_features
+    return int(flops)
+
+
+def measure_latency(
+    model: tf.keras.Model, batch_size: int = 1, n_runs: int = 20, warmup: int = 3
+) -> float:
+    """Measure the median inference latency of a model.
+
+    Args:
+        model (tf.keras.Model): The model to benchmark.
+        batch_size (int, optional): Size of the random input batch. Defaults to 1.
+        n_runs (int, optional): Number of timed forward passes. Defaults to 20.
+        warmup (int, optional): Number of untimed forward passes done first.
+            Defaults to 3.
+
+    Returns:
+        The median latency of a forward pass, in milliseconds.
+    """
+    inputs = tf.random.uniform((batch_size, *model.input_shape[1:]))
+    for _ in range(warmup):
+        model.predict_on_batch(inputs)
+
+    timings = []
+    for _ in range(n_runs):
+        start = time.perf_counter()
+        model.predict_on_batch(inputs)
+        timings.append(time.perf_counter() - start)
+
+    return float(np.median(timings) * 1000)
+
+
+def load_pruned_cnn(
+    model_path: str, n_classes: int, img_shape: List[int]
+) -> tf.keras.Model:
+    """Load a pruned model so that `train.py` can fine-tune it.
+
+    Used as `class_name` of the `cnn` config group, see `configs/cnn/pruned.yaml`.
+
+    Args:
+        model_path (str): Path of the `.h5` pruned model, relative to the root of
+            the repository.
+        n_classes (int): Number of classes of the datas.
+        img_shape (List[int]): Shape of the images given to the model.
+
+    Raises:
+        ValueError: The model doesn't match the shape or the classes of the datas.
+
+    Returns:
+        The pruned model, not compiled.
+    """
+    model = load_model(hydra.utils.to_absolute_path(model_path), compile=False)
+    if list(model.input_shape[1:]) != list(img_shape):
+        raise ValueError(
+            f"The model takes images of shape {model.input_shape[1:]}, not "
+            + f"{list(img_shape)}, check `datas.grayscale`."
+        )
+    if model.output_shape[-1] != n_classes:
+        raise ValueError(
+            f"The model has {model.output_shape[-1]} classes, not {n_classes}."
+        )
+    return model
+
+
+def evaluate_accuracy(model: tf.keras.Model, data_path: str) -> float:
+    """Compute the categorical accuracy of a model on a prepared dataset.
+
+    Args:
+        model (tf.keras.Model): The model to evaluate.
+        data_path (str): Path of the csv file of the dataset.
+
+    Returns:
+        The categorical accuracy.
+    """
+    ds_params = datasets_config["params"]
+    ts = Tensorize(
+        n_classes=datasets_config["raw_datas"]["n_classes"],
+        img_shape=model.input_shape[1:],
+        random_seed=random_seed,
+    )
+    ds = ts.create_dataset(
+        data_path, ds_params["batch_size"], 1, ds_params["prefetch"], False
+    )
+    model.compile(
+        loss=tf.keras.losses.CategoricalCrossentropy(),
+        metrics=[tf.keras.metrics.CategoricalAccuracy()],
+    )
+    _, accuracy = model.evaluate(ds, verbose=0)
+
+    return float(accuracy)
+
+
+def get_finetune_overrides(model: tf.keras.Model, run_name: str) -> List[str]:
+    """Give the Hydra overrides fitting the datas to the shape of a pruned model.
+
+    Args:
+        model (tf.keras.Model): The pruned model.
+        run_name (str): Unique name of the fine-tuning run.
+
+    Returns:
+        The overrides of the images shape, the classes and the run name.
+    """
+    img_shape = ",".join(str(dim) for dim in model.input_shape[1:])
+    grayscale = "true" if model.input_shape[-1] == 1 else "false"
+    return [
+        f"datas.n_classes={model.output_shape[-1]}",
+        f"datas.grayscale={grayscale}",
+        f"datas.img_shape=[{img_shape}]",
+        f"datasets.params.img_shape=[{img_shape}]",
+        f"mlflow.run_name={run_name}",
+    ]
+
+
+def finetune(
+    model: tf.keras.Model, model_path: Path, overrides: List[str]
+) -> Optional[float]:
+    """Fine-tune a pruned model through `train.py`.
+
+    The images shape and the classes are taken from the model, and the run gets a
+    unique name, so that a run started concurrently (a sweep) is never picked.
+
+    Args:
+        model (tf.keras.Model): The pruned model.
+        model_path (Path): Path of the `.h5` pruned model.
+        overrides (List[str]): Additional Hydra overrides given to `train.py`.
+
+    Returns:
+        The validation accuracy of the fine-tuning run, if any.
+    """
+    run_name = f"pruned_{uuid.uuid4().hex}"
+    command = [
+        sys.executable,
+        "src/train.py",
+        "cnn=pruned",
+        f"cnn.params.model_path={model_path}",
+        *overrides,
+        *get_finetune_overrides(model, run_name),
+    ]
+    logger.info(f"Fine-tuning : {' '.join(command)}")
+    subprocess.run(command, check=True)
+
+    run = get_sorted_runs(
+        experiment_name=experiment_name,
+        order_by=["attributes.start_time DESC"],
+        top_k=1,
+        filter_string=f"tags.mlflow.runName = '{run_name}'",
+        columns=["metrics.val_categorical_accuracy"],
+    )
+    if run.empty:
+        return None
+    return float(run.iloc[0]["metrics.val_categorical_accuracy"])
+
+
+@app.command()
+def curve(
+    model_path: Path = typer.Argument(..., help="Trained `.h5` model to prune."),
+    ratios: List[float] = typer.Option([0.25, 0.5, 0.75], help="Pruning ratios."),
+    criterion: str = typer.Option("l1", help="Ranking criterion, l1 or bn_gamma."),
+    output_dir: Path = typer.Option(Path("models/pruned"), help="Output folder."),
+    fine_tune: bool = typer.Option(False, help="Fine-tune through `train.py`."),
+    overrides: Optional[List[str]] = typer.Option(None, help="Hydra overrides."),
+) -> None:
+    """Prune a model at several ratios and save the FLOPs/latency/accuracy curve.
+
+    Each pruned model is saved in `output_dir`, and a row per ratio (ratio 0 being
+    the original model) is written in `output_dir/pruning_curve.csv`.
+    """
+    set_seed(random_seed)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    val_path = datasets_config["prepared_dataset"]["val"]
+
+    model = load_model(model_path, compile=False)
+
+    rows = []
+    for ratio in [0, *ratios]:
+        pruned = prune_model(model, ratio, criterion=criterion) if ratio else model
+        pruned_path = output_dir / f"{model_path.stem}_{criterion}_{ratio}.h5"
+        pruned.save(pruned_path)
+
+        row = {
+            "ratio": ratio,
+            "params": pruned.count_params(),
+            "flops": count_flops(pruned),
+            "latency_ms": measure_latency(pruned),
+            "val_accuracy": evaluate_accuracy(pruned, val_path),
+            "finetuned_val_accuracy": None,
+        }
+        if fine_tune and ratio:
+            row["finetuned_val_accuracy"] = finetune(
+                pruned, pruned_path, overrides or []
+            )
+        logger.info(f"{row}")
+        rows.append(row)
+
+    with open(output_dir / "pruning_curve.csv", "w", newline="") as saved_csv:
+        writer = csv.DictWriter(saved_csv, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    app()
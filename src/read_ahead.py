@@ -0,0 +1,246 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+from loguru import logger
+
+
+def read_bytes(filename: str) -> bytes:
+    """Read the content of a file.
+
+    Args:
+        filename (str): Path of the file.
+
+    Returns:
+        The content of the file.
+    """
+    with open(filename, "rb") as remote_file:
+        return remote_file.read()
+
+
+class ThrottledReader(object):
+    """Stand-in of a slow storage, an NFS or object-store mount for example.
+
+    Each read waits `latency_ms`, plus the time to transfer the file at
+    `bandwidth_mb` MB/s. The waits release the GIL, so parallel reads overlap like
+    on a remote storage.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, latency_ms: float = 20, bandwidth_mb: float = 50) -> None:
+        """Initialization of the reader.
+
+        Args:
+            latency_ms (float, optional): Latency of a read. Defaults to 20.
+            bandwidth_mb (float, optional): Bandwidth of a read, in MB/s.
+                Defaults to 50.
+        """
+        self.latency = latency_ms / 1000
+        self.bandwidth = bandwidth_mb * 2 ** 20
+        self.n_reads = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, filename: str) -> bytes:
+        """Read a file slowly.
+
+        Args:
+            filename (str): Path of the file.
+
+        Returns:
+            The content of the file.
+        """
+        content = read_bytes(filename)
+        time.sleep(self.latency + len(content) / self.bandwidth)
+        with self.lock:
+            self.n_reads += 1
+        return content
+
+
+class ReadAheadCache(object):
+    """Local cache tier of the images, filled by large parallel reads.
+
+    The filenames of a dataset are grouped in windows of `window` files, each
+    window is read by `n_workers` threads, and `windows_ahead` windows are read
+    while the previous ones are decoded. The files are copied in `cache_dir`, on a
+    local SSD, so that the next epochs and trainings read them locally. The least
+    recently used files are evicted when the cache exceeds `max_size_mb`.
+
+    Usage:
+    ```python
+    read_ahead = ReadAheadCache(Path("/mnt/ssd/cache"), max_size_mb=10240)
+    ts = Tensorize(n_classes, img_shape, random_seed, read_ahead=read_ahead)
+    ```
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_size_mb: float = 10240,
+        window: int = 256,
+        windows_ahead: int = 4,
+        n_workers: int = 16,
+        reader: Callable[[str], bytes] = read_bytes,
+    ) -> None:
+        """Initialization of the cache.
+
+        The files already in `cache_dir` are kept, the oldest ones being the
+        first evicted.
+
+        Args:
+            cache_dir (Path): Local folder of the cached files.
+            max_size_mb (float, optional): Maximum size of the cached files, in MB.
+                Defaults to 10240.
+            window (int, optional): Files read together. Defaults to 256.
+            windows_ahead (int, optional): Windows read in advance. Defaults to 4.
+            n_workers (int, optional): Reading threads. Defaults to 16.
+            reader (Callable[[str], bytes], optional): Read of a file of the slow
+                storage. Defaults to read_bytes.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = int(max_size_mb * 2 ** 20)
+        self.window = window
+        self.windows_ahead = windows_ahead
+        self.reader = reader
+        self.executor = ThreadPoolExecutor(n_workers)
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.remote_bytes = 0
+        self.local_bytes = 0
+
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        cached_files = sorted(
+            (path for path in self.cache_dir.iterdir() if path.suffix != ".tmp"),
+            key=lambda path: path.stat().st_mtime,
+        )
+        for path in cached_files:
+            self.entries[path.name] = path.stat().st_size
+        self.size = sum(self.entries.values())
+
+    def read(self, filename: str) -> bytes:
+        """Read a file from the local cache, or from the slow storage on a miss.
+
+        Args:
+            filename (str): Path of the file on the slow storage.
+
+        Returns:
+            The content of the file.
+        """
+        key = hashlib.blake2b(filename.encode(), digest_size=16).hexdigest()
+        local_path = self.cache_dir / key
+        with self.lock:
+            is_cached = key in self.entries
+            if is_cached:
+                self.entries.move_to_end(key)
+        if is_cached:
+            try:
+                content = local_path.read_bytes()
+            except FileNotFoundError:
+                # evicted by another thread since the lookup
+                is_cached = False
+        if is_cached:
+            with self.lock:
+                self.hits += 1
+                self.local_bytes += len(content)
+            return content
+
+        content = self.reader(filename)
+        tmp_path = self.cache_dir / f"{key}.{threading.get_ident()}.tmp"
+        tmp_path.write_bytes(content)
+        os.replace(tmp_path, local_path)
+        with self.lock:
+            self.misses += 1
+            self.remote_bytes += len(content)
+            self.size += len(content) - self.entries.get(key, 0)
+            self.entries[key] = len(content)
+            self.evict()
+        return content
+
+    def evict(self) -> None:
+        """Remove the least recently used files, while the cache is too big.
+
+        Must be called with the lock held.
+        """
+        while self.size > self.max_size and len(self.entries) > 1:
+            key, file_size = self.entries.popitem(last=False)
+            self.size -= file_size
+            try:
+                (self.cache_dir / key).unlink()
+            except FileNotFoundError:
+                logger.warning(f"Cached file {key} already removed")
+
+    def read_many(self, filenames: np.ndarray) -> np.ndarray:
+        """Read a window of files in parallel.
+
+        Args:
+            filenames (np.ndarray): Paths of the files, as bytes.
+
+        Returns:
+            The contents of the files, as an object array of bytes.
+        """
+        names = [filename.decode() for filename in filenames]
+        contents = np.empty(len(names), dtype=object)
+        contents[:] = list(self.executor.map(self.read, names))
+        return contents
+
+    def read_dataset(self, dataset: tf.data.Dataset) -> tf.data.Dataset:
+        """Replace the paths of a dataset by the contents of the files.
+
+        Args:
+            dataset (tf.data.Dataset): Dataset of paths, or of (path, label) pairs.
+
+        Returns:
+            The dataset of contents, or of (content, label) pairs, in the same order.
+        """
+
+        def read_window(
+            filenames: tf.Tensor, *others: tf.Tensor
+        ) -> Union[tf.Tensor, Tuple[tf.Tensor, ...]]:
+            contents = tf.numpy_function(self.read_many, [filenames], tf.string)
+            contents.set_shape(filenames.shape)
+            return (contents, *others) if others else contents
+
+        dataset = dataset.batch(self.window)
+        dataset = dataset.map(read_window)
+        dataset = dataset.prefetch(self.windows_ahead)
+        return dataset.unbatch()
+
+    def statistics(self) -> Dict[str, float]:
+        """Give the statistics of the cache since its creation.
+
+        Returns:
+            The hits, misses, hit rate, MB read from the slow storage and from the
+            local cache, and the current size of the cache in MB.
+        """
+        with self.lock:
+            n_reads = max(self.hits + self.misses, 1)
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / n_reads,
+                "remote_mb": self.remote_bytes / 2 ** 20,
+                "local_mb": self.local_bytes / 2 ** 20,
+                "size_mb": self.size / 2 ** 20,
+            }
+
+    def close(self) -> None:
+        """Stop the reading threads."""
+        self.executor.shutdown()
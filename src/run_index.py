@@ -0,0 +1,294 @@
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+import mlflow
+import pandas as pd
+import typer
+import yaml
+from loguru import logger
+from mlflow.entities import Run
+from mlflow.tracking import MlflowClient
+
+from utils import (
+    get_changed_runs,
+    get_last_runs,
+    get_local_store,
+    get_runs_fingerprint,
+)
+
+with open("configs/params.yaml") as reproducibility_params:
+    mlflow_config = yaml.safe_load(reproducibility_params)["mlflow"]
+
+experiment_name = mlflow_config["experiment_name"]
+
+INDEX_PATH = Path("models/cache/run_index.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    experiment_id TEXT,
+    status TEXT,
+    lifecycle_stage TEXT,
+    start_time INTEGER,
+    end_time INTEGER,
+    artifact_uri TEXT
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    run_id TEXT,
+    key TEXT,
+    numeric_value REAL,
+    text_value TEXT,
+    PRIMARY KEY (run_id, key)
+);
+CREATE INDEX IF NOT EXISTS summaries_key ON summaries (key, numeric_value);
+CREATE TABLE IF NOT EXISTS state (
+    experiment_id TEXT PRIMARY KEY,
+    n_runs INTEGER,
+    last_modification REAL
+);
+CREATE TABLE IF NOT EXISTS last_runs (
+    experiment_id TEXT,
+    run_id TEXT,
+    PRIMARY KEY (experiment_id, run_id)
+);
+"""
+
+app = typer.Typer()
+
+
+class RunIndex(object):
+    """Local SQLite index of the run summaries of an experiment.
+
+    For each run, the index keeps its infos, the last value of its metrics, its
+    params and its tags, stored as "metrics.<name>", "params.<name>" and
+    "tags.<name>" keys. `refresh` only reads the runs whose `meta.yaml` changed
+    since the last refresh, so repeated leaderboard queries don't rescan the
+    `mlruns` file tree. The index only works with a local file store.
+
+    Usage:
+    ```python
+    index = RunIndex("best")
+    index.refresh()
+    leaderboard = index.leaderboard("metrics.val_loss", top_k=5)
+    ```
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        experiment: str,
+        index_path: Path = INDEX_PATH,
+        tracking_uri: Optional[str] = None,
+    ) -> None:
+        """Initialization of the index.
+
+        Args:
+            experiment (str): Name of the experiment.
+            index_path (Path, optional): SQLite file of the index. Defaults to
+                INDEX_PATH.
+            tracking_uri (Optional[str], optional): URI of the tracking store.
+                Defaults to the current tracking URI.
+
+        Raises:
+            ValueError: The tracking store is not a local file store.
+        """
+        tracking_uri = tracking_uri or mlflow.get_tracking_uri()
+        store = get_local_store(tracking_uri)
+        if store is None:
+            raise ValueError(f"The run index needs a local store, got {tracking_uri}.")
+
+        self.client = MlflowClient(tracking_uri=tracking_uri)
+        self.experiment_id = self.client.get_experiment_by_name(
+            experiment
+        ).experiment_id
+        self.experiment_dir = store / self.experiment_id
+
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(str(index_path))
+        self.connection.executescript(SCHEMA)
+
+    def refresh(self) -> int:
+        """Index the runs created or modified since the last refresh.
+
+        If some runs have been removed from the store, the index of the experiment
+        is rebuilt.
+
+        Returns:
+            The number of runs read from the store.
+        """
+        n_runs, last_modification = get_runs_fingerprint(self.experiment_dir)
+        state = self.connection.execute(
+            "SELECT n_runs, last_modification FROM state WHERE experiment_id = ?",
+            (self.experiment_id,),
+        ).fetchone()
+
+        since = 0.0
+        seen: List[str] = []
+        if state is not None and n_runs >= state[0]:
+            since = state[1]
+            seen = [
+                row[0]
+                for row in self.connection.execute(
+                    "SELECT run_id FROM last_runs WHERE experiment_id = ?",
+                    (self.experiment_id,),
+                )
+            ]
+        elif state is not None:
+            self._clear()
+
+        changed_runs = get_changed_runs(self.experiment_dir, since, seen)
+        with self.connection:
+            for run_id in changed_runs:
+                self._insert(self.client.get_run(run_id))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?, ?)",
+                (self.experiment_id, n_runs, last_modification),
+            )
+            self.connection.execute(
+                "DELETE FROM last_runs WHERE experiment_id = ?", (self.experiment_id,)
+            )
+            self.connection.executemany(
+                "INSERT INTO last_runs VALUES (?, ?)",
+                [
+                    (self.experiment_id, run_id)
+                    for run_id in get_last_runs(self.experiment_dir, last_modification)
+                ],
+            )
+
+        logger.info(f"{len(changed_runs)} runs indexed")
+        return len(changed_runs)
+
+    def leaderboard(
+        self,
+        order_by: str,
+        ascending: bool = True,
+        top_k: Optional[int] = 10,
+        status: Optional[str] = "FINISHED",
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """Give the best runs of the experiment from the index.
+
+        Runs without the `order_by` metric are left out.
+
+        Args:
+            order_by (str): Metric to sort the runs by, for example
+                "metrics.val_loss".
+            ascending (bool, optional): Sort order. Defaults to True.
+            top_k (Optional[int], optional): Number of runs, None for all the runs.
+                Defaults to 10.
+            status (Optional[str], optional): Keep only the runs with this status,
+                None for all the runs. Defaults to "FINISHED".
+            columns (Optional[List[str]], optional): Keys to return besides
+                "run_id" and `order_by`. Defaults to None, which returns all the
+                indexed keys.
+
+        Returns:
+            A dataframe with a row per run, with the columns of `mlflow.search_runs`.
+        """
+        order = "ASC" if ascending else "DESC"
+        query = f"""
+            SELECT runs.run_id, summaries.numeric_value
+            FROM runs JOIN summaries ON runs.run_id = summaries.run_id
+            WHERE runs.experiment_id = ? AND runs.lifecycle_stage = 'active'
+            AND summaries.key = ? AND (? IS NULL OR runs.status = ?)
+            ORDER BY summaries.numeric_value {order}
+            LIMIT ?
+        """
+        best_runs = self.connection.execute(
+            query,
+            (self.experiment_id, order_by, status, status, top_k or -1),
+        ).fetchall()
+        run_ids = [run_id for run_id, _ in best_runs]
+
+        placeholders = ", ".join("?" * len(run_ids))
+        summaries = self.connection.execute(
+            f"""
+            SELECT run_id, key, numeric_value, text_value FROM summaries
+            WHERE run_id IN ({placeholders})
+            """,
+            run_ids,
+        ).fetchall()
+
+        rows = {
+            run_id: {"run_id": run_id, order_by: run_value}
+            for run_id, run_value in best_runs
+        }
+        for run_id, key, numeric_value, text_value in summaries:
+            if columns is None or key in columns:
+                rows[run_id][key] = numeric_value if text_value is None else text_value
+
+        keys = None if columns is None else ["run_id", order_by, *columns]
+        return pd.DataFrame([rows[run_id] for run_id in run_ids], columns=keys)
+
+    def close(self) -> None:
+        """Close the SQLite connection."""
+        self.connection.close()
+
+    def _clear(self) -> None:
+        with self.connection:
+            self.connection.execute(
+                """
+                DELETE FROM summaries WHERE run_id IN
+                (SELECT run_id FROM runs WHERE experiment_id = ?)
+                """,
+                (self.experiment_id,),
+            )
+            self.connection.execute(
+                "DELETE FROM runs WHERE experiment_id = ?", (self.experiment_id,)
+            )
+
+    def _insert(self, run: Run) -> None:
+        info = run.info
+        self.connection.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                info.run_id,
+                info.experiment_id,
+                info.status,
+                info.lifecycle_stage,
+                info.start_time,
+                info.end_time,
+                info.artifact_uri,
+            ),
+        )
+        self.connection.execute(
+            "DELETE FROM summaries WHERE run_id = ?", (info.run_id,)
+        )
+        summaries = [
+            (info.run_id, f"metrics.{key}", metric_value, None)
+            for key, metric_value in run.data.metrics.items()
+        ]
+        summaries.extend(
+            (info.run_id, f"{prefix}.{key}", None, text_value)
+            for prefix, values in (("params", run.data.params), ("tags", run.data.tags))
+            for key, text_value in values.items()
+        )
+        self.connection.executemany(
+            "INSERT INTO summaries VALUES (?, ?, ?, ?)", summaries
+        )
+
+
+@app.command()
+def leaderboard(
+    metric: str = typer.Option("val_loss", help="Metric used to rank the runs."),
+    mode: str = typer.Option("min", help="min or max."),
+    top_k: int = typer.Option(10, help="Number of runs."),
+    columns: Optional[List[str]] = typer.Option(None, help="Columns to show."),
+) -> None:
+    """Refresh the local run index and print the best runs of the experiment."""
+    index = RunIndex(experiment_name)
+    index.refresh()
+    best_runs = index.leaderboard(
+        f"metrics.{metric}", mode == "min", top_k, columns=columns or []
+    )
+    index.close()
+    typer.echo(best_runs.to_string(index=False))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,291 @@
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, List, Tuple
+
+import numpy as np
+import typer
+import yaml
+from loguru import logger
+
+from predict import get_class_names, load_inference_model
+from tensorize import Tensorize
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+
+# Number of recent requests used to compute the latency percentiles.
+LATENCY_WINDOW = 10000
+
+app = typer.Typer()
+
+
+class LatencyStats(object):
+    """Latency percentiles and throughput of the recent requests.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        """Initialization of the statistics.
+
+        Args:
+            window (int, optional): Number of recent requests kept. Defaults to
+                LATENCY_WINDOW.
+        """
+        # (end time, latency) of the recent requests, in seconds
+        self.requests: Deque[Tuple[float, float]] = deque(maxlen=window)
+        self.batch_sizes: Deque[int] = deque(maxlen=window)
+        self.n_requests = 0
+        self.lock = threading.Lock()
+
+    def add_batch(self, latencies: List[float]) -> None:
+        """Record the latencies of the requests of a batch.
+
+        Args:
+            latencies (List[float]): Latency of each request of the batch, in
+                seconds.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            self.requests.extend((now, latency) for latency in latencies)
+            self.batch_sizes.append(len(latencies))
+            self.n_requests += len(latencies)
+
+    def summary(self) -> Dict[str, float]:
+        """Aggregate the recent requests.
+
+        Returns:
+            p50/p99 latencies in milliseconds, throughput in requests per second,
+            mean batch size, and total number of requests.
+        """
+        with self.lock:
+            if not self.requests:
+                return {"requests": self.n_requests}
+            end_times, latencies = np.array(self.requests).T
+            batch_sizes = np.array(self.batch_sizes)
+            n_requests = self.n_requests
+
+        start = (end_times - latencies).min()
+        elapsed = max(end_times.max() - start, 1e-9)
+        return {
+            "latency_p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "latency_p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "throughput_rps": float(len(latencies) / elapsed),
+            "mean_batch_size": float(batch_sizes.mean()),
+            "requests": n_requests,
+        }
+
+
+class MicroBatcher(object):
+    """Group concurrent requests in micro-batches for a single model call.
+
+    A background thread takes the first queued image, then waits at most
+    `max_wait_ms` for other images, up to `max_batch_size`, and runs the model once
+    on the whole batch. A burst of patches is then scored in a few batched calls
+    instead of a call per image.
+
+    Usage:
+    ```python
+    batcher = MicroBatcher(model.predict_on_batch, max_batch_size=32)
+    probabilities = batcher.submit(image).result()
+    ```
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        predict_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5,
+    ) -> None:
+        """Initialization of the batcher, starts the background thread.
+
+        Args:
+            predict_fn (Callable[[np.ndarray], np.ndarray]): Model call, from a
+                batch of images to a batch of probabilities.
+            max_batch_size (int, optional): Maximum number of images per model call.
+                Defaults to 32.
+            max_wait_ms (float, optional): Maximum time to wait for other images
+                after the first one of a batch, in milliseconds. Defaults to 5.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests: "queue.Queue[Tuple[np.ndarray, float, Future]]" = queue.Queue()
+        self.stats = LatencyStats()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Queue an image.
+
+        Args:
+            image (np.ndarray): The decoded image.
+
+        Returns:
+            A future of the probabilities of the image.
+        """
+        future: Future = Future()
+        self.requests.put((image, time.perf_counter(), future))
+        return future
+
+    def close(self) -> None:
+        """Stop the background thread."""
+        self.stopped.set()
+        self.thread.join()
+
+    def _next_batch(self) -> List[Tuple[np.ndarray, float, Future]]:
+        batch = [self.requests.get(timeout=0.1)]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                continue
+
+            images, arrivals, futures = zip(*batch)
+            try:
+                probabilities = np.asarray(self.predict_fn(np.stack(images)))
+            except Exception as error:
+                for future in futures:
+                    future.set_exception(error)
+                continue
+
+            now = time.perf_counter()
+            for future, probability in zip(futures, probabilities):
+                future.set_result(probability)
+            self.stats.add_batch([now - arrival for arrival in arrivals])
+
+
+def get_handler(
+    batcher: MicroBatcher, ts: Tensorize, class_names: List[str]
+) -> type:
+    """Create the request handler of the server.
+
+    - `POST /predict`, with the bytes of a JPEG image as body, returns the
+        predicted class and the probabilities of the classes.
+    - `GET /metrics` returns the latency percentiles and the throughput.
+
+    Args:
+        batcher (MicroBatcher): Batcher of the model.
+        ts (Tensorize): Pipeline decoding the images.
+        class_names (List[str]): Names of the classes.
+
+    Returns:
+        The handler class.
+    """
+
+    class InferenceHandler(BaseHTTPRequestHandler):
+        def do_POST(self) -> None:
+            """Predict the class of the posted JPEG image."""
+            if self.path != "/predict":
+                self._send_json({"error": "not found"}, status=404)
+                return
+
+            content_length = self.headers.get("Content-Length")
+            if content_length is None:
+                self._send_json({"error": "Content-Length required"}, status=411)
+                return
+            if not content_length.isdigit():
+                self._send_json({"error": "invalid Content-Length"}, status=400)
+                return
+
+            body = self.rfile.read(int(content_length))
+            try:
+                image = ts.decode_image(body).numpy()
+            except Exception:
+                self._send_json({"error": "invalid JPEG image"}, status=400)
+                return
+
+            probabilities = batcher.submit(image).result()
+            self._send_json(
+                {
+                    "prediction": class_names[int(np.argmax(probabilities))],
+                    "probabilities": dict(
+                        zip(class_names, probabilities.astype(float).tolist())
+                    ),
+                }
+            )
+
+        def do_GET(self) -> None:
+            """Give the latency and throughput metrics."""
+            if self.path != "/metrics":
+                self._send_json({"error": "not found"}, status=404)
+                return
+            self._send_json(batcher.stats.summary())
+
+        def log_message(self, *args) -> None:
+            """Don't log the requests, a line per request costs more than them.
+
+            Args:
+                args ([type]): Unused log arguments.
+            """
+
+        def _send_json(self, content: Dict, status: int = 200) -> None:
+            payload = json.dumps(content).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    return InferenceHandler
+
+
+@app.command()
+def main(
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    host: str = typer.Option("127.0.0.1", help="Host of the server."),
+    port: int = typer.Option(8080, help="Port of the server."),
+    max_batch_size: int = typer.Option(32, help="Maximum images per model call."),
+    max_wait_ms: float = typer.Option(5, help="Maximum wait to fill a batch."),
+) -> None:
+    """Serve the model over HTTP, with dynamic micro-batching of the requests."""
+    inference_model = load_inference_model(model)
+    batcher = MicroBatcher(
+        inference_model.predict_on_batch, max_batch_size, max_wait_ms
+    )
+    ts = Tensorize(n_classes, inference_model.input_shape[1:], random_seed)
+    handler = get_handler(batcher, ts, get_class_names())
+
+    server = ThreadingHTTPServer((host, port), handler)
+    logger.info(f"Serving on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        batcher.close()
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,372 @@
+import csv
+import itertools
+import os
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import typer
+import yaml
+from loguru import logger
+from mlflow.tracking import MlflowClient
+
+with open("configs/params.yaml") as reproducibility_params:
+    mlflow_config = yaml.safe_load(reproducibility_params)["mlflow"]
+
+with open("configs/sweep/asha.yaml") as sweep_params:
+    sweep_config = yaml.safe_load(sweep_params)
+
+experiment_name = mlflow_config["experiment_name"]
+
+app = typer.Typer()
+
+
+class AshaScheduler(object):
+    """Asynchronous successive halving, stopping variant.
+
+    Rungs are placed at `min_epochs * reduction_factor^k` epochs. When a trial
+    reaches a rung, its metric is compared to the metrics of all the trials which
+    reached this rung before it : the trial only continues if it is among the best
+    `1 / reduction_factor` of them. Trials are never paused, so no trial waits for
+    the others and the CPUs are always busy.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(
+        self,
+        min_epochs: int,
+        max_epochs: int,
+        reduction_factor: int,
+        mode: str = "min",
+    ) -> None:
+        """Initialization of the scheduler.
+
+        Args:
+            min_epochs (int): Epochs of the first rung.
+            max_epochs (int): Epochs of a trial which is never stopped.
+            reduction_factor (int): Ratio between two rungs.
+            mode (str, optional): "min" if the metric must be minimized, "max"
+                otherwise. Defaults to "min".
+
+        Raises:
+            ValueError: Unknown mode.
+        """
+        if mode not in {"min", "max"}:
+            raise ValueError(f"Unknown mode {mode}, use 'min' or 'max'.")
+
+        self.reduction_factor = reduction_factor
+        self.sign = 1 if mode == "min" else -1
+        self.milestones: List[int] = []
+        milestone = min_epochs
+        while milestone < max_epochs:
+            self.milestones.append(milestone)
+            milestone *= reduction_factor
+        self.rungs: Dict[int, List[float]] = {
+            milestone: [] for milestone in self.milestones
+        }
+
+    def on_result(self, epoch: int, metric: float) -> bool:
+        """Decide if a trial continues after `epoch` epochs.
+
+        Args:
+            epoch (int): Number of completed epochs of the trial.
+            metric (float): Value of the metric after `epoch` epochs.
+
+        Returns:
+            False if the trial has to be stopped.
+        """
+        if epoch not in self.rungs:
+            return True
+
+        recorded = self.rungs[epoch]
+        recorded.append(self.sign * metric)
+        cutoff = np.percentile(recorded, 100 / self.reduction_factor)
+
+        return bool(self.sign * metric <= cutoff)
+
+
+@dataclass
+class Trial(object):
+    """A training run of the sweep.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    name: str
+    overrides: List[str]
+    process: Optional[subprocess.Popen] = None  # type: ignore
+    run_id: Optional[str] = None
+    history: List[float] = field(default_factory=list)
+    status: str = "PENDING"
+    cpus: List[int] = field(default_factory=list)
+    launch_ms: int = 0
+
+
+def get_trials(
+    search_space: Dict[str, List[Any]], sweep_name: str, sweep_id: str = ""
+) -> List[Trial]:
+    """Create a trial for every combination of the search space.
+
+    Args:
+        search_space (Dict[str, List[Any]]): Hydra key -> values to try.
+        sweep_name (str): Prefix of the MLflow run names of the trials.
+        sweep_id (str, optional): Unique ID of the sweep, in the run names so that
+            a trial isn't mixed up with a trial of a previous sweep. Defaults to "".
+
+    Returns:
+        The list of trials.
+    """
+    keys = list(search_space)
+    return [
+        Trial(
+            name="_".join(filter(None, [sweep_name, sweep_id, str(idx)])),
+            overrides=[f"{key}={value}" for key, value in zip(keys, values)],
+        )
+        for idx, values in enumerate(itertools.product(*search_space.values()))
+    ]
+
+
+def get_cpu_sets(n_sets: int) -> List[List[int]]:
+    """Split the cores available to this process in disjoint sets.
+
+    Args:
+        n_sets (int): Number of sets, ie of trials running in parallel.
+
+    Raises:
+        ValueError: Less cores than sets.
+
+    Returns:
+        The list of the sets of CPU ids.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        # no CPU affinity on macOS and Windows
+        cpus = list(range(os.cpu_count() or 1))
+    set_size = len(cpus) // n_sets
+    if set_size == 0:
+        raise ValueError(f"Can't split {len(cpus)} cores in {n_sets} sets.")
+
+    return [cpus[idx * set_size : (idx + 1) * set_size] for idx in range(n_sets)]
+
+
+def get_threads_overrides(cpus: List[int], inter_op: int) -> List[str]:
+    """Hydra overrides pinning a trial on `cpus`, with matching thread pools.
+
+    Args:
+        cpus (List[int]): CPU ids of the trial.
+        inter_op (int): Number of inter-op threads.
+
+    Returns:
+        The overrides of the `threads` config group.
+    """
+    cpus_list = ",".join(str(cpu) for cpu in cpus)
+    return [
+        f"threads.cpus=[{cpus_list}]",
+        f"threads.intra_op={len(cpus)}",
+        f"threads.inter_op={inter_op}",
+        f"threads.datasets={len(cpus)}",
+    ]
+
+
+def launch(
+    trial: Trial, max_epochs: int, extra_overrides: List[str], inter_op: int = 0
+) -> None:
+    """Start `train.py` for a trial.
+
+    If `trial.cpus` is set, the trial is pinned on these cores, its TensorFlow and
+    tf.data thread pools are sized to them, and so is OpenMP (oneDNN kernels).
+
+    Args:
+        trial (Trial): The trial to launch.
+        max_epochs (int): Number of epochs of a complete trial.
+        extra_overrides (List[str]): Hydra overrides shared by all the trials.
+        inter_op (int, optional): Number of inter-op threads of a pinned trial.
+            Defaults to 0.
+    """
+    command = [
+        sys.executable,
+        "src/train.py",
+        *trial.overrides,
+        *extra_overrides,
+        f"training.epochs={max_epochs}",
+        f"mlflow.run_name={trial.name}",
+    ]
+    env = dict(os.environ)
+    if trial.cpus:
+        command.extend(get_threads_overrides(trial.cpus, inter_op))
+        env["OMP_NUM_THREADS"] = str(len(trial.cpus))
+
+    logger.info(f"Launching {trial.name} : {' '.join(trial.overrides)}")
+    trial.launch_ms = int(time.time() * 1000)
+    trial.process = subprocess.Popen(command, env=env)
+    trial.status = "RUNNING"
+
+
+def read_history(
+    client: MlflowClient, experiment_id: str, trial: Trial, metric: str
+) -> None:
+    """Update the history of the metric of a trial from the mlruns store.
+
+    Only the runs started after the launch of the trial are searched, so a run of
+    a previous sweep with the same name is never picked.
+
+    Args:
+        client (MlflowClient): Client of the local mlruns store.
+        experiment_id (str): ID of the experiment of the sweep.
+        trial (Trial): The trial to update.
+        metric (str): Name of the metric logged at each epoch.
+    """
+    if trial.run_id is None:
+        runs = client.search_runs(
+            [experiment_id],
+            filter_string=f"tags.mlflow.runName = '{trial.name}'",
+        )
+        # the file store of MLflow 1.14 can't filter on start_time
+        runs = [run for run in runs if run.info.start_time >= trial.launch_ms]
+        if not runs:
+            return
+        trial.run_id = runs[0].info.run_id
+
+    history = client.get_metric_history(trial.run_id, metric)
+    trial.history = [point.value for point in sorted(history, key=lambda x: x.step)]
+
+
+def stop(client: MlflowClient, trial: Trial) -> None:
+    """Kill the `train.py` process of a trial and mark its run as killed.
+
+    Args:
+        client (MlflowClient): Client of the local mlruns store.
+        trial (Trial): The trial to stop.
+    """
+    trial.process.terminate()  # type: ignore
+    trial.process.wait()  # type: ignore
+    trial.status = "STOPPED"
+    if trial.run_id is not None:
+        client.set_terminated(trial.run_id, status="KILLED")
+
+
+def save_summary(trials: List[Trial], destination: Path, mode: str) -> None:
+    """Save the results of all the trials as a csv file, best trial first.
+
+    Args:
+        trials (List[Trial]): Trials of the sweep.
+        destination (Path): Path of the csv file.
+        mode (str): "min" or "max".
+    """
+    if not trials:
+        logger.warning(f"Empty search space, {destination} not saved")
+        return
+
+    sign = 1 if mode == "min" else -1
+    rows = [
+        {
+            "trial": trial.name,
+            "overrides": " ".join(trial.overrides),
+            "status": trial.status,
+            "epochs": len(trial.history),
+            "best_metric": sign * min(sign * value for value in trial.history)
+            if trial.history
+            else None,
+            "run_id": trial.run_id,
+        }
+        for trial in trials
+    ]
+    rows.sort(key=lambda row: sign * row["best_metric"] if row["epochs"] else np.inf)
+
+    with open(destination, "w", newline="") as saved_csv:
+        writer = csv.DictWriter(saved_csv, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+@app.command()
+def main(
+    sweep_name: str = typer.Option("asha", help="Prefix of the trials run names."),
+    overrides: Optional[List[str]] = typer.Option(None, help="Shared overrides."),
+    output: Path = typer.Option(Path("asha_summary.csv"), help="Summary csv."),
+    early_stopping: bool = typer.Option(True, help="Stop the bad trials early."),
+) -> None:
+    """Run the search space of `configs/sweep/asha.yaml` with early stopping.
+
+    Up to `launcher.max_parallel` trials run at the same time, each one on its own
+    cores if `launcher.pin_cpus` is set. Without early stopping, every trial runs
+    `asha.max_epochs` epochs.
+    """
+    asha = sweep_config["asha"]
+    launcher = sweep_config["launcher"]
+    min_epochs = asha["min_epochs"] if early_stopping else asha["max_epochs"]
+    scheduler = AshaScheduler(
+        min_epochs, asha["max_epochs"], asha["reduction_factor"], asha["mode"]
+    )
+    logger.info(f"Rungs at epochs {scheduler.milestones}")
+
+    free_cpus: List[List[int]] = []
+    if launcher["pin_cpus"]:
+        free_cpus = get_cpu_sets(launcher["max_parallel"])
+        logger.info(f"CPU sets of the trials : {free_cpus}")
+
+    client = MlflowClient(tracking_uri=f"file://{Path.cwd()}/mlruns")
+    experiment = client.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        experiment_id = client.create_experiment(experiment_name)
+    else:
+        experiment_id = experiment.experiment_id
+
+    sweep_id = f"{time.strftime('%Y%m%d%H%M%S')}{uuid.uuid4().hex[:6]}"
+    logger.info(f"Sweep ID {sweep_id}")
+    trials = get_trials(sweep_config["search_space"], sweep_name, sweep_id)
+    pending = list(trials)
+    running: Dict[str, Trial] = {}
+    evaluated: Dict[str, int] = {}
+
+    while pending or running:
+        while pending and len(running) < launcher["max_parallel"]:
+            trial = pending.pop(0)
+            if launcher["pin_cpus"]:
+                trial.cpus = free_cpus.pop()
+            launch(trial, asha["max_epochs"], overrides or [], launcher["inter_op"])
+            running[trial.name] = trial
+            evaluated[trial.name] = 0
+
+        time.sleep(asha["poll_interval"])
+
+        for trial in list(running.values()):
+            returncode = trial.process.poll()  # type: ignore
+            read_history(client, experiment_id, trial, asha["metric"])
+            keep_going = True
+            for epoch in range(evaluated[trial.name] + 1, len(trial.history) + 1):
+                keep_going = keep_going and scheduler.on_result(
+                    epoch, trial.history[epoch - 1]
+                )
+            evaluated[trial.name] = len(trial.history)
+
+            if returncode is not None:
+                trial.status = "FINISHED" if returncode == 0 else "FAILED"
+            elif not keep_going:
+                logger.info(f"Stopping {trial.name} after {len(trial.history)} epochs")
+                stop(client, trial)
+            else:
+                continue
+            running.pop(trial.name)
+            if trial.cpus:
+                free_cpus.append(trial.cpus)
+
+    save_summary(trials, output, asha["mode"])
+    logger.info(f"Sweep summary saved in {output}")
+
+
+if __name__ == "__main__":
+    app()
@@ -1,10 +1,13 @@
-from typing import Dict, List, Tuple, TypeVar
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, TypeVar
 
 import numpy as np
 import pandas as pd
 import tensorflow as tf
 from loguru import logger
 
+from read_ahead import ReadAheadCache
+
 gen_type = TypeVar("gen_type")
 
 
@@ -18,7 +21,12 @@ class Tensorize(object):
     """
 
     def __init__(
-        self, n_classes: int, img_shape: Tuple[int, int, int], random_seed: int
+        self,
+        n_classes: int,
+        img_shape: Tuple[int, int, int],
+        random_seed: int,
+        n_threads: int = 0,
+        read_ahead: Optional[ReadAheadCache] = None,
     ) -> None:
         """Initialization of the class Featurize.
 
@@ -29,10 +37,17 @@ class Tensorize(object):
             n_classes (int): Number of classes in the dataset.
             img_shape (Tuple[int, int, int]): Dimension of the image, format is (H,W,C).
             random_seed (int): Fixed random seed for reproducibility.
+            n_threads (int, optional): Size of a private thread pool for the
+                datasets, 0 to use the shared TensorFlow one. Defaults to 0.
+            read_ahead (Optional[ReadAheadCache], optional): Local cache tier the
+                images are read through, for a slow storage. None to read them
+                directly. Defaults to None.
         """
         self.n_classes = n_classes
         self.img_shape = img_shape
         self.random_seed = random_seed
+        self.n_threads = n_threads
+        self.read_ahead = read_ahead
         self.AUTOTUNE = tf.data.experimental.AUTOTUNE
 
     def load_images(self, data_frame: pd.DataFrame, column_name: str) -> List[str]:
@@ -100,19 +115,52 @@ class Tensorize(object):
         Returns:
             A np.ndarray corresponding to the image and the corresponding one-hot label.
         """
-        resized_dims = [self.img_shape[0], self.img_shape[1]]
+        return self.decode_image_and_label(tf.io.read_file(filename), label)
+
+    def decode_image_and_label(
+        self, image_bytes: tf.Tensor, label: int
+    ) -> Tuple[np.ndarray, int]:  # type: ignore
+        """Transform the bytes of an image and its label.
+
+        Args:
+            image_bytes (tf.Tensor): The content of the JPEG file.
+            label (int): The label of the image, as an int, to one-hot encode.
+
+        Returns:
+            A np.ndarray corresponding to the image and the corresponding one-hot label.
+        """
         # convert the label to one-hot encoding
         label = tf.one_hot(label, self.n_classes)
-        # decode image
-        image = tf.io.read_file(filename)
+
+        return self.decode_image(image_bytes), label
+
+    def parse_image(self, filename: str) -> np.ndarray:  # type: ignore
+        """Transform an image path to a resized np.ndarray.
+
+        Args:
+            filename (str): The path of the image to parse.
+
+        Returns:
+            A np.ndarray corresponding to the image, with values in [0, 1].
+        """
+        return self.decode_image(tf.io.read_file(filename))
+
+    def decode_image(self, image_bytes: tf.Tensor) -> np.ndarray:  # type: ignore
+        """Transform the bytes of a JPEG image to a resized np.ndarray.
+
+        Args:
+            image_bytes (tf.Tensor): The content of the JPEG file.
+
+        Returns:
+            A np.ndarray corresponding to the image, with values in [0, 1].
+        """
+        resized_dims = [self.img_shape[0], self.img_shape[1]]
         # Don't use tf.image.decode_image,
         # or the output shape will be undefined
-        image = tf.image.decode_jpeg(image)
+        image = tf.image.decode_jpeg(image_bytes, channels=self.img_shape[2])
         # This will convert to float values in [0, 1]
         image = tf.image.convert_image_dtype(image, tf.float32)
-        image = tf.image.resize(image, resized_dims)
-
-        return image, label
+        return tf.image.resize(image, resized_dims)
 
     def train_preprocess(
         self, image: np.ndarray, label: List[int]  # type: ignore
@@ -160,13 +208,138 @@ class Tensorize(object):
         dataset = tf.data.Dataset.from_tensor_slices((features, labels))
         dataset = dataset.shuffle(len(features), seed=self.random_seed)
         dataset = dataset.repeat(repet)
-        dataset = dataset.map(
-            self.parse_image_and_label, num_parallel_calls=self.AUTOTUNE
-        )
+        if self.read_ahead is None:
+            dataset = dataset.map(
+                self.parse_image_and_label, num_parallel_calls=self.AUTOTUNE
+            )
+        else:
+            dataset = self.read_ahead.read_dataset(dataset)
+            dataset = dataset.map(
+                self.decode_image_and_label, num_parallel_calls=self.AUTOTUNE
+            )
         if augment:
             dataset = dataset.map(
                 self.train_preprocess, num_parallel_calls=self.AUTOTUNE
             )
         dataset = dataset.batch(batch)
         dataset = dataset.cache()
+        if self.n_threads:
+            options = tf.data.Options()
+            options.experimental_threading.private_threadpool_size = self.n_threads
+            dataset = dataset.with_options(options)
+        return dataset.prefetch(prefetch)
+
+    def create_inference_dataset(
+        self, filenames: List[str], batch: int, prefetch: int
+    ) -> tf.data.Dataset:
+        """Creation of a dataset of images without labels, for inference.
+
+        The order of the images is kept, and the dataset is neither shuffled nor
+        cached, so that millions of images can go through it with a bounded memory.
+
+        Args:
+            filenames (List[str]): Paths of the images.
+            batch (int): Batch size.
+            prefetch (int): How many batch the CPU has to prepare in advance.
+
+        Returns:
+            A batch of observations.
+        """
+        dataset = tf.data.Dataset.from_tensor_slices(filenames)
+        if self.read_ahead is None:
+            dataset = dataset.map(self.parse_image, num_parallel_calls=self.AUTOTUNE)
+        else:
+            dataset = self.read_ahead.read_dataset(dataset)
+            dataset = dataset.map(self.decode_image, num_parallel_calls=self.AUTOTUNE)
+        dataset = dataset.batch(batch)
+        if self.n_threads:
+            options = tf.data.Options()
+            options.experimental_threading.private_threadpool_size = self.n_threads
+            dataset = dataset.with_options(options)
+        return dataset.prefetch(prefetch)
+
+    def cache_images(
+        self, filenames: List[str], destination: Path, batch: int = 256
+    ) -> None:
+        """Decode and resize the images once, and save them in a `.npy` file.
+
+        The images are saved as uint8, so that the cache is 4 times smaller than
+        float32 images, and read as a memory map by `create_cached_dataset`, so
+        that several trainings, even in separate processes, share it.
+
+        Args:
+            filenames (List[str]): Paths of the images.
+            destination (Path): The `.npy` file of the decoded images.
+            batch (int, optional): Images decoded at once. Defaults to 256.
+        """
+        images = np.lib.format.open_memmap(
+            destination,
+            mode="w+",
+            dtype=np.uint8,
+            shape=(len(filenames), *self.img_shape),
+        )
+        start = 0
+        for batch_images in self.create_inference_dataset(filenames, batch, 2):
+            end = start + len(batch_images)
+            images[start:end] = np.round(batch_images.numpy() * 255)
+            start = end
+        images.flush()
+
+    def create_cached_dataset(
+        self,
+        cache_path: Path,
+        indexes: np.ndarray,
+        labels: np.ndarray,
+        batch: int,
+        repet: int,
+        prefetch: int,
+        augment: bool,
+    ) -> tf.data.Dataset:
+        """Creation of a tensor dataset from the images decoded by `cache_images`.
+
+        Only the indexes and the labels go through the shuffle, the images of each
+        batch are then gathered from the memory mapped cache, so no JPEG is decoded.
+
+        Args:
+            cache_path (Path): The `.npy` file of the decoded images.
+            indexes (np.ndarray): Rows of the cache used in this dataset.
+            labels (np.ndarray): Encoded labels of these rows.
+            batch (int): Batch size, usually 32.
+            repet (int): How many times the dataset has to be repeated.
+            prefetch (int): How many batch the CPU has to prepare in advance for the
+                GPU.
+            augment (bool): Does the dataset has to be augmented or no.
+
+        Returns:
+            A batch of observations and labels.
+        """
+        images = np.load(cache_path, mmap_mode="r")
+
+        def load_batch(
+            batch_indexes: tf.Tensor, batch_labels: tf.Tensor
+        ) -> Tuple[tf.Tensor, tf.Tensor]:
+            # the rows are read in increasing order, for sequential disk reads
+            batch_images = tf.numpy_function(
+                lambda rows: images[rows], [tf.sort(batch_indexes)], tf.uint8
+            )
+            batch_images.set_shape([None, *self.img_shape])
+            sorted_labels = tf.gather(batch_labels, tf.argsort(batch_indexes))
+            return (
+                tf.image.convert_image_dtype(batch_images, tf.float32),
+                tf.one_hot(sorted_labels, self.n_classes),
+            )
+
+        dataset = tf.data.Dataset.from_tensor_slices((indexes, labels))
+        dataset = dataset.shuffle(len(indexes), seed=self.random_seed)
+        dataset = dataset.repeat(repet)
+        dataset = dataset.batch(batch)
+        dataset = dataset.map(load_batch, num_parallel_calls=self.AUTOTUNE)
+        if augment:
+            dataset = dataset.map(
+                self.train_preprocess, num_parallel_calls=self.AUTOTUNE
+            )
+        if self.n_threads:
+            options = tf.data.Options()
+            options.experimental_threading.private_threadpool_size = self.n_threads
+            dataset = dataset.with_options(options)
         return dataset.prefetch(prefetch)
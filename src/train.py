@@ -1,18 +1,277 @@
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
 from pathlib import Path
+from typing import Any, Dict, List, Optional
 
 import hydra
 import mlflow
+import numpy as np
+import pandas as pd
 import tensorflow as tf
 from loguru import logger
+from mlflow import keras as mlkeras
 from mlflow import tensorflow as mltensorflow
-from omegaconf import DictConfig
-
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+from omegaconf import DictConfig, OmegaConf
+
+from accumulation import accumulate_gradients
+from callbacks import BufferedMetrics, ProfilerWindow, StepTimer
+from metric_logger import BufferedMetricLogger
+from precision import set_precision_policy, wrap_optimizer
+from read_ahead import ReadAheadCache
 from tensorize import Tensorize
-from utils import flatten_omegaconf, load_obj, set_log_infos, set_seed
+from utils import (
+    config_to_hydra_dict,
+    flatten_omegaconf,
+    get_img_shape,
+    load_obj,
+    set_log_infos,
+    set_seed,
+    set_threads,
+)
 
 # test hello world
 
 
+def compile_model(
+    config: DictConfig,
+    conf_dict: Dict[str, Any],
+    policy: tf.keras.mixed_precision.Policy,
+) -> tf.keras.Model:
+    """Create and compile the model of the config.
+
+    Args:
+        config (DictConfig): Hydra config.
+        conf_dict (Dict[str, Any]): The config, as given by `config_to_hydra_dict`.
+        policy (tf.keras.mixed_precision.Policy): Precision policy of the training.
+
+    Returns:
+        The compiled model.
+    """
+    cnn = load_obj(config.cnn.class_name)
+    model = cnn(**conf_dict["cnn.params"])
+    model = accumulate_gradients(model, config.training.accumulation_steps)
+
+    optim = load_obj(config.optimizer.class_name)
+    optimizer = wrap_optimizer(optim(**conf_dict["optimizer.params"]), policy)
+
+    loss = load_obj(config.losses.class_name)
+    loss = loss(**conf_dict["losses.params"])
+
+    metric = load_obj(config.metrics.class_name)
+    metric = metric()
+
+    logger.info(f"XLA JIT compilation : {config.training.jit_compile}")
+    tf.config.optimizer.set_jit(config.training.jit_compile)
+
+    model.compile(
+        optimizer=optimizer,
+        loss=loss,
+        metrics=[metric],
+        steps_per_execution=config.training.steps_per_execution,
+        run_eagerly=config.training.run_eagerly,
+    )
+
+    return model
+
+
+def train_fold(
+    container: Dict[str, Any], repo_path: str, fold: int, parent_run_id: str
+) -> Dict[str, float]:
+    """Train one fold of the cross-validation, on the decoded images cache.
+
+    The fold is the validation set, the other folds of the manifest are the
+    training set. This function runs in the training process, or in a spawned one
+    if the folds are trained in parallel, hence the config given as a container.
+
+    Args:
+        container (Dict[str, Any]): Resolved Hydra config, as a dict.
+        repo_path (str): Root folder of the repository.
+        fold (int): Index of the validation fold.
+        parent_run_id (str): MLflow run aggregating the folds.
+
+    Returns:
+        The metrics of the last epoch.
+    """
+    config = OmegaConf.create(container)
+    conf_dict = config_to_hydra_dict(config)
+    # a spawned process starts with the default pools, set them before any TF op
+    set_threads(
+        config.threads.intra_op, config.threads.inter_op, list(config.threads.cpus)
+    )
+    tf.keras.backend.clear_session()
+    set_seed(config.prepare.seed)
+    policy = set_precision_policy(config.precision.name)
+
+    mlflow.set_tracking_uri(f"file://{repo_path}/mlruns")
+    mlflow.set_experiment(config.mlflow.experiment_name)
+
+    ts = Tensorize(
+        n_classes=config.datas.n_classes,
+        img_shape=config.datasets.params.img_shape,
+        random_seed=config.prepare.seed,
+        n_threads=config.threads.datasets,
+    )
+    df = pd.read_csv(Path(repo_path) / config.datasets.prepared_dataset.folds)
+    labels = ts.load_labels(data_frame=df, column_name="label")
+    is_val = (df["fold"] == fold).to_numpy()
+    indexes = np.arange(len(df))
+    cache_path = Path(repo_path) / config.training.cross_validation.cache
+    params = config.datasets.params
+
+    ds = ts.create_cached_dataset(
+        cache_path,
+        indexes[~is_val],
+        labels[~is_val],
+        params.batch_size,
+        params.repetitions,
+        params.prefetch,
+        params.augment,
+    )
+    ds_val = ts.create_cached_dataset(
+        cache_path,
+        indexes[is_val],
+        labels[is_val],
+        params.batch_size,
+        1,
+        params.prefetch,
+        False,
+    )
+
+    with mlflow.start_run(
+        run_name=f"{config.mlflow.run_name}_fold_{fold}",
+        nested=mlflow.active_run() is not None,
+        tags={MLFLOW_PARENT_RUN_ID: parent_run_id},
+    ):
+        mlflow.log_param("fold", fold)
+        model = compile_model(config, conf_dict, policy)
+        history = model.fit(
+            ds, epochs=config.training.epochs, validation_data=ds_val, verbose=2
+        )
+        for epoch, values in enumerate(zip(*history.history.values())):
+            mlflow.log_metrics(dict(zip(history.history, values)), step=epoch)
+
+    return {name: values[-1] for name, values in history.history.items()}
+
+
+def get_cache_fingerprint(filenames: List[str], img_shape: List[int]) -> Dict[str, Any]:
+    """Identify the content of a decoded images cache.
+
+    The rows of the cache are the images of the manifest, in its order, so the
+    cache has to be rebuilt if the manifest is rewritten, even with the same
+    number of images.
+
+    Args:
+        filenames (List[str]): Paths of the images, in the order of the manifest.
+        img_shape (List[int]): Shape of the decoded images.
+
+    Returns:
+        The number of images, their shape, and a hash of their paths.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for filename in filenames:
+        digest.update(f"{filename}\n".encode())
+    return {
+        "n_images": len(filenames),
+        "img_shape": list(img_shape),
+        "filenames_hash": digest.hexdigest(),
+    }
+
+
+def set_memory_growth() -> None:
+    """Allocate the GPU memory on demand, in a spawned fold process.
+
+    By default TensorFlow reserves all the memory of the GPU, so the second fold
+    trained in parallel on the same GPU would run out of memory.
+    """
+    for gpu in tf.config.list_physical_devices("GPU"):
+        tf.config.experimental.set_memory_growth(gpu, True)
+
+
+def close_read_ahead(read_ahead: Optional[ReadAheadCache]) -> None:
+    """Log the statistics of the read-ahead cache, and stop its threads.
+
+    Args:
+        read_ahead (Optional[ReadAheadCache]): The cache, None if disabled.
+    """
+    if read_ahead is None:
+        return
+    mlflow.log_metrics(
+        {f"read_ahead_{name}": value for name, value in read_ahead.statistics().items()}
+    )
+    read_ahead.close()
+
+
+def cross_validate(
+    config: DictConfig, repo_path: str, ts: Tensorize, parent_run_id: str
+) -> None:
+    """Train every fold of the folds manifest, and aggregate their metrics.
+
+    The images are decoded once in the cache of `training.cross_validation`,
+    which is rebuilt only if it doesn't match the manifest, then every fold is
+    trained on it, in `parallel` processes. The mean and the standard deviation of
+    the last epoch metrics of the folds are logged in the parent run.
+
+    Args:
+        config (DictConfig): Hydra config.
+        repo_path (str): Root folder of the repository.
+        ts (Tensorize): Dataset creation of the training.
+        parent_run_id (str): MLflow run aggregating the folds.
+    """
+    cross_validation = config.training.cross_validation
+    df = pd.read_csv(Path(repo_path) / config.datasets.prepared_dataset.folds)
+    cache_path = Path(repo_path) / cross_validation.cache
+    fingerprint_path = cache_path.with_name(f"{cache_path.name}.json")
+    fingerprint = get_cache_fingerprint(
+        df["filename"].tolist(), config.datasets.params.img_shape
+    )
+    cached_fingerprint = (
+        json.loads(fingerprint_path.read_text())
+        if cache_path.exists() and fingerprint_path.exists()
+        else None
+    )
+    if cached_fingerprint != fingerprint:
+        logger.info(f"Decoding {len(df)} images in {cache_path}")
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        if fingerprint_path.exists():
+            fingerprint_path.unlink()
+        ts.cache_images(df["filename"].tolist(), cache_path)
+        fingerprint_path.write_text(json.dumps(fingerprint))
+
+    container = OmegaConf.to_container(config, resolve=True)
+    folds = sorted(int(fold) for fold in df["fold"].unique())
+    logger.info(f"Cross-validation on {len(folds)} folds")
+    if cross_validation.parallel > 1:
+        n_folds = len(folds)
+        with ProcessPoolExecutor(
+            cross_validation.parallel,
+            mp_context=get_context("spawn"),
+            initializer=set_memory_growth,
+        ) as executor:
+            results = list(
+                executor.map(
+                    train_fold,
+                    [container] * n_folds,
+                    [repo_path] * n_folds,
+                    folds,
+                    [parent_run_id] * n_folds,
+                )
+            )
+    else:
+        results = [
+            train_fold(container, repo_path, fold, parent_run_id) for fold in folds
+        ]
+
+    metrics = pd.DataFrame(results)
+    logger.info(f"Folds metrics :\n{metrics}")
+    mlflow.log_metrics(
+        {f"cv_mean_{name}": mean for name, mean in metrics.mean().items()}
+    )
+    mlflow.log_metrics({f"cv_std_{name}": std for name, std in metrics.std().items()})
+
+
 @logger.catch()
 @hydra.main(config_path="../configs/", config_name="params.yaml")
 def train(config: DictConfig):
@@ -50,14 +309,19 @@ def train(config: DictConfig):
     Args:
         config (DictConfig): [description]
     """
+    grayscale = config.datas.grayscale
+    config.datas.img_shape = get_img_shape(config.datas.img_shape, grayscale)
+    config.datasets.params.img_shape = get_img_shape(
+        config.datasets.params.img_shape, grayscale
+    )
     conf_dict, repo_path = set_log_infos(config)
 
+    set_threads(
+        config.threads.intra_op, config.threads.inter_op, list(config.threads.cpus)
+    )
+
     logger.info("Setting training policy.")
-    logger.info("test depuis l'env de dev docker")
-    policy = tf.keras.mixed_precision.experimental.Policy("mixed_float16")
-    tf.keras.mixed_precision.experimental.set_policy(policy)
-    logger.info(f"Compute dtype : {policy.compute_dtype}")
-    logger.info(f"Variable dtype : {policy.variable_dtype}")
+    policy = set_precision_policy(config.precision.name)
 
     mlflow.set_tracking_uri(f"file://{repo_path}/mlruns")
     mlflow.set_experiment(config.mlflow.experiment_name)
@@ -72,15 +336,34 @@ def train(config: DictConfig):
 
         logger.info(f"Run infos : {run.info}")
 
-        mltensorflow.autolog(every_n_iter=1)
         mlflow.log_params(flatten_omegaconf(config))
+        mlflow.log_param("precision_policy", policy.name)
+
+        read_ahead = None
+        if config.datasets.read_ahead.enabled:
+            read_ahead = ReadAheadCache(
+                Path(config.datasets.read_ahead.cache_dir),
+                config.datasets.read_ahead.max_size_mb,
+                config.datasets.read_ahead.window,
+                config.datasets.read_ahead.windows_ahead,
+                config.datasets.read_ahead.n_workers,
+            )
 
         ts = Tensorize(
             n_classes=config.datas.n_classes,
             img_shape=config.datasets.params.img_shape,
             random_seed=config.prepare.seed,
+            n_threads=config.threads.datasets,
+            read_ahead=read_ahead,
         )
 
+        if config.training.cross_validation.enabled:
+            try:
+                cross_validate(config, repo_path, ts, run.info.run_id)
+            finally:
+                close_read_ahead(read_ahead)
+            return
+
         ds = ts.create_dataset(
             Path(repo_path) / config.datasets.prepared_dataset.train,
             config.datasets.params.batch_size,
@@ -97,32 +380,54 @@ def train(config: DictConfig):
             config.datasets.params.augment,
         )
 
-        logger.info("Compiling model")
-
-        cnn = load_obj(config.cnn.class_name)
-        model = cnn(**conf_dict["cnn.params"])
-
-        optim = load_obj(config.optimizer.class_name)
-        optimizer = optim(**conf_dict["optimizer.params"])
-
-        loss = load_obj(config.losses.class_name)
-        loss = loss(**conf_dict["losses.params"])
-
-        metric = load_obj(config.metrics.class_name)
-        metric = metric()
+        callbacks = []
+        metric_logger = None
+        if config.training.mlflow_logging.buffered:
+            metric_logger = BufferedMetricLogger(
+                run.info.run_id, config.training.mlflow_logging.flush_interval
+            )
+            callbacks.append(
+                BufferedMetrics(
+                    metric_logger, config.training.mlflow_logging.every_n_steps
+                )
+            )
+        else:
+            mltensorflow.autolog(every_n_iter=1)
+        if config.training.step_timing:
+            step_timer = StepTimer()
+            ds = step_timer.wrap(ds)
+            callbacks.append(step_timer)
+        if config.training.profiler.enabled:
+            callbacks.append(
+                ProfilerWindow(
+                    config.training.profiler.epoch,
+                    config.training.profiler.start_step,
+                    config.training.profiler.stop_step,
+                )
+            )
 
-        model.compile(
-            optimizer=optimizer,
-            loss=loss,
-            metrics=[metric],
-        )
+        logger.info("Compiling model")
+        model = compile_model(config, conf_dict, policy)
+        if metric_logger is not None:
+            metric_logger.log_fit_params(
+                model, config.training.epochs, config.datasets.params.batch_size
+            )
 
         logger.info("Start training")
-        model.fit(
-            ds,
-            epochs=config.training.epochs,
-            validation_data=ds_val,
-        )
+        try:
+            model.fit(
+                ds,
+                epochs=config.training.epochs,
+                validation_data=ds_val,
+                callbacks=callbacks,
+            )
+        finally:
+            if metric_logger is not None:
+                metric_logger.close()
+            close_read_ahead(read_ahead)
+
+        if metric_logger is not None:
+            mlkeras.log_model(model, artifact_path="model")
 
 
 if __name__ == "__main__":
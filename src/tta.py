@@ -0,0 +1,166 @@
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import pandas as pd
+import tensorflow as tf
+import typer
+import yaml
+from loguru import logger
+
+from predict import load_inference_model
+from tensorize import Tensorize
+
+with open("configs/params.yaml") as reproducibility_params:
+    params = yaml.safe_load(reproducibility_params)
+
+with open("configs/datasets/datasets.yaml") as datasets:
+    datasets_config = yaml.safe_load(datasets)
+
+random_seed = params["prepare"]["seed"]
+n_classes = datasets_config["raw_datas"]["n_classes"]
+
+# The 8 symmetries of the square. The first 4 are the flips used by
+# `Tensorize.train_preprocess`, the last 4 swap the height and the width.
+TRANSFORMS: List[Callable[[tf.Tensor], tf.Tensor]] = [
+    lambda images: images,
+    tf.image.flip_left_right,
+    tf.image.flip_up_down,
+    lambda images: tf.image.rot90(images, k=2),
+    tf.image.transpose,
+    lambda images: tf.image.rot90(images, k=1),
+    lambda images: tf.image.rot90(images, k=3),
+    lambda images: tf.image.rot90(tf.image.transpose(images), k=2),
+]
+
+REDUCTIONS = {"mean", "max", "vote"}
+
+app = typer.Typer()
+
+
+def with_tta(
+    model: tf.keras.Model, n_transforms: int = 8, reduction: str = "mean"
+) -> tf.keras.Model:
+    """Wrap a model with test-time augmentation in a single forward pass.
+
+    Each batch of N images is expanded on-tensor into its `n_transforms`
+    transforms, a single batch of `n_transforms * N` images goes through the
+    model, and the predictions of the transforms of each image are reduced in the
+    graph :
+
+    - "mean" averages the probabilities,
+    - "max" keeps the highest probability of each class,
+    - "vote" gives the fraction of the transforms predicting each class.
+
+    Args:
+        model (tf.keras.Model): Classifier returning probabilities.
+        n_transforms (int, optional): Expansion factor, 1, 2, 4 or 8. Defaults to 8.
+        reduction (str, optional): "mean", "max" or "vote". Defaults to "mean".
+
+    Raises:
+        ValueError: Unknown reduction, invalid expansion factor, or rotations of
+            non-square images.
+
+    Returns:
+        The model with test-time augmentation, with the same inputs and outputs.
+    """
+    if reduction not in REDUCTIONS:
+        raise ValueError(f"Unknown reduction {reduction}, use one of {REDUCTIONS}.")
+    if n_transforms not in {1, 2, 4, 8}:
+        raise ValueError(f"Expansion factor {n_transforms} not in 1, 2, 4 or 8.")
+    height, width = model.input_shape[1:3]
+    if n_transforms == 8 and height != width:
+        raise ValueError(f"Can't rotate {height}x{width} images, use 4 transforms.")
+
+    def expand(images: tf.Tensor) -> tf.Tensor:
+        return tf.concat(
+            [transform(images) for transform in TRANSFORMS[:n_transforms]], axis=0
+        )
+
+    def reduce(predictions: tf.Tensor) -> tf.Tensor:
+        n_outputs = predictions.shape[-1]
+        predictions = tf.reshape(predictions, [n_transforms, -1, n_outputs])
+        if reduction == "mean":
+            return tf.reduce_mean(predictions, axis=0)
+        if reduction == "max":
+            return tf.reduce_max(predictions, axis=0)
+        votes = tf.one_hot(tf.argmax(predictions, axis=-1), n_outputs)
+        return tf.reduce_mean(votes, axis=0)
+
+    inputs = tf.keras.Input(model.input_shape[1:])
+    expanded = tf.keras.layers.Lambda(expand, name="tta_expand")(inputs)
+    predictions = model(expanded, training=False)
+    outputs = tf.keras.layers.Lambda(reduce, name="tta_reduce")(predictions)
+
+    return tf.keras.Model(inputs, outputs, name=f"{model.name}_tta{n_transforms}")
+
+
+def evaluate(model: tf.keras.Model, dataset: tf.data.Dataset) -> Dict[str, float]:
+    """Measure the accuracy and the latency of a model on a cached dataset.
+
+    Args:
+        model (tf.keras.Model): The model.
+        dataset (tf.data.Dataset): Cached batches of images and one-hot labels.
+
+    Returns:
+        The accuracy and the latency per image and per batch, in milliseconds.
+    """
+    predict = tf.function(lambda images: model(images, training=False))
+    for images, _ in dataset.take(1):
+        predict(images)
+
+    n_images = 0
+    n_correct = 0
+    batch_times = []
+    for images, labels in dataset:
+        start = time.perf_counter()
+        probabilities = predict(images).numpy()
+        batch_times.append(time.perf_counter() - start)
+        n_images += len(labels)
+        n_correct += int(
+            (probabilities.argmax(axis=1) == labels.numpy().argmax(axis=1)).sum()
+        )
+
+    return {
+        "accuracy": n_correct / n_images,
+        "latency_per_image_ms": 1000 * sum(batch_times) / n_images,
+        "latency_per_batch_ms": 1000 * sum(batch_times) / len(batch_times),
+    }
+
+
+@app.command()
+def report(
+    model: str = typer.Option("best", help="Model path, MLflow run ID, or best."),
+    factors: List[int] = typer.Option([1, 2, 4, 8], help="Expansion factors."),
+    reductions: List[str] = typer.Option(["mean"], help="mean, max or vote."),
+    batch_size: int = typer.Option(32, help="Batch size, before expansion."),
+    output: Path = typer.Option(Path("tta_report.csv"), help="Report csv."),
+) -> None:
+    """Compare the latency and the accuracy of TTA on the test split."""
+    base_model = load_inference_model(model)
+    ts = Tensorize(n_classes, base_model.input_shape[1:], random_seed)
+    dataset = ts.create_dataset(
+        datasets_config["prepared_dataset"]["test"],
+        batch=batch_size,
+        repet=1,
+        prefetch=1,
+        augment=False,
+    )
+    # fill the cache, so that the decoding is not timed
+    for _ in dataset:
+        continue
+
+    rows = []
+    for reduction in reductions:
+        for n_transforms in factors:
+            measures = evaluate(with_tta(base_model, n_transforms, reduction), dataset)
+            logger.info(f"TTA x{n_transforms} ({reduction}) : {measures}")
+            measures.update({"transforms": n_transforms, "reduction": reduction})
+            rows.append(measures)
+
+    pd.DataFrame(rows).to_csv(output, index=False)
+    logger.info(f"TTA report saved in {output}")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,283 @@
+import math
+import os
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+import tensorflow as tf
+import typer
+from hydra.experimental import compose, initialize
+from loguru import logger
+
+from precision import set_precision_policy
+from tensorize import Tensorize
+from train import compile_model
+from utils import (
+    config_to_hydra_dict,
+    get_img_shape,
+    get_rss,
+    set_seed,
+    set_threads,
+)
+
+NODE_CONFIGS = Path("configs/node")
+
+app = typer.Typer()
+
+
+class ProbeMonitor(tf.keras.callbacks.Callback):
+    """Record the duration of each epoch and the peak resident set size.
+
+    Args:
+        tf.keras.callbacks.Callback (Callback): Keras base callback.
+    """
+
+    def __init__(self) -> None:
+        """Initialization of the callback."""
+        super().__init__()
+        self.durations: List[float] = []
+        self.start = 0.0
+        self.peak_rss = get_rss()
+
+    def on_epoch_begin(self, epoch, logs=None) -> None:
+        """Start the timer.
+
+        Args:
+            epoch ([type]): Index of the epoch.
+            logs ([type], optional): Unused. Defaults to None.
+        """
+        self.start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None) -> None:
+        """Sample the RSS.
+
+        Args:
+            batch ([type]): Index of the step in the epoch.
+            logs ([type], optional): Unused. Defaults to None.
+        """
+        self.peak_rss = max(self.peak_rss, get_rss())
+
+    def on_epoch_end(self, epoch, logs=None) -> None:
+        """Stop the timer and save the duration of the epoch.
+
+        Args:
+            epoch ([type]): Index of the epoch.
+            logs ([type], optional): Unused. Defaults to None.
+        """
+        self.durations.append(time.perf_counter() - self.start)
+
+
+def probe(
+    overrides: List[str], batch_size: int, prefetch: int, n_threads: int, steps: int
+) -> Dict[str, float]:
+    """Train the configured model on the train split with a batch size.
+
+    The first epoch of `steps` steps warms up the graph and the pipeline, the
+    second one is timed. The probe only sees `2 * steps * batch_size` images, so
+    the float32 images of the train split not yet in the in-memory cache of the
+    dataset are added to the measured peak RSS.
+
+    The TensorFlow pools and the CPU pinning of the probe process are the ones of
+    the `threads` config, as in the training the tuned parameters are written for.
+
+    Args:
+        overrides (List[str]): Hydra overrides of the training, `cnn=wide_resnet`
+            for example.
+        batch_size (int): Batch size.
+        prefetch (int): Batches prepared in advance.
+        n_threads (int): Size of the private tf.data thread pool, 0 for the shared
+            one.
+        steps (int): Training steps per epoch.
+
+    Returns:
+        The training images per second, the peak RSS in MB, with the full cache of
+        the train split, and if the model ran out of memory.
+    """
+    with initialize(config_path="../configs"):
+        config = compose(config_name="params", overrides=overrides)
+    set_threads(
+        config.threads.intra_op, config.threads.inter_op, list(config.threads.cpus)
+    )
+    grayscale = config.datas.grayscale
+    config.datas.img_shape = get_img_shape(config.datas.img_shape, grayscale)
+    set_seed(config.prepare.seed)
+
+    ts = Tensorize(
+        n_classes=config.datas.n_classes,
+        img_shape=get_img_shape(config.datasets.params.img_shape, grayscale),
+        random_seed=config.prepare.seed,
+        n_threads=n_threads,
+    )
+    ds = ts.create_dataset(
+        config.datasets.prepared_dataset.train,
+        batch_size,
+        1,
+        prefetch,
+        config.datasets.params.augment,
+    ).repeat()
+
+    monitor = ProbeMonitor()
+    try:
+        policy = set_precision_policy(config.precision.name)
+        model = compile_model(config, config_to_hydra_dict(config), policy)
+        model.fit(ds, epochs=2, steps_per_epoch=steps, callbacks=[monitor], verbose=0)
+    except tf.errors.ResourceExhaustedError:
+        return {"images_per_sec": 0, "peak_rss_mb": math.inf, "oom": True}
+
+    img_shape = ts.img_shape
+    n_train = len(pd.read_csv(config.datasets.prepared_dataset.train))
+    n_uncached = max(n_train - 2 * steps * batch_size, 0)
+    uncached_bytes = n_uncached * img_shape[0] * img_shape[1] * img_shape[2] * 4
+    return {
+        "images_per_sec": steps * batch_size / monitor.durations[-1],
+        "peak_rss_mb": (monitor.peak_rss + uncached_bytes) / 2 ** 20,
+        "oom": False,
+    }
+
+
+def run_probe(
+    overrides: List[str], batch_size: int, prefetch: int, n_threads: int, steps: int
+) -> Dict[str, float]:
+    """Run a probe in a fresh process, so that the probes don't share memory.
+
+    Args:
+        overrides (List[str]): Hydra overrides of the training.
+        batch_size (int): Batch size.
+        prefetch (int): Batches prepared in advance.
+        n_threads (int): Size of the private tf.data thread pool.
+        steps (int): Training steps per epoch.
+
+    Returns:
+        The measures of `probe`, with the probed parameters.
+    """
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+        try:
+            measures = executor.submit(
+                probe, overrides, batch_size, prefetch, n_threads, steps
+            ).result()
+        except BrokenProcessPool:
+            # killed by the OOM killer
+            measures = {"images_per_sec": 0, "peak_rss_mb": math.inf, "oom": True}
+
+    measures.update(
+        {"batch_size": batch_size, "prefetch": prefetch, "n_threads": n_threads}
+    )
+    logger.info(f"Probe : {measures}")
+    return measures
+
+
+def select_best(
+    probes: List[Dict[str, float]], memory_budget_mb: float
+) -> Optional[Dict[str, float]]:
+    """Select the fastest probe under the memory budget.
+
+    Args:
+        probes (List[Dict[str, float]]): Measures of the probes.
+        memory_budget_mb (float): Maximum RSS, in MB.
+
+    Returns:
+        The fastest probe, None if none of them fits in the budget.
+    """
+    valid = [
+        measures
+        for measures in probes
+        if not measures["oom"] and measures["peak_rss_mb"] <= memory_budget_mb
+    ]
+    if not valid:
+        return None
+    return max(valid, key=lambda measures: measures["images_per_sec"])
+
+
+def write_overrides(destination: Path, best: Dict[str, float]) -> None:
+    """Write a Hydra config with the tuned parameters of the node.
+
+    Args:
+        destination (Path): The yaml file, in the `node` config group.
+        best (Dict[str, float]): The selected probe.
+    """
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    destination.write_text(
+        "\n".join(
+            [
+                "# @package _global_",
+                f"# {best['images_per_sec']:.1f} images/sec, "
+                + f"peak RSS {best['peak_rss_mb']:.0f} MB.",
+                "datasets:",
+                "  params:",
+                f"    batch_size: {best['batch_size']}",
+                f"    prefetch: {best['prefetch']}",
+                "threads:",
+                f"  datasets: {best['n_threads']}",
+            ]
+        )
+    )
+
+
+def get_memory_budget() -> float:
+    """Give 80% of the physical memory of the node.
+
+    Returns:
+        The memory budget, in MB.
+    """
+    total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    return 0.8 * total / 2 ** 20
+
+
+@app.command()
+def main(
+    overrides: List[str] = typer.Option([], help="Hydra overrides, cnn=resnet."),
+    node: str = typer.Option(socket.gethostname(), help="Name of the node."),
+    memory_budget_mb: float = typer.Option(0, help="Max RSS, 0 for 80% of RAM."),
+    min_batch_size: int = typer.Option(8, help="First batch size probed."),
+    max_batch_size: int = typer.Option(1024, help="Last batch size probed."),
+    prefetches: List[int] = typer.Option([1, 2, 4], help="Prefetch probed."),
+    steps: int = typer.Option(20, help="Timed steps per probe."),
+) -> None:
+    """Find the fastest batch size, prefetch and tf.data threads of the node.
+
+    The batch sizes are doubled from `min_batch_size` until the peak RSS exceeds
+    the budget, then the prefetch and the size of the tf.data thread pool are
+    probed for the fastest batch size. The result is written in
+    `configs/node/<node>.yaml`, used with `python src/train.py +node=<node>`.
+    """
+    budget = memory_budget_mb or get_memory_budget()
+    logger.info(f"Memory budget : {budget:.0f} MB")
+
+    probes = []
+    batch_size = min_batch_size
+    while batch_size <= max_batch_size:
+        measures = run_probe(overrides, batch_size, prefetches[0], 0, steps)
+        probes.append(measures)
+        if measures["oom"] or measures["peak_rss_mb"] > budget:
+            break
+        batch_size *= 2
+
+    best = select_best(probes, budget)
+    if best is None:
+        logger.error(f"No batch size from {min_batch_size} fits in {budget:.0f} MB")
+        raise typer.Exit(code=1)
+
+    n_cpus = os.cpu_count() or 1
+    for prefetch in prefetches:
+        for n_threads in sorted({0, max(n_cpus // 2, 1), n_cpus}):
+            if (prefetch, n_threads) != (prefetches[0], 0):
+                probes.append(
+                    run_probe(
+                        overrides, best["batch_size"], prefetch, n_threads, steps
+                    )
+                )
+
+    best = select_best(probes, budget)
+    logger.info(f"Probes :\n{pd.DataFrame(probes)}")
+    destination = NODE_CONFIGS / f"{node}.yaml"
+    write_overrides(destination, best)  # type: ignore
+    logger.info(f"Best parameters {best} saved in {destination}")
+
+
+if __name__ == "__main__":
+    app()
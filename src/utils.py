@@ -1,7 +1,19 @@
 import importlib
 import os
 import random
-from typing import Any, Dict, List, Optional, Tuple, Union
+from pathlib import Path
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlparse
 
 import hydra
 import mlflow
@@ -9,8 +21,13 @@ import numpy as np
 import pandas as pd
 import tensorflow as tf
 from loguru import logger
+from mlflow.entities import Run, ViewType
+from mlflow.tracking import MlflowClient
 from omegaconf import DictConfig, OmegaConf
 
+# Number of runs per page when fetching all the runs of an experiment.
+SEARCH_PAGE_SIZE = 1000
+
 
 # https://github.com/Erlemar/pytorch_tempest/blob/master/src/utils/technical_utils.py
 def config_to_hydra_dict(cfg: DictConfig) -> Dict[str, str]:
@@ -128,6 +145,19 @@ def load_obj(obj_path: str, default_obj_path: str = "") -> Any:
     return getattr(module_obj, obj_name)
 
 
+def get_img_shape(img_shape: Sequence[int], grayscale: bool) -> List[int]:
+    """Give the shape of the images, with a single channel in grayscale mode.
+
+    Args:
+        img_shape (Sequence[int]): Shape of the images, format is (H,W,C).
+        grayscale (bool): The `grayscale` switch of `configs/datas`.
+
+    Returns:
+        The shape of the images given to the models.
+    """
+    return [img_shape[0], img_shape[1], 1 if grayscale else img_shape[2]]
+
+
 def set_seed(random_seed: int) -> None:
     """(Try to) fix random behavior for reproducibility.
 
@@ -141,31 +171,264 @@ def set_seed(random_seed: int) -> None:
     os.environ["TF_DETERMINISTIC_OPS"] = "1"
 
 
+def get_rss() -> int:
+    """Give the resident set size of the current process.
+
+    Reads `/proc/self/statm` on Linux, and falls back to the peak RSS given by
+    `resource` on the other OS.
+
+    Returns:
+        The RSS in bytes.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def set_threads(intra_op: int, inter_op: int, cpus: List[int]) -> None:
+    """Pin the process on some cores and size the TensorFlow thread pools.
+
+    Has to be called before TensorFlow runs any operation.
+
+    Args:
+        intra_op (int): Threads used inside an operation, 0 for all the cores.
+        inter_op (int): Operations run in parallel, 0 for all the cores.
+        cpus (List[int]): CPU ids the process is pinned to, empty to use all of
+            them. Ignored if the OS doesn't support CPU affinity.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        logger.info(f"Process pinned on CPUs {cpus}")
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+    logger.info(f"Threads : intra-op {intra_op}, inter-op {inter_op}")
+
+
+def runs_to_dataframe(
+    runs: List[Run], columns: Optional[List[str]] = None
+) -> pd.DataFrame:
+    """Convert MLflow runs to a dataframe, with the columns of `mlflow.search_runs`.
+
+    Args:
+        runs (List[Run]): The runs to convert.
+        columns (Optional[List[str]], optional): Columns to keep besides "run_id",
+            for example `["metrics.val_loss", "params.cnn_name"]`. Defaults to
+            None, which keeps all the columns.
+
+    Returns:
+        A dataframe with a row per run.
+    """
+    rows = []
+    for run in runs:
+        row: Dict[str, Any] = {
+            "run_id": run.info.run_id,
+            "experiment_id": run.info.experiment_id,
+            "status": run.info.status,
+            "artifact_uri": run.info.artifact_uri,
+            "start_time": pd.to_datetime(run.info.start_time, unit="ms", utc=True),
+            "end_time": pd.to_datetime(run.info.end_time, unit="ms", utc=True),
+        }
+        row.update({f"metrics.{key}": value for key, value in run.data.metrics.items()})
+        row.update({f"params.{key}": value for key, value in run.data.params.items()})
+        row.update({f"tags.{key}": value for key, value in run.data.tags.items()})
+        if columns is not None:
+            row = {column: row.get(column) for column in ["run_id", *columns]}
+        rows.append(row)
+
+    return pd.DataFrame(rows, columns=None if columns is None else ["run_id", *columns])
+
+
+def iter_sorted_runs(
+    experiment_name: str,
+    order_by: List[str],
+    filter_string: str = "",
+    columns: Optional[List[str]] = None,
+    page_size: int = SEARCH_PAGE_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """Iterate over the sorted runs of an experiment, one page at a time.
+
+    Usage:
+    ```python
+    for page in iter_sorted_runs("best", ["metrics.val_loss ASC"], page_size=100):
+        ...
+    ```
+
+    Args:
+        experiment_name (str): Name of the experiment.
+        order_by (List[str]): MLflow ordering, for example `["metrics.val_loss ASC"]`.
+        filter_string (str, optional): MLflow filter, for example
+            `"params.cnn_name = 'ResNetV2' and attributes.status = 'FINISHED'"`.
+            Defaults to "".
+        columns (Optional[List[str]], optional): Columns to keep besides "run_id".
+            Defaults to None, which keeps all the columns.
+        page_size (int, optional): Number of runs per page. Defaults to
+            SEARCH_PAGE_SIZE.
+
+    Yields:
+        A dataframe per page of runs.
+    """
+    client = MlflowClient()
+    experiment_id = client.get_experiment_by_name(experiment_name).experiment_id
+
+    page_token = None
+    while True:
+        runs = client.search_runs(
+            [experiment_id],
+            filter_string=filter_string,
+            run_view_type=ViewType.ACTIVE_ONLY,
+            max_results=page_size,
+            order_by=order_by,
+            page_token=page_token,
+        )
+        if runs:
+            yield runs_to_dataframe(runs, columns)
+        page_token = runs.token
+        if not page_token:
+            break
+
+
 # https://github.com/GokuMohandas/applied-ml/blob/main/tagifai/utils.py
 def get_sorted_runs(
-    experiment_name: str, order_by: List[str], top_k: Optional[int] = 10
+    experiment_name: str,
+    order_by: List[str],
+    top_k: Optional[int] = 10,
+    filter_string: str = "",
+    columns: Optional[List[str]] = None,
 ) -> pd.DataFrame:
     """Get top_k best runs for a given experiment_name according to given metrics.
 
+    `top_k` is given to the tracking store as `max_results`, so only the top_k
+    runs are fetched, and the filtering is done by the tracking store.
+
     Usage:
     ```python
-    runs = get_sorted_runs(experiment_name="best", order_by=["metrics.val_loss ASC"])
+    runs = get_sorted_runs(
+        experiment_name="best",
+        order_by=["metrics.val_loss ASC"],
+        filter_string="attributes.status = 'FINISHED'",
+        columns=["metrics.val_loss"],
+    )
     ```
 
     Args:
-        experiment_name (str): [description]
-        order_by (List): [description]
-        top_k (Optional[int], optional): [description]. Defaults to 10.
+        experiment_name (str): Name of the experiment.
+        order_by (List[str]): MLflow ordering, for example `["metrics.val_loss ASC"]`.
+        top_k (Optional[int], optional): Number of runs to return, None for all the
+            runs, fetched page by page. Defaults to 10.
+        filter_string (str, optional): MLflow filter. Defaults to "".
+        columns (Optional[List[str]], optional): Columns to keep besides "run_id".
+            Defaults to None, which keeps all the columns.
 
     Returns:
         A dataframe of top_k best runs sorted by given metrics.
     """
-    experiment_id = mlflow.get_experiment_by_name(experiment_name).experiment_id
+    if top_k is None:
+        pages = list(
+            iter_sorted_runs(experiment_name, order_by, filter_string, columns)
+        )
+        if not pages:
+            return runs_to_dataframe([], columns)
+        return pd.concat(pages, ignore_index=True)
+
+    return next(
+        iter_sorted_runs(
+            experiment_name, order_by, filter_string, columns, page_size=top_k
+        ),
+        runs_to_dataframe([], columns),
+    )
+
+
+def get_runs_fingerprint(experiment_dir: Path) -> Tuple[int, float]:
+    """Summarize the state of the runs of an experiment of a local file store.
+
+    MLflow rewrites the `meta.yaml` of a run when its status changes, so a new or
+    a newly finished run changes the fingerprint. Only the `meta.yaml` files are
+    stat-ed, no run is read.
+
+    Args:
+        experiment_dir (Path): Directory of the experiment in the `mlruns` store.
+
+    Returns:
+        The number of runs and the last modification time of their `meta.yaml`.
+    """
+    n_runs = 0
+    last_modification = 0.0
+    with os.scandir(experiment_dir) as entries:
+        for entry in entries:
+            meta = Path(entry.path) / "meta.yaml"
+            if entry.is_dir() and meta.is_file():
+                n_runs += 1
+                last_modification = max(last_modification, meta.stat().st_mtime)
+
+    return n_runs, last_modification
+
+
+def get_changed_runs(
+    experiment_dir: Path, since: float, seen: Collection[str] = ()
+) -> List[str]:
+    """List the runs of an experiment modified since a given time.
+
+    Two runs written in the same tick of the file system clock have the same
+    modification time, so the runs modified at `since` are listed too, except the
+    ones already read at that time.
+
+    Args:
+        experiment_dir (Path): Directory of the experiment in the `mlruns` store.
+        since (float): Modification time, as given by `get_runs_fingerprint`.
+        seen (Collection[str], optional): IDs of the runs read at `since`, as given
+            by `get_last_runs`. Defaults to ().
+
+    Returns:
+        The IDs of the runs whose `meta.yaml` is more recent than `since`, or as
+        recent and not seen.
+    """
+    changed_runs = []
+    for meta in experiment_dir.glob("*/meta.yaml"):
+        run_id = meta.parent.name
+        mtime = meta.stat().st_mtime
+        if mtime > since or (mtime == since and run_id not in seen):
+            changed_runs.append(run_id)
+    return changed_runs
+
 
-    return mlflow.search_runs(
-        experiment_ids=experiment_id,
-        order_by=order_by,
-    )[:top_k]
+def get_last_runs(experiment_dir: Path, last_modification: float) -> List[str]:
+    """List the runs of an experiment modified at its last modification time.
+
+    Args:
+        experiment_dir (Path): Directory of the experiment in the `mlruns` store.
+        last_modification (float): Modification time, as given by
+            `get_runs_fingerprint`.
+
+    Returns:
+        The IDs of the runs whose `meta.yaml` was modified at `last_modification`.
+    """
+    return [
+        meta.parent.name
+        for meta in experiment_dir.glob("*/meta.yaml")
+        if meta.stat().st_mtime == last_modification
+    ]
+
+
+def get_local_store(tracking_uri: Optional[str] = None) -> Optional[Path]:
+    """Give the directory of the tracking store, if it is a local file store.
+
+    Args:
+        tracking_uri (Optional[str], optional): URI of the tracking store. Defaults
+            to the current tracking URI.
+
+    Returns:
+        The root directory of the `mlruns` store, None for a remote store.
+    """
+    uri = urlparse(tracking_uri or mlflow.get_tracking_uri())
+    if uri.scheme not in {"", "file"}:
+        return None
+    return Path(uri.path)
 
 
 def set_log_infos(cfg: DictConfig) -> Tuple[Dict[str, str], str]:
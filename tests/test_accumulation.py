@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.accumulation import accumulate_gradients
+
+
+def linear_model() -> tf.keras.Model:
+    """Returns a small deterministic model.
+
+    Returns:
+        tf.keras.Model: A single dense layer initialized with ones.
+    """
+    inputs = tf.keras.Input((4,))
+    outputs = tf.keras.layers.Dense(2, kernel_initializer="ones")(inputs)
+    return tf.keras.Model(inputs, outputs)
+
+
+@pytest.fixture
+def datas():
+    """Returns a batch of 8 random observations.
+
+    Returns:
+        [type]: Observations and targets.
+    """
+    rng = np.random.default_rng(42)
+    return rng.random((8, 4), dtype=np.float32), rng.random((8, 2), dtype=np.float32)
+
+
+def test_accumulation_counts_optimizer_steps(datas) -> None:
+    """4 micro-batches with 2 accumulation steps give 2 optimizer steps.
+
+    Args:
+        datas ([type]): [description]
+    """
+    model = accumulate_gradients(linear_model(), accumulation_steps=2)
+    model.compile(optimizer="sgd", loss="mse")
+    model.fit(*datas, batch_size=2, epochs=1, shuffle=False, verbose=0)
+
+    assert model.optimizer.iterations.numpy() == 2
+
+
+def test_accumulation_matches_large_batch(datas) -> None:
+    """Accumulating 4 batches of 2 is the same update as one batch of 8.
+
+    Args:
+        datas ([type]): [description]
+    """
+    accumulated = accumulate_gradients(linear_model(), accumulation_steps=4)
+    accumulated.compile(optimizer=tf.keras.optimizers.SGD(0.1), loss="mse")
+    accumulated.fit(*datas, batch_size=2, epochs=1, shuffle=False, verbose=0)
+
+    reference = linear_model()
+    reference.compile(optimizer=tf.keras.optimizers.SGD(0.1), loss="mse")
+    reference.fit(*datas, batch_size=8, epochs=1, shuffle=False, verbose=0)
+
+    for accumulated_weight, reference_weight in zip(
+        accumulated.get_weights(), reference.get_weights()
+    ):
+        np.testing.assert_allclose(accumulated_weight, reference_weight, rtol=1e-5)
@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.active_learning import (
+    MCDropout,
+    TopCandidates,
+    add_mc_dropout,
+    get_scoring_model,
+    get_uncertainty,
+    k_center_greedy,
+    with_mc_dropout,
+)
+
+
+@pytest.fixture
+def probabilities() -> np.ndarray:
+    """Returns the probabilities of a confident, a hesitant and a split prediction.
+
+    Returns:
+        np.ndarray: The probabilities.
+    """
+    return np.array([[0.99, 0.01], [0.7, 0.3], [0.5, 0.5]])
+
+
+@pytest.mark.parametrize("strategy", ["entropy", "margin"])
+def test_get_uncertainty(probabilities: np.ndarray, strategy: str) -> None:
+    """The closer the classes, the higher the uncertainty.
+
+    Args:
+        probabilities (np.ndarray): [description]
+        strategy (str): [description]
+    """
+    uncertainties = get_uncertainty(probabilities, strategy)
+
+    assert list(np.argsort(uncertainties)) == [0, 1, 2]
+
+
+def test_get_uncertainty_unknown(probabilities: np.ndarray) -> None:
+    """An unknown strategy is rejected.
+
+    Args:
+        probabilities (np.ndarray): [description]
+    """
+    with pytest.raises(ValueError):
+        get_uncertainty(probabilities, "variance")
+
+
+def test_top_candidates() -> None:
+    """Only the most uncertain images of all the batches are kept."""
+    candidates = TopCandidates(capacity=3)
+    embeddings = np.eye(4)
+
+    candidates.add(["a", "b", "c", "d"], np.array([0.1, 0.9, 0.5, 0.2]), embeddings)
+    candidates.add(["e", "f"], np.array([0.8, 0.0]), embeddings[:2])
+
+    assert list(candidates.filenames) == ["b", "e", "c"]
+    assert candidates.embeddings.shape == (3, 4)
+    assert candidates.embeddings.dtype == np.float16
+
+
+def test_k_center_greedy() -> None:
+    """Near-duplicates are skipped in favour of distant points."""
+    embeddings = np.array([[1, 0], [0.999, 0.045], [0, 1], [-1, 0]])
+
+    selected = k_center_greedy(embeddings, 3)
+
+    assert list(selected) == [0, 3, 2]
+
+
+def test_with_mc_dropout() -> None:
+    """The averaged predictions are probabilities, one per image."""
+    inputs = tf.keras.Input((8, 8, 3))
+    pooled = tf.keras.layers.GlobalAvgPool2D()(inputs)
+    dropped = tf.keras.layers.Dropout(0.5)(pooled)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(dropped)
+    model = tf.keras.Model(inputs, outputs)
+
+    probabilities = with_mc_dropout(model, 4).predict(np.ones((5, 8, 8, 3)))
+
+    assert probabilities.shape == (5, 2)
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1, atol=1e-5)
+
+
+def test_with_mc_dropout_without_dropout() -> None:
+    """A dropout is added before the head of a model without dropout layer."""
+    inputs = tf.keras.Input((8, 8, 3))
+    pooled = tf.keras.layers.GlobalAvgPool2D()(inputs)
+    logits = tf.keras.layers.Dense(2)(pooled)
+    outputs = tf.keras.layers.Activation("softmax")(logits)
+    model = tf.keras.Model(inputs, outputs)
+
+    dropout_model = add_mc_dropout(model, 0.5)
+    probabilities = with_mc_dropout(model, 4).predict(np.ones((5, 8, 8, 3)))
+
+    assert isinstance(dropout_model.layers[2], MCDropout)
+    assert dropout_model.layers[3] is model.layers[2]
+    assert probabilities.shape == (5, 2)
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1, atol=1e-5)
+
+
+def test_get_scoring_model_single_pass() -> None:
+    """Without MC-dropout and TTA, the layers of the classifier are run once."""
+    inputs = tf.keras.Input((8, 8, 3))
+    features = tf.keras.layers.Conv2D(4, 3)(inputs)
+    pooled = tf.keras.layers.GlobalAvgPool2D()(features)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(pooled)
+    model = tf.keras.Model(inputs, outputs)
+
+    scoring_model = get_scoring_model(model, tta=0, mc_samples=0)
+    probabilities, embeddings = scoring_model.predict_on_batch(np.ones((5, 8, 8, 3)))
+
+    assert len(scoring_model.layers) == len(model.layers)
+    assert probabilities.shape == (5, 2)
+    assert embeddings.shape == (5, 4)
+
+
+def test_add_mc_dropout_without_dense() -> None:
+    """A model without dense layer is rejected."""
+    inputs = tf.keras.Input((8, 8, 3))
+    model = tf.keras.Model(inputs, tf.keras.layers.GlobalAvgPool2D()(inputs))
+
+    with pytest.raises(ValueError):
+        add_mc_dropout(model, 0.5)
@@ -0,0 +1,153 @@
+import os
+import time
+from pathlib import Path
+from typing import Iterator
+
+import mlflow
+import pytest
+from mlflow.tracking import MlflowClient
+
+from src.best_run import BestRunResolver
+
+
+class Store(object):
+    """File store of an experiment, with runs logging a `val_loss`.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self, root: Path) -> None:
+        """Initialization of the store.
+
+        Args:
+            root (Path): Folder of the `mlruns` store.
+        """
+        self.root = root
+        self.client = MlflowClient(tracking_uri=f"file://{root}")
+        self.experiment_id = self.client.create_experiment("test")
+        self.mtime = time.time()
+
+    def add_run(self, val_loss: float, finished: bool = True) -> str:
+        """Create a run.
+
+        Args:
+            val_loss (float): Metric of the run.
+            finished (bool, optional): Terminate the run. Defaults to True.
+
+        Returns:
+            str: The ID of the run.
+        """
+        run_id = self.client.create_run(self.experiment_id).info.run_id
+        self.client.log_metric(run_id, "val_loss", val_loss)
+        if finished:
+            self.client.set_terminated(run_id)
+        self.touch(run_id)
+        return run_id
+
+    def touch(self, run_id: str) -> None:
+        """Give the meta.yaml of a run a modification time later than all others.
+
+        The runs are written in the same second, the file system could give them
+        the same modification time.
+
+        Args:
+            run_id (str): [description]
+        """
+        self.mtime += 10
+        meta = self.root / self.experiment_id / run_id / "meta.yaml"
+        os.utime(meta, (self.mtime, self.mtime))
+
+
+@pytest.fixture
+def store(tmp_path: Path) -> Iterator[Store]:
+    """Returns an empty experiment, the file store being the current tracking URI.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Yields:
+        Iterator[Store]: The store.
+    """
+    previous_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri(f"file://{tmp_path}/mlruns")
+    yield Store(tmp_path / "mlruns")
+    mlflow.set_tracking_uri(previous_uri)
+
+
+@pytest.fixture
+def resolver(store: Store, tmp_path: Path) -> BestRunResolver:
+    """Returns a resolver caching its best runs in the temporary folder.
+
+    Args:
+        store (Store): [description]
+        tmp_path (Path): [description]
+
+    Returns:
+        BestRunResolver: [description]
+    """
+    return BestRunResolver(tmp_path / "best_runs.json")
+
+
+def test_new_better_run(store: Store, resolver: BestRunResolver) -> None:
+    """A new run with a lower metric becomes the best run.
+
+    Args:
+        store (Store): [description]
+        resolver (BestRunResolver): [description]
+    """
+    first_run = store.add_run(0.3)
+    assert resolver.resolve("test") == first_run
+
+    store.add_run(0.5)
+    assert resolver.resolve("test") == first_run
+
+    better_run = store.add_run(0.1)
+    assert resolver.resolve("test") == better_run
+
+
+def test_run_finishing_later(store: Store, resolver: BestRunResolver) -> None:
+    """A run is a candidate only once it has finished.
+
+    Args:
+        store (Store): [description]
+        resolver (BestRunResolver): [description]
+    """
+    first_run = store.add_run(0.3)
+    running = store.add_run(0.1, finished=False)
+    assert resolver.resolve("test") == first_run
+
+    store.client.set_terminated(running)
+    store.touch(running)
+    assert resolver.resolve("test") == running
+
+
+def test_best_run_deleted(store: Store, resolver: BestRunResolver) -> None:
+    """The cached best run is replaced by the next one once deleted.
+
+    Args:
+        store (Store): [description]
+        resolver (BestRunResolver): [description]
+    """
+    second_run = store.add_run(0.3)
+    best_run = store.add_run(0.1)
+    assert resolver.resolve("test") == best_run
+
+    store.client.delete_run(best_run)
+    store.touch(best_run)
+    assert resolver.resolve("test") == second_run
+
+
+def test_no_finished_run(store: Store, resolver: BestRunResolver) -> None:
+    """An experiment without finished run has no best run.
+
+    Args:
+        store (Store): [description]
+        resolver (BestRunResolver): [description]
+    """
+    store.add_run(0.1, finished=False)
+
+    with pytest.raises(ValueError):
+        resolver.resolve("test")
@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import tensorflow as tf
+from tensorflow.core.profiler.protobuf import xplane_pb2
+
+from src.callbacks import StepTimer, get_self_times, summarize_trace
+
+
+@pytest.fixture
+def xplane_path(tmp_path: Path) -> Path:
+    """Returns a small trace with an op containing two other ops.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Returns:
+        Path: The path of the `.xplane.pb` file.
+    """
+    xspace = xplane_pb2.XSpace()
+    plane = xspace.planes.add(name="/host:CPU")
+    names = ["model/conv:Conv2D", "Iterator::Map", "Relu"]
+    for metadata_id, name in enumerate(names):
+        plane.event_metadata[metadata_id].name = name
+    line = plane.lines.add()
+    # Conv2D lasts 10ms and contains a 3ms Map and a 2ms Relu.
+    for metadata_id, offset, duration in [(0, 0, 10), (1, 1, 3), (2, 5, 2)]:
+        line.events.add(
+            metadata_id=metadata_id,
+            offset_ps=offset * 10 ** 9,
+            duration_ps=duration * 10 ** 9,
+        )
+
+    trace_path = tmp_path / "plugins" / "profile" / "run" / "host.xplane.pb"
+    trace_path.parent.mkdir(parents=True)
+    trace_path.write_bytes(xspace.SerializeToString())
+    return trace_path
+
+
+def test_step_timer_summary() -> None:
+    """The step timer measures every step of an epoch and keeps the batches."""
+    inputs = tf.keras.Input((4,))
+    model = tf.keras.Model(inputs, tf.keras.layers.Dense(2)(inputs))
+    model.compile(optimizer="sgd", loss="mse")
+
+    dataset = tf.data.Dataset.from_tensor_slices(
+        (np.random.rand(20, 4), np.random.rand(20, 2))
+    ).batch(5)
+
+    step_timer = StepTimer()
+    model.fit(step_timer.wrap(dataset), epochs=1, verbose=0, callbacks=[step_timer])
+
+    assert len(step_timer.step_times) == 4
+    assert step_timer.batch_sizes == [5, 5, 5, 5]
+
+    summary = step_timer.summary()
+    assert 0 <= summary["input_bound_fraction"] <= 1
+    assert summary["images_per_sec"] > 0
+    assert summary["rss_max_mb"] > 0
+
+
+def test_get_self_times(xplane_path: Path) -> None:
+    """The self-time of an op excludes the ops it contains.
+
+    Args:
+        xplane_path (Path): [description]
+    """
+    self_times = get_self_times(xplane_path)
+
+    assert self_times == pytest.approx(
+        {"Conv2D": 5.0, "Iterator::Map": 3.0, "Relu": 2.0}
+    )
+
+
+def test_summarize_trace(tmp_path: Path, xplane_path: Path) -> None:
+    """The summary lists the ops by decreasing self-time.
+
+    Args:
+        tmp_path (Path): [description]
+        xplane_path (Path): [description]
+    """
+    lines = summarize_trace(tmp_path, top_k=2).splitlines()
+
+    assert len(lines) == 3
+    assert lines[1].startswith("Conv2D")
+    assert lines[2].startswith("Iterator::Map")
@@ -0,0 +1,144 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.embeddings import (
+    IVFIndex,
+    SimilaritySearcher,
+    exact_search,
+    extract_embeddings,
+    get_embedding_model,
+    normalize,
+)
+from src.tensorize import Tensorize
+
+
+@pytest.fixture
+def embeddings() -> np.ndarray:
+    """Returns 1000 normalized random embeddings, as float16.
+
+    Returns:
+        np.ndarray: The embeddings.
+    """
+    rng = np.random.default_rng(42)
+    return normalize(rng.normal(size=(1000, 16))).astype(np.float16)
+
+
+def classifier() -> tf.keras.Model:
+    """Returns a small classifier ending with a global average pooling.
+
+    Returns:
+        tf.keras.Model: The classifier.
+    """
+    inputs = tf.keras.Input((32, 32, 3))
+    features = tf.keras.layers.Conv2D(8, 3)(inputs)
+    pooled = tf.keras.layers.GlobalAvgPool2D()(features)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(pooled)
+    return tf.keras.Model(inputs, outputs)
+
+
+def test_extract_embeddings(tmp_path: Path) -> None:
+    """Embeddings are the normalized outputs of the pooling, in float16.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    embedding_model = get_embedding_model(classifier())
+    ts = Tensorize(n_classes=2, img_shape=(32, 32, 3), random_seed=42)
+    filenames = [str(path) for path in sorted(Path("tests/test_datas").rglob("*.jpg"))]
+
+    extract_embeddings(
+        embedding_model, ts, filenames, tmp_path / "embeddings.npy", batch_size=6
+    )
+    embeddings = np.load(tmp_path / "embeddings.npy", mmap_mode="r")
+
+    assert embeddings.shape == (20, 8)
+    assert embeddings.dtype == np.float16
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-2)
+
+
+def test_exact_search_finds_itself(embeddings: np.ndarray) -> None:
+    """Each embedding is its own nearest neighbour.
+
+    Args:
+        embeddings (np.ndarray): [description]
+    """
+    queries = embeddings[[3, 500, 999]].astype(np.float32)
+    indexes, similarities = exact_search(embeddings, queries, k=5)
+
+    assert indexes[:, 0].tolist() == [3, 500, 999]
+    assert (np.diff(similarities, axis=1) <= 0).all()
+
+
+def test_exact_search_by_blocks(embeddings: np.ndarray, monkeypatch) -> None:
+    """Merging the top-k of blocks gives the top-k of the whole matrix.
+
+    Args:
+        embeddings (np.ndarray): [description]
+        monkeypatch ([type]): [description]
+    """
+    queries = embeddings[:4].astype(np.float32)
+    expected, _ = exact_search(embeddings, queries, k=10)
+    monkeypatch.setattr("src.embeddings.SEARCH_BLOCK", 64)
+    by_blocks, _ = exact_search(embeddings, queries, k=10)
+
+    np.testing.assert_array_equal(by_blocks, expected)
+
+
+def test_ivf_index_recall(embeddings: np.ndarray, tmp_path: Path) -> None:
+    """Probing all the lists gives the exact neighbours, after a save and load.
+
+    Args:
+        embeddings (np.ndarray): [description]
+        tmp_path (Path): [description]
+    """
+    IVFIndex.build(embeddings, n_lists=8).save(tmp_path / "index.npz")
+    index = IVFIndex.load(tmp_path / "index.npz")
+    queries = embeddings[:4].astype(np.float32)
+
+    exact, _ = exact_search(embeddings, queries, k=5)
+    approximate, _ = index.search(embeddings, queries, k=5, n_probe=8)
+
+    np.testing.assert_array_equal(approximate, exact)
+    assert index.offsets[-1] == len(embeddings)
+
+
+def test_searcher_finds_itself(tmp_path: Path) -> None:
+    """An extracted image is its own most similar patch, with or without index.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    embedding_model = get_embedding_model(classifier())
+    ts = Tensorize(n_classes=2, img_shape=(32, 32, 3), random_seed=42)
+    filenames = [str(path) for path in sorted(Path("tests/test_datas").rglob("*.jpg"))]
+    extract_embeddings(embedding_model, ts, filenames, tmp_path / "embeddings.npy")
+    embeddings = np.load(tmp_path / "embeddings.npy", mmap_mode="r")
+    index = IVFIndex.build(embeddings, n_lists=4)
+
+    for searcher in (
+        SimilaritySearcher(embeddings, np.array(filenames), embedding_model),
+        SimilaritySearcher(embeddings, np.array(filenames), embedding_model, index),
+    ):
+        by_image = searcher.search(Path(filenames[5]), k=3)
+        by_vector = searcher.search(embeddings[5].astype(np.float32), k=3)
+
+        assert by_image[0][0] == filenames[5]
+        assert by_image[0][1] == pytest.approx(1, abs=1e-2)
+        assert by_vector[0][0] == filenames[5]
+
+
+def test_searcher_without_model(embeddings: np.ndarray) -> None:
+    """A searcher without embedding model only searches embeddings.
+
+    Args:
+        embeddings (np.ndarray): [description]
+    """
+    filenames = np.array([f"{idx}.jpg" for idx in range(len(embeddings))])
+    searcher = SimilaritySearcher(embeddings, filenames)
+
+    assert searcher.search(embeddings[3].astype(np.float32), k=1)[0][0] == "3.jpg"
+    with pytest.raises(ValueError):
+        searcher.search(Path("3.jpg"))
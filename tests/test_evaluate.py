@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.evaluate import StreamingMetrics, classify, encode_labels
+
+
+@pytest.fixture
+def predictions():
+    """Returns labels and probabilities of 100 images of 2 classes.
+
+    Returns:
+        [type]: Labels and probabilities.
+    """
+    rng = np.random.default_rng(42)
+    labels = rng.integers(0, 2, 100)
+    positive = np.clip(labels * 0.6 + rng.random(100) * 0.4, 0, 1)
+    return labels, np.stack([1 - positive, positive], axis=1)
+
+
+def test_classify_with_threshold() -> None:
+    """The crack class is predicted above the threshold only."""
+    probabilities = np.array([[0.7, 0.3], [0.4, 0.6]])
+
+    assert classify(probabilities, 1, None).tolist() == [0, 1]
+    assert classify(probabilities, 1, 0.2).tolist() == [1, 1]
+    assert classify(probabilities, 1, 0.9).tolist() == [0, 0]
+
+
+def test_encode_labels() -> None:
+    """The labels are encoded in the order of the classes, unknown ones rejected."""
+    class_names = ["Negative", "Positive"]
+    labels = encode_labels(pd.Series(["Positive", "Negative"]), class_names)
+
+    assert list(labels) == [1, 0]
+    with pytest.raises(ValueError, match="Crack"):
+        encode_labels(pd.Series(["Positive", "Crack"]), class_names)
+
+
+def test_streaming_matches_single_batch(predictions) -> None:
+    """Metrics accumulated batch by batch equal the metrics of a single batch.
+
+    Args:
+        predictions ([type]): [description]
+    """
+    labels, probabilities = predictions
+    streamed = StreamingMetrics(["Negative", "Positive"], 1, 0.5)
+    for start in range(0, 100, 7):
+        streamed.update(labels[start : start + 7], probabilities[start : start + 7])
+    single = StreamingMetrics(["Negative", "Positive"], 1, 0.5)
+    single.update(labels, probabilities)
+
+    np.testing.assert_array_equal(streamed.confusion, single.confusion)
+    assert streamed.summary() == single.summary()
+    assert streamed.confusion.sum() == 100
+
+
+def test_separable_scores_give_perfect_auc(predictions) -> None:
+    """Scores of the positives all above the negatives give AUCs of 1.
+
+    Args:
+        predictions ([type]): [description]
+    """
+    labels, _ = predictions
+    positive = labels * 0.5 + 0.25
+    metrics = StreamingMetrics(["Negative", "Positive"], 1, 0.5)
+    metrics.update(labels, np.stack([1 - positive, positive], axis=1))
+    summary = metrics.summary()
+
+    assert summary["accuracy"] == 1
+    assert summary["Positive_roc_auc"] == pytest.approx(1)
+    assert summary["Positive_pr_auc"] == pytest.approx(1)
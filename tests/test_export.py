@@ -0,0 +1,58 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.export import export
+from src.tensorize import Tensorize
+
+
+@pytest.fixture
+def ts() -> Tensorize:
+    """Returns a pipeline of 32x32 images.
+
+    Returns:
+        Tensorize: The pipeline.
+    """
+    return Tensorize(n_classes=2, img_shape=[32, 32, 3], random_seed=42)
+
+
+@pytest.fixture
+def model() -> tf.keras.Model:
+    """Returns a tiny classifier of 32x32 images.
+
+    Returns:
+        tf.keras.Model: The classifier.
+    """
+    inputs = tf.keras.Input((32, 32, 3))
+    flat = tf.keras.layers.Flatten()(inputs)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(flat)
+    return tf.keras.Model(inputs, outputs)
+
+
+def test_exported_model_takes_jpeg_bytes(
+    model: tf.keras.Model, ts: Tensorize, tmp_path: Path
+) -> None:
+    """The signature gives the predictions of the images decoded by Tensorize.
+
+    Args:
+        model (tf.keras.Model): [description]
+        ts (Tensorize): [description]
+        tmp_path (Path): [description]
+    """
+    filenames = [
+        "tests/test_datas/Negative/00001.jpg",
+        "tests/test_datas/Positive/00001.jpg",
+    ]
+    export(model, ts, ["Negative", "Positive"], tmp_path / "export")
+
+    serve = tf.saved_model.load(str(tmp_path / "export")).signatures[
+        "serving_default"
+    ]
+    outputs = serve(images=tf.constant([Path(name).read_bytes() for name in filenames]))
+
+    expected = model(tf.stack([ts.parse_image(name) for name in filenames]))
+    np.testing.assert_allclose(outputs["probabilities"], expected, rtol=1e-5)
+    assert outputs["label_names"].numpy().tolist() == [b"Negative", b"Positive"]
+    assert outputs["labels"].shape == (2,)
@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.heatmap import box_sum, extract_tiles, get_regions, predict_tiles, stitch
+
+
+@pytest.fixture
+def image_path(tmp_path: Path) -> Path:
+    """Returns a 96x160 JPEG image, white on its right half.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Returns:
+        Path: Path of the image.
+    """
+    pixels = np.zeros((96, 160, 3), np.uint8)
+    pixels[:, 80:] = 255
+    path = tmp_path / "surface.jpg"
+    tf.io.write_file(str(path), tf.io.encode_jpeg(pixels, quality=100))
+    return path
+
+
+def brightness_model() -> tf.keras.Model:
+    """Returns a model whose second output is the mean brightness of the tile.
+
+    Returns:
+        tf.keras.Model: The model, for tiles of any size.
+    """
+    inputs = tf.keras.Input((None, None, 3))
+    brightness = tf.keras.layers.GlobalAveragePooling2D()(inputs)[:, :1]
+    outputs = tf.keras.layers.Concatenate()([1 - brightness, brightness])
+    return tf.keras.Model(inputs, outputs)
+
+
+def test_extract_tiles() -> None:
+    """Tiles are the windows of the image at every stride."""
+    strip = tf.reshape(tf.range(6 * 8, dtype=tf.float32), (6, 8, 1))
+    tiles = extract_tiles(strip, tile_size=4, stride=2)
+
+    assert tiles.shape == (2, 3, 4, 4, 1)
+    np.testing.assert_array_equal(tiles[1, 2], strip[2:6, 4:8])
+
+
+def test_box_sum() -> None:
+    """The box sum is the full convolution with a square of ones."""
+    grid = np.arange(12, dtype=float).reshape(3, 4)
+    summed = box_sum(grid, 2)
+
+    padded = np.pad(grid, 1)
+    expected = np.array(
+        [[padded[i : i + 2, j : j + 2].sum() for j in range(5)] for i in range(4)]
+    )
+    np.testing.assert_allclose(summed, expected)
+
+
+def test_stitch_averages_overlapping_tiles() -> None:
+    """Each cell is the mean of the tiles covering it."""
+    heatmap = stitch(np.array([[0.0, 1.0]]), tile_size=4, stride=2)
+
+    np.testing.assert_allclose(heatmap, [[0, 0.5, 1], [0, 0.5, 1]])
+
+
+def test_get_regions() -> None:
+    """Connected cells above the threshold give one bounding box."""
+    heatmap = np.zeros((4, 4))
+    heatmap[1:3, 2] = 0.9
+    heatmap[0, 0] = 0.8
+
+    regions = get_regions(heatmap, threshold=0.5, cell_size=10)
+
+    assert len(regions) == 2
+    assert regions[1] == {
+        "x_min": 20,
+        "y_min": 10,
+        "x_max": 30,
+        "y_max": 30,
+        "max_probability": 0.9,
+    }
+
+
+def test_predict_tiles_in_strips(image_path: Path) -> None:
+    """Strips give the same grid of tiles as the whole image.
+
+    Args:
+        image_path (Path): [description]
+    """
+    model = brightness_model()
+    whole = predict_tiles(model, image_path, 32, 16, 1, rows_per_strip=100)
+    strips = predict_tiles(model, image_path, 32, 16, 1, rows_per_strip=2)
+
+    assert whole.shape == (5, 9)
+    np.testing.assert_allclose(whole, strips, atol=1e-5)
+    assert whole[:, 0].max() < 0.1
+    assert whole[:, -1].min() > 0.9
@@ -4,6 +4,7 @@ import pandas as pd
 import pytest
 
 from src.make_dataset import (
+    assign_folds,
     create_train_val_test_datasets,
     get_files_paths,
     get_images_paths_and_labels,
@@ -84,3 +85,19 @@ def test_create_train_val_test_datasets(df) -> None:
     assert 2 <= len(datasets_components[3]) <= 3
     assert 2 <= len(datasets_components[4]) <= 3
     assert 2 <= len(datasets_components[5]) <= 3
+
+
+def test_assign_folds(df) -> None:
+    """Each fold gets the same number of images of each label.
+
+    Args:
+        df ([type]): [description]
+    """
+    labels = df["label"].tolist()
+
+    folds = assign_folds(labels, 5)
+
+    assert sorted(set(folds)) == [0, 1, 2, 3, 4]
+    for fold in range(5):
+        fold_labels = [label for label, idx in zip(labels, folds) if idx == fold]
+        assert sorted(fold_labels) == ["Negative", "Negative", "Positive", "Positive"]
@@ -0,0 +1,92 @@
+from pathlib import Path
+from typing import List
+
+import pytest
+import tensorflow as tf
+from mlflow.entities import Metric
+from mlflow.tracking import MlflowClient
+
+from src.metric_logger import MAX_METRICS_PER_BATCH, BufferedMetricLogger
+
+
+class RecordingClient(object):
+    """Stand-in of `MlflowClient` keeping the logged batches in memory."""
+
+    def __init__(self) -> None:
+        """Initialization of the client."""
+        self.batches: List[List[Metric]] = []
+
+    def log_batch(self, run_id: str, metrics: List[Metric]) -> None:
+        """Record a batch.
+
+        Args:
+            run_id (str): [description]
+            metrics (List[Metric]): [description]
+        """
+        self.batches.append(metrics)
+
+
+@pytest.fixture
+def client() -> RecordingClient:
+    """Returns a recording client.
+
+    Returns:
+        RecordingClient: [description]
+    """
+    return RecordingClient()
+
+
+def test_metrics_are_buffered(client: RecordingClient) -> None:
+    """Nothing is sent before a flush, everything is sent in one batch after.
+
+    Args:
+        client (RecordingClient): [description]
+    """
+    metric_logger = BufferedMetricLogger("run", flush_interval=3600, client=client)
+    metric_logger.log_metrics({"loss": 0.5, "acc": 0.9}, step=0)
+    metric_logger.log_metrics({"loss": 0.4, "acc": 0.95}, step=1)
+
+    assert not client.batches
+
+    metric_logger.flush()
+    assert len(client.batches) == 1
+    assert [metric.step for metric in client.batches[0]] == [0, 0, 1, 1]
+
+    metric_logger.close()
+
+
+def test_close_flushes_in_limited_batches(client: RecordingClient) -> None:
+    """Closing the logger flushes the buffer, with at most 1000 metrics per batch.
+
+    Args:
+        client (RecordingClient): [description]
+    """
+    with BufferedMetricLogger("run", flush_interval=3600, client=client) as logger:
+        for step in range(MAX_METRICS_PER_BATCH + 1):
+            logger.log_metrics({"loss": 0.1}, step=step)
+
+    assert [len(batch) for batch in client.batches] == [MAX_METRICS_PER_BATCH, 1]
+
+
+def test_log_fit_params(tmp_path: Path) -> None:
+    """A buffered run carries the params and the summary autolog would log.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    client = MlflowClient(tracking_uri=f"file://{tmp_path}/mlruns")
+    run_id = client.create_run(client.create_experiment("test")).info.run_id
+    inputs = tf.keras.Input((4,))
+    model = tf.keras.Model(inputs, tf.keras.layers.Dense(2)(inputs))
+    model.compile(optimizer=tf.keras.optimizers.Adam(0.01), loss="mse")
+
+    with BufferedMetricLogger(run_id, flush_interval=3600, client=client) as logs:
+        logs.log_fit_params(model, epochs=3, batch_size=32)
+
+    params = client.get_run(run_id).data.params
+    assert params["epochs"] == "3"
+    assert params["batch_size"] == "32"
+    assert params["optimizer_name"] == "Adam"
+    assert float(params["opt_learning_rate"]) == pytest.approx(0.01)
+    artifacts = [artifact.path for artifact in client.list_artifacts(run_id)]
+    assert "model_summary.txt" in artifacts
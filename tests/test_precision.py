@@ -0,0 +1,51 @@
+from pathlib import Path
+
+import pytest
+import tensorflow as tf
+
+from src.precision import get_cpu_flags, set_precision_policy, wrap_optimizer
+
+
+def test_get_cpu_flags(tmp_path: Path) -> None:
+    """The flags line of a cpuinfo file is parsed as a set.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    cpuinfo = tmp_path / "cpuinfo"
+    cpuinfo.write_text("processor\t: 0\nflags\t\t: fpu avx2 avx512_bf16\n")
+
+    assert get_cpu_flags(cpuinfo) == {"fpu", "avx2", "avx512_bf16"}
+    assert get_cpu_flags(tmp_path / "missing") == set()
+
+
+@pytest.mark.parametrize(
+    "name,policy_name,loss_scaled",
+    [
+        ("float32", "float32", False),
+        ("bfloat16", "mixed_bfloat16", False),
+        ("mixed_float16", "mixed_float16", True),
+    ],
+)
+def test_set_precision_policy(name: str, policy_name: str, loss_scaled: bool) -> None:
+    """Loss scaling is only added for float16 computations.
+
+    Args:
+        name (str): [description]
+        policy_name (str): [description]
+        loss_scaled (bool): [description]
+    """
+    policy = set_precision_policy(name)
+    optimizer = wrap_optimizer(tf.keras.optimizers.SGD(), policy)
+    tf.keras.mixed_precision.set_global_policy("float32")
+
+    assert policy.name == policy_name
+    assert isinstance(
+        optimizer, tf.keras.mixed_precision.LossScaleOptimizer
+    ) == loss_scaled
+
+
+def test_set_precision_policy_unknown() -> None:
+    """An unknown precision name raises an error."""
+    with pytest.raises(ValueError):
+        set_precision_policy("float8")
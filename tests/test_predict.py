@@ -0,0 +1,133 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+import tensorflow as tf
+
+from src.predict import (
+    get_class_index,
+    get_shards,
+    iter_images,
+    list_images,
+    predict_shard,
+    snapshot_listing,
+    write_shard,
+)
+from src.tensorize import Tensorize
+
+
+@pytest.fixture
+def ts() -> Tensorize:
+    """Returns a small inference pipeline.
+
+    Returns:
+        Tensorize: Pipeline with 32x32 images.
+    """
+    return Tensorize(n_classes=2, img_shape=(32, 32, 3), random_seed=42)
+
+
+@pytest.fixture
+def model() -> tf.keras.Model:
+    """Returns a tiny classifier of 32x32 images.
+
+    Returns:
+        tf.keras.Model: The classifier.
+    """
+    inputs = tf.keras.Input((32, 32, 3))
+    pooled = tf.keras.layers.GlobalAveragePooling2D()(inputs)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(pooled)
+    return tf.keras.Model(inputs, outputs)
+
+
+def test_list_images_of_directory_and_manifest() -> None:
+    """A folder and its manifest give the same images."""
+    from_directory = list_images(Path("tests/test_datas"))
+    from_manifest = list_images(Path("tests/test_datas/test_datas.csv"))
+
+    assert len(from_directory) == 20
+    assert sorted(from_manifest) == from_directory
+
+
+def test_get_shards() -> None:
+    """The last shard holds the remaining images."""
+    shards = list(get_shards([str(idx) for idx in range(7)], shard_size=3))
+
+    assert [len(shard) for shard in shards] == [3, 3, 1]
+
+
+def test_get_class_index() -> None:
+    """An unknown class name is rejected, with the valid names."""
+    class_names = ["Negative", "Positive"]
+
+    assert get_class_index(class_names, "Positive") == 1
+    with pytest.raises(ValueError, match="Negative"):
+        get_class_index(class_names, "Postive")
+
+
+def test_shards_of_streamed_manifest() -> None:
+    """A manifest read in chunks gives the same shards as the full listing."""
+    manifest = Path("tests/test_datas/test_datas.csv")
+    streamed = get_shards(iter_images(manifest, chunk_size=3), shard_size=7)
+
+    assert list(streamed) == list(get_shards(list_images(manifest), shard_size=7))
+
+
+def test_snapshot_listing_on_resume(tmp_path: Path) -> None:
+    """A resume uses the listing of the first run, with the same shard size.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    source = tmp_path / "images"
+    source.mkdir()
+    for idx in range(3):
+        (source / f"{idx}.jpg").touch()
+    output_dir = tmp_path / "predictions"
+    output_dir.mkdir()
+
+    listing, n_images = snapshot_listing(source, output_dir, shard_size=2)
+    (source / "new.jpg").touch()
+    resumed_listing, resumed_n_images = snapshot_listing(source, output_dir, 2)
+
+    assert resumed_listing == listing
+    assert n_images == resumed_n_images == 3
+    assert list_images(listing) == [str(source / f"{idx}.jpg") for idx in range(3)]
+    with pytest.raises(ValueError):
+        snapshot_listing(source, output_dir, shard_size=4)
+
+
+def test_snapshot_listing_without_listing(tmp_path: Path) -> None:
+    """Shards written without a listing can't be resumed.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    (tmp_path / "part-00000.csv").touch()
+
+    with pytest.raises(ValueError):
+        snapshot_listing(Path("tests/test_datas"), tmp_path, shard_size=2)
+
+
+def test_predict_shard(model: tf.keras.Model, ts: Tensorize, tmp_path: Path) -> None:
+    """Predictions keep the order of the images and are written as csv.
+
+    Args:
+        model (tf.keras.Model): [description]
+        ts (Tensorize): [description]
+        tmp_path (Path): [description]
+    """
+    filenames = list_images(Path("tests/test_datas"))[:5]
+    predictions = predict_shard(
+        model, ts, filenames, ["Negative", "Positive"], batch_size=2, prefetch=1
+    )
+    write_shard(predictions, tmp_path / "part-00000.csv")
+    written = pd.read_csv(tmp_path / "part-00000.csv")
+
+    assert list(written.columns) == [
+        "filename",
+        "prediction",
+        "prob_Negative",
+        "prob_Positive",
+    ]
+    assert written["filename"].tolist() == filenames
+    assert not list(tmp_path.glob("*.tmp"))
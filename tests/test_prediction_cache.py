@@ -0,0 +1,94 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.prediction_cache import PredictionCache, hash_files, predict_with_cache
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> PredictionCache:
+    """Returns an empty cache.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Returns:
+        PredictionCache: The cache.
+    """
+    return PredictionCache(tmp_path / "predictions.sqlite")
+
+
+def test_hash_files_depends_on_content_only(tmp_path: Path) -> None:
+    """A copy of an image has the same hash as the image.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    image = "tests/test_datas/Negative/00001.jpg"
+    copy = str(tmp_path / "copy.jpg")
+    shutil.copy(image, copy)
+
+    hashes = hash_files([image, copy, "tests/test_datas/Negative/00002.jpg"])
+
+    assert hashes[0] == hashes[1]
+    assert hashes[0] != hashes[2]
+
+
+def test_put_and_get(cache: PredictionCache) -> None:
+    """Predictions are found for the same model and preprocessing only.
+
+    Args:
+        cache (PredictionCache): [description]
+    """
+    probabilities = np.array([[0.1, 0.9], [0.8, 0.2]], dtype=np.float32)
+    cache.put_many(["a", "b"], "run", "prep", probabilities)
+
+    found = cache.get_many(["a", "b", "c"], "run", "prep")
+
+    assert sorted(found) == ["a", "b"]
+    np.testing.assert_array_equal(found["b"], probabilities[1])
+    assert cache.get_many(["a"], "other_run", "prep") == {}
+    assert cache.size == probabilities.nbytes
+
+
+def test_predict_with_cache_only_predicts_misses(cache: PredictionCache) -> None:
+    """The second pass over the same images doesn't call the model.
+
+    Args:
+        cache (PredictionCache): [description]
+    """
+    filenames = [
+        "tests/test_datas/Negative/00001.jpg",
+        "tests/test_datas/Positive/00001.jpg",
+    ]
+    calls = []
+
+    def predict_fn(files):
+        calls.append(files)
+        return np.full((len(files), 2), 0.5, dtype=np.float32)
+
+    first = predict_with_cache(cache, filenames, "run", "prep", predict_fn)
+    second = predict_with_cache(cache, filenames, "run", "prep", predict_fn)
+
+    assert calls == [filenames]
+    np.testing.assert_array_equal(first, second)
+
+
+def test_eviction_removes_least_recently_used(tmp_path: Path) -> None:
+    """The predictions not read recently are evicted first.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    cache = PredictionCache(tmp_path / "predictions.sqlite", max_size_mb=80 / 2 ** 20)
+    row = np.zeros((1, 2), dtype=np.float32)
+    for idx in range(10):
+        cache.put_many([str(idx)], "run", "prep", row)
+    cache.get_many(["0"], "run", "prep")
+    cache.put_many(["10"], "run", "prep", row)
+
+    assert cache.size <= 72
+    assert "0" in cache.get_many(["0"], "run", "prep")
+    assert cache.get_many(["1"], "run", "prep") == {}
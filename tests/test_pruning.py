@@ -0,0 +1,109 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.model.resnet import get_cnn
+from src.model.wide_resnet import get_cnn as get_wide_cnn
+from src.pruning import (
+    ChannelGroups,
+    count_flops,
+    get_finetune_overrides,
+    load_pruned_cnn,
+    prune_model,
+)
+
+
+@pytest.fixture
+def model() -> tf.keras.Model:
+    """Returns a small ResNet.
+
+    Returns:
+        tf.keras.Model: A ResNetV2 from `src.model.resnet` with small images.
+    """
+    return get_cnn(img_shape=[32, 32, 3], n_classes=2, repets=2)
+
+
+def test_channel_groups_ties_residual_connections(model: tf.keras.Model) -> None:
+    """The two inputs of every `Add` layer must share the same channel group.
+
+    Args:
+        model (tf.keras.Model): [description]
+    """
+    groups = ChannelGroups(model)
+
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.Add):
+            inputs = groups.layer_inputs[layer.name]
+            assert groups.group(inputs[0]) == groups.group(inputs[1])
+
+
+@pytest.mark.parametrize("criterion", ["l1", "bn_gamma"])
+def test_prune_model_is_smaller(model: tf.keras.Model, criterion: str) -> None:
+    """The pruned model has less parameters and FLOPs but the same outputs shape.
+
+    Args:
+        model (tf.keras.Model): [description]
+        criterion (str): [description]
+    """
+    pruned = prune_model(model, ratio=0.5, criterion=criterion)
+
+    assert pruned.count_params() < model.count_params()
+    assert count_flops(pruned) < count_flops(model)
+
+    images = np.random.rand(4, 32, 32, 3)
+    assert pruned.predict(images).shape == (4, 2)
+
+
+def test_prune_model_without_ratio_keeps_predictions(model: tf.keras.Model) -> None:
+    """Pruning with a zero ratio must give back the same network.
+
+    Args:
+        model (tf.keras.Model): [description]
+    """
+    pruned = prune_model(model, ratio=0)
+    images = np.random.rand(4, 32, 32, 3)
+
+    assert pruned.count_params() == model.count_params()
+    np.testing.assert_allclose(
+        pruned.predict(images), model.predict(images), rtol=1e-5, atol=1e-6
+    )
+
+
+def test_prune_wide_resnet() -> None:
+    """The wide ResNet, with its convolutional shortcuts, can be pruned too."""
+    wide = get_wide_cnn(img_shape=[32, 32, 3], n_classes=2, width_factor=2, repets=1)
+    pruned = prune_model(wide, ratio=0.5)
+
+    assert pruned.count_params() < wide.count_params()
+
+
+def test_finetune_overrides_of_grayscale_model() -> None:
+    """The fine-tuning datas follow the shape and the classes of the model."""
+    grayscale = get_cnn(img_shape=[32, 32, 1], n_classes=3, repets=1)
+
+    overrides = get_finetune_overrides(grayscale, "pruned_0")
+
+    assert overrides == [
+        "datas.n_classes=3",
+        "datas.grayscale=true",
+        "datas.img_shape=[32,32,1]",
+        "datasets.params.img_shape=[32,32,1]",
+        "mlflow.run_name=pruned_0",
+    ]
+
+
+def test_load_pruned_cnn_checks_shape(model: tf.keras.Model, tmp_path: Path) -> None:
+    """A pruned model can't be fine-tuned on images of another shape.
+
+    Args:
+        model (tf.keras.Model): [description]
+        tmp_path (Path): [description]
+    """
+    model_path = str(tmp_path / "pruned.h5")
+    prune_model(model, ratio=0.5).save(model_path)
+
+    assert load_pruned_cnn(model_path, 2, [32, 32, 3]).count_params() > 0
+    with pytest.raises(ValueError):
+        load_pruned_cnn(model_path, 2, [32, 32, 1])
@@ -0,0 +1,102 @@
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.read_ahead import ReadAheadCache, ThrottledReader
+from src.tensorize import Tensorize
+
+
+@pytest.fixture
+def filenames() -> np.ndarray:
+    """Returns the paths of the 20 test images, as bytes.
+
+    Returns:
+        np.ndarray: The paths.
+    """
+    df = pd.read_csv("tests/test_datas/test_datas.csv")
+    return df["filename"].str.encode("utf-8").to_numpy()
+
+
+def test_hits_and_misses(tmp_path: Path, filenames: np.ndarray) -> None:
+    """The second read of a file comes from the local cache.
+
+    Args:
+        tmp_path (Path): [description]
+        filenames (np.ndarray): [description]
+    """
+    reader = ThrottledReader(latency_ms=1)
+    read_ahead = ReadAheadCache(tmp_path, reader=reader)
+
+    first = read_ahead.read_many(filenames)
+    second = read_ahead.read_many(filenames)
+    statistics = read_ahead.statistics()
+
+    assert list(first) == list(second)
+    assert first[0] == Path(filenames[0].decode()).read_bytes()
+    assert reader.n_reads == 20
+    assert statistics["hits"] == statistics["misses"] == 20
+    assert statistics["remote_mb"] == pytest.approx(statistics["local_mb"])
+
+
+def test_lru_eviction(tmp_path: Path, filenames: np.ndarray) -> None:
+    """The cache stays under its size, evicting the least recently used files.
+
+    Args:
+        tmp_path (Path): [description]
+        filenames (np.ndarray): [description]
+    """
+    file_size = max(len(Path(name.decode()).read_bytes()) for name in filenames)
+    read_ahead = ReadAheadCache(
+        tmp_path, max_size_mb=5.5 * file_size / 2 ** 20, n_workers=1
+    )
+
+    read_ahead.read_many(filenames[:10])
+    read_ahead.read(filenames[5].decode())
+    read_ahead.read_many(filenames[10:14])
+
+    assert read_ahead.size <= read_ahead.max_size
+    assert read_ahead.size == sum(path.stat().st_size for path in tmp_path.iterdir())
+    assert read_ahead.statistics()["hits"] == 1
+    read_ahead.read(filenames[5].decode())
+    assert read_ahead.statistics()["hits"] == 2
+
+
+def test_parallel_reads(tmp_path: Path, filenames: np.ndarray) -> None:
+    """The reads of a window overlap, instead of waiting for each other.
+
+    Args:
+        tmp_path (Path): [description]
+        filenames (np.ndarray): [description]
+    """
+    read_ahead = ReadAheadCache(
+        tmp_path, n_workers=20, reader=ThrottledReader(latency_ms=100)
+    )
+
+    start = time.perf_counter()
+    read_ahead.read_many(filenames)
+
+    assert time.perf_counter() - start < 1
+
+
+def test_tensorize_read_ahead(tmp_path: Path) -> None:
+    """The images read through the cache are the same as the direct ones.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    filenames = pd.read_csv("tests/test_datas/test_datas.csv")["filename"].tolist()
+    read_ahead = ReadAheadCache(tmp_path, window=8, reader=ThrottledReader(1))
+    direct = Tensorize(n_classes=2, img_shape=(32, 32, 3), random_seed=42)
+    cached = Tensorize(
+        n_classes=2, img_shape=(32, 32, 3), random_seed=42, read_ahead=read_ahead
+    )
+
+    for expected, images in zip(
+        direct.create_inference_dataset(filenames, 6, 1),
+        cached.create_inference_dataset(filenames, 6, 1),
+    ):
+        np.testing.assert_allclose(images.numpy(), expected.numpy())
+    assert read_ahead.statistics()["misses"] == 20
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import pytest
+from mlflow.tracking import MlflowClient
+
+from src.run_index import RunIndex
+
+
+@pytest.fixture
+def tracking_uri(tmp_path: Path) -> str:
+    """Returns a file store with an experiment of three runs.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Returns:
+        str: The URI of the file store.
+    """
+    uri = f"file://{tmp_path}/mlruns"
+    client = MlflowClient(tracking_uri=uri)
+    experiment_id = client.create_experiment("test")
+    for val_loss, cnn_name in [(0.3, "ResNetV2"), (0.1, "MobileNetV2"), (0.2, "VGG")]:
+        run_id = client.create_run(experiment_id).info.run_id
+        client.log_metric(run_id, "val_loss", val_loss)
+        client.log_param(run_id, "cnn_name", cnn_name)
+        client.set_terminated(run_id)
+
+    return uri
+
+
+def test_leaderboard(tracking_uri: str, tmp_path: Path) -> None:
+    """The runs are sorted by the metric, with only the asked columns.
+
+    Args:
+        tracking_uri (str): [description]
+        tmp_path (Path): [description]
+    """
+    index = RunIndex("test", tmp_path / "index.sqlite", tracking_uri)
+    index.refresh()
+    leaderboard = index.leaderboard(
+        "metrics.val_loss", top_k=2, columns=["params.cnn_name"]
+    )
+
+    assert list(leaderboard.columns) == [
+        "run_id",
+        "metrics.val_loss",
+        "params.cnn_name",
+    ]
+    assert list(leaderboard["metrics.val_loss"]) == [0.1, 0.2]
+    assert list(leaderboard["params.cnn_name"]) == ["MobileNetV2", "VGG"]
+
+
+def test_refresh_is_incremental(tracking_uri: str, tmp_path: Path) -> None:
+    """A second refresh only reads the new runs.
+
+    Args:
+        tracking_uri (str): [description]
+        tmp_path (Path): [description]
+    """
+    index = RunIndex("test", tmp_path / "index.sqlite", tracking_uri)
+
+    assert index.refresh() == 3
+    assert index.refresh() == 0
+
+    client = MlflowClient(tracking_uri=tracking_uri)
+    run_id = client.create_run(index.experiment_id).info.run_id
+    client.log_metric(run_id, "val_loss", 0.05)
+    client.set_terminated(run_id)
+
+    assert index.refresh() == 1
+    assert index.leaderboard("metrics.val_loss", top_k=1)["run_id"][0] == run_id
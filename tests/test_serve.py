@@ -0,0 +1,130 @@
+import socket
+import threading
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from src.serve import LatencyStats, MicroBatcher, get_handler
+from src.tensorize import Tensorize
+
+
+class RecordingModel(object):
+    """Fake model recording the size of the batches it receives.
+
+    Args:
+        object (object): The base class of the class hierarchy, used only to enforce
+            WPS306. See https://wemake-python-stylegui.de/en/latest/pages/usage/
+            violations/consistency.html#consistency.
+    """
+
+    def __init__(self) -> None:
+        """Initialization of the fake model."""
+        self.batch_sizes = []
+
+    def __call__(self, images: np.ndarray) -> np.ndarray:
+        """Returns the mean of each image as its probability.
+
+        Args:
+            images (np.ndarray): Batch of images.
+
+        Returns:
+            np.ndarray: One probability per image.
+        """
+        self.batch_sizes.append(len(images))
+        return images.reshape(len(images), -1).mean(axis=1)
+
+
+@pytest.fixture
+def model() -> RecordingModel:
+    """Returns a fake model.
+
+    Returns:
+        RecordingModel: The fake model.
+    """
+    return RecordingModel()
+
+
+def test_micro_batcher_groups_concurrent_requests(model: RecordingModel) -> None:
+    """A burst of requests is scored in batches, each image gets its own result.
+
+    Args:
+        model (RecordingModel): [description]
+    """
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=200)
+    barrier = threading.Barrier(16)
+    results = {}
+
+    def send(idx: int) -> None:
+        barrier.wait()
+        results[idx] = batcher.submit(np.full((2, 2), idx, np.float32)).result()
+
+    threads = [threading.Thread(target=send, args=(idx,)) for idx in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    batcher.close()
+
+    assert results == {idx: idx for idx in range(16)}
+    assert sum(model.batch_sizes) == 16
+    assert max(model.batch_sizes) <= 8
+    assert len(model.batch_sizes) < 16
+
+
+def test_micro_batcher_forwards_model_errors() -> None:
+    """An error of the model is raised by the futures of the batch."""
+
+    def failing_model(images: np.ndarray) -> np.ndarray:
+        raise RuntimeError("model failure")
+
+    batcher = MicroBatcher(failing_model, max_wait_ms=1)
+    with pytest.raises(RuntimeError):
+        batcher.submit(np.zeros((2, 2))).result(timeout=5)
+    batcher.close()
+
+
+def test_latency_stats() -> None:
+    """Percentiles are computed on the recorded latencies."""
+    stats = LatencyStats()
+    stats.add_batch([0.01] * 99 + [1.0])
+    summary = stats.summary()
+
+    assert summary["requests"] == 100
+    assert summary["mean_batch_size"] == 100
+    assert summary["latency_p50_ms"] == pytest.approx(10)
+    assert summary["latency_p99_ms"] > 10
+
+
+@pytest.mark.parametrize(
+    "header, status",
+    [("", b" 411 "), ("Content-Length: abc\r\n", b" 400 ")],
+)
+def test_predict_without_content_length(
+    model: RecordingModel, header: str, status: bytes
+) -> None:
+    """A request without a valid Content-Length is rejected.
+
+    Args:
+        model (RecordingModel): [description]
+        header (str): [description]
+        status (bytes): [description]
+    """
+    batcher = MicroBatcher(model, max_wait_ms=1)
+    ts = Tensorize(n_classes=2, img_shape=(32, 32, 3), random_seed=42)
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0), get_handler(batcher, ts, ["Negative", "Positive"])
+    )
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        with socket.create_connection(server.server_address, timeout=5) as client:
+            request = f"POST /predict HTTP/1.1\r\nHost: localhost\r\n{header}\r\n"
+            client.sendall(request.encode())
+            status_line = client.makefile("rb").readline()
+    finally:
+        server.shutdown()
+        server.server_close()
+        batcher.close()
+
+    assert status in status_line
@@ -0,0 +1,111 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from src.sweep import (
+    AshaScheduler,
+    get_cpu_sets,
+    get_threads_overrides,
+    get_trials,
+    save_summary,
+)
+
+
+@pytest.fixture
+def scheduler() -> AshaScheduler:
+    """Returns a scheduler with rungs at 1 and 3 epochs.
+
+    Returns:
+        AshaScheduler: [description]
+    """
+    return AshaScheduler(min_epochs=1, max_epochs=9, reduction_factor=3, mode="min")
+
+
+def test_milestones(scheduler: AshaScheduler) -> None:
+    """Rungs are placed at min_epochs * reduction_factor^k, below max_epochs.
+
+    Args:
+        scheduler (AshaScheduler): [description]
+    """
+    assert scheduler.milestones == [1, 3]
+
+
+def test_on_result_stops_bad_trials(scheduler: AshaScheduler) -> None:
+    """Only the trials among the best third of a rung continue.
+
+    Args:
+        scheduler (AshaScheduler): [description]
+    """
+    assert scheduler.on_result(1, 0.5)
+    assert not scheduler.on_result(1, 0.9)
+    assert scheduler.on_result(1, 0.1)
+    # not a rung, the trial continues
+    assert scheduler.on_result(2, 10.0)
+
+
+def test_on_result_max_mode() -> None:
+    """With mode "max", the highest metrics continue."""
+    scheduler = AshaScheduler(
+        min_epochs=1, max_epochs=9, reduction_factor=3, mode="max"
+    )
+
+    assert scheduler.on_result(1, 0.5)
+    assert not scheduler.on_result(1, 0.1)
+    assert scheduler.on_result(1, 0.9)
+
+
+def test_get_trials() -> None:
+    """Every combination of the search space is a trial."""
+    search_space = {"cnn": ["resnet", "wide_resnet"], "training.lr": [0.1, 0.01]}
+    trials = get_trials(search_space, "test")
+
+    assert len(trials) == 4
+    assert trials[0].overrides == ["cnn=resnet", "training.lr=0.1"]
+    assert len({trial.name for trial in trials}) == 4
+
+
+def test_get_trials_sweep_id() -> None:
+    """The run names of two sweeps differ."""
+    search_space = {"training.lr": [0.1, 0.01]}
+    first = get_trials(search_space, "test", "1")
+    second = get_trials(search_space, "test", "2")
+
+    assert first[0].name == "test_1_0"
+    assert not {trial.name for trial in first} & {trial.name for trial in second}
+
+
+def test_save_summary_empty(tmp_path: Path) -> None:
+    """Nothing is saved for an empty search space.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    destination = tmp_path / "summary.csv"
+    save_summary([], destination, "min")
+
+    assert not destination.exists()
+
+
+def test_get_cpu_sets() -> None:
+    """The cores of the process are split in disjoint sets of the same size."""
+    n_cpus = len(os.sched_getaffinity(0))
+    cpu_sets = get_cpu_sets(1)
+
+    assert len(cpu_sets) == 1
+    assert len(cpu_sets[0]) == n_cpus
+
+    with pytest.raises(ValueError):
+        get_cpu_sets(n_cpus + 1)
+
+
+def test_get_threads_overrides() -> None:
+    """The thread pools of a pinned trial are sized to its cores."""
+    overrides = get_threads_overrides([4, 5, 6, 7], inter_op=1)
+
+    assert overrides == [
+        "threads.cpus=[4,5,6,7]",
+        "threads.intra_op=4",
+        "threads.inter_op=1",
+        "threads.datasets=4",
+    ]
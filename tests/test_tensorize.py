@@ -158,3 +158,40 @@ def test_create_dataset_with_augment(tensor):
 
     for imgs, _ in ds.take(1):
         assert imgs.numpy().shape == (5, 224, 224, 3)
+
+
+def test_cached_dataset(tmp_path: Path, df: pd.DataFrame) -> None:
+    """The cached dataset gives the decoded images, without decoding them again.
+
+    Args:
+        tmp_path (Path): [description]
+        df (pd.DataFrame): [description]
+    """
+    ts = Tensorize(n_classes=2, img_shape=(32, 32, 3), random_seed=42)
+    cache_path = tmp_path / "decoded.npy"
+    ts.cache_images(df["filename"].tolist(), cache_path, batch=6)
+    labels = ts.load_labels(data_frame=df, column_name="label")
+
+    dataset = ts.create_cached_dataset(
+        cache_path, np.arange(0, 20, 2), labels[::2], 4, 1, 1, False
+    )
+    images, one_hot = next(iter(dataset))
+
+    assert np.load(cache_path, mmap_mode="r").shape == (20, 32, 32, 3)
+    assert images.shape == (4, 32, 32, 3)
+    assert images.dtype == tf.float32
+    assert one_hot.shape == (4, 2)
+    assert sum(len(batch[0]) for batch in dataset) == 10
+
+
+def test_grayscale_dataset(df: pd.DataFrame) -> None:
+    """With a single channel, the images are decoded in grayscale.
+
+    Args:
+        df (pd.DataFrame): [description]
+    """
+    ts = Tensorize(n_classes=2, img_shape=(32, 32, 1), random_seed=42)
+
+    images = next(iter(ts.create_inference_dataset(df["filename"].tolist(), 4, 1)))
+
+    assert images.shape == (4, 32, 32, 1)
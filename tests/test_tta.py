@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.tta import TRANSFORMS, with_tta
+
+
+@pytest.fixture
+def model() -> tf.keras.Model:
+    """Returns a classifier sensitive to the orientation of the images.
+
+    Returns:
+        tf.keras.Model: The classifier.
+    """
+    inputs = tf.keras.Input((8, 8, 3))
+    flat = tf.keras.layers.Flatten()(inputs)
+    outputs = tf.keras.layers.Dense(2, activation="softmax")(flat)
+    return tf.keras.Model(inputs, outputs)
+
+
+@pytest.fixture
+def images() -> np.ndarray:
+    """Returns a batch of random images.
+
+    Returns:
+        np.ndarray: 3 images of 8x8x3.
+    """
+    return np.random.default_rng(42).random((3, 8, 8, 3), dtype=np.float32)
+
+
+def test_transforms_are_distinct(images: np.ndarray) -> None:
+    """The 8 transforms give 8 different images.
+
+    Args:
+        images (np.ndarray): [description]
+    """
+    transformed = [transform(images).numpy() for transform in TRANSFORMS]
+
+    for idx, first in enumerate(transformed):
+        for second in transformed[idx + 1 :]:
+            assert not np.allclose(first, second)
+
+
+@pytest.mark.parametrize("n_transforms", [1, 2, 4, 8])
+def test_tta_mean_matches_separate_predictions(
+    model: tf.keras.Model, images: np.ndarray, n_transforms: int
+) -> None:
+    """A single pass gives the mean of the predictions of the transforms.
+
+    Args:
+        model (tf.keras.Model): [description]
+        images (np.ndarray): [description]
+        n_transforms (int): [description]
+    """
+    tta_model = with_tta(model, n_transforms, "mean")
+    expected = np.mean(
+        [model(transform(images)).numpy() for transform in TRANSFORMS[:n_transforms]],
+        axis=0,
+    )
+
+    np.testing.assert_allclose(tta_model(images).numpy(), expected, rtol=1e-5)
+
+
+def test_tta_vote(model: tf.keras.Model, images: np.ndarray) -> None:
+    """Votes are fractions of the transforms, summing to one.
+
+    Args:
+        model (tf.keras.Model): [description]
+        images (np.ndarray): [description]
+    """
+    votes = with_tta(model, 8, "vote")(images).numpy()
+
+    np.testing.assert_allclose(votes.sum(axis=1), 1)
+    np.testing.assert_allclose(votes * 8, np.round(votes * 8), atol=1e-6)
+
+
+def test_tta_rejects_rotations_of_rectangles() -> None:
+    """Rotations are only possible on square images."""
+    inputs = tf.keras.Input((8, 16, 3))
+    outputs = tf.keras.layers.Dense(2)(tf.keras.layers.Flatten()(inputs))
+
+    with pytest.raises(ValueError):
+        with_tta(tf.keras.Model(inputs, outputs), 8)
@@ -0,0 +1,59 @@
+import math
+from pathlib import Path
+from typing import Dict, List
+
+import pytest
+import yaml
+
+from src.tune_batch_size import select_best, write_overrides
+
+
+@pytest.fixture
+def probes() -> List[Dict[str, float]]:
+    """Returns the measures of 4 probes, the fastest one being over the budget.
+
+    Returns:
+        List[Dict[str, float]]: The probes.
+    """
+    return [
+        {"batch_size": 32, "images_per_sec": 300, "peak_rss_mb": 2000, "oom": False},
+        {"batch_size": 64, "images_per_sec": 450, "peak_rss_mb": 3000, "oom": False},
+        {"batch_size": 128, "images_per_sec": 500, "peak_rss_mb": 5000, "oom": False},
+        {"batch_size": 256, "images_per_sec": 0, "peak_rss_mb": math.inf, "oom": True},
+    ]
+
+
+def test_select_best(probes: List[Dict[str, float]]) -> None:
+    """The fastest probe under the budget is selected.
+
+    Args:
+        probes (List[Dict[str, float]]): [description]
+    """
+    assert select_best(probes, 4000)["batch_size"] == 64
+    assert select_best(probes, 8000)["batch_size"] == 128
+    assert select_best(probes, 1000) is None
+
+
+def test_write_overrides(tmp_path: Path) -> None:
+    """The override file sets the tuned parameters in the global package.
+
+    Args:
+        tmp_path (Path): [description]
+    """
+    destination = tmp_path / "node" / "gpu01.yaml"
+    best = {
+        "batch_size": 64,
+        "prefetch": 2,
+        "n_threads": 8,
+        "images_per_sec": 450.0,
+        "peak_rss_mb": 3000.0,
+    }
+
+    write_overrides(destination, best)
+    overrides = yaml.safe_load(destination.read_text())
+
+    assert destination.read_text().startswith("# @package _global_")
+    assert overrides == {
+        "datasets": {"params": {"batch_size": 64, "prefetch": 2}},
+        "threads": {"datasets": 8},
+    }
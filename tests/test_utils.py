@@ -1,11 +1,23 @@
 import os
-from typing import Dict
+from pathlib import Path
+from typing import Dict, Iterator
 
+import mlflow
 import pytest
 from hydra.experimental import compose, initialize
+from mlflow.tracking import MlflowClient
 from omegaconf import DictConfig
 
-from src.utils import config_to_hydra_dict, flatten_omegaconf
+from src.utils import (
+    config_to_hydra_dict,
+    flatten_omegaconf,
+    get_changed_runs,
+    get_img_shape,
+    get_last_runs,
+    get_runs_fingerprint,
+    get_sorted_runs,
+    iter_sorted_runs,
+)
 
 config_files = [
     filename.split(".")[0] for filename in os.listdir("configs") if "yaml" in filename
@@ -53,3 +65,150 @@ def test_flatten_omegaconf(config_name: str) -> None:
         flattened_dict = flatten_omegaconf(cfg)
         assert isinstance(flattened_dict, Dict)
         assert bool(flattened_dict)
+
+
+@pytest.fixture
+def experiment_dir(tmp_path: Path) -> Path:
+    """Returns an experiment folder of a file store with two runs.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Returns:
+        Path: The folder of the experiment.
+    """
+    for run_id, mtime in [("run_a", 100), ("run_b", 200)]:
+        run_dir = tmp_path / run_id
+        run_dir.mkdir()
+        meta = run_dir / "meta.yaml"
+        meta.write_text("status: 3")
+        os.utime(meta, (mtime, mtime))
+    (tmp_path / "meta.yaml").write_text("name: experiment")
+
+    return tmp_path
+
+
+def test_get_runs_fingerprint(experiment_dir: Path) -> None:
+    """The fingerprint counts the runs and gives their last modification.
+
+    Args:
+        experiment_dir (Path): [description]
+    """
+    assert get_runs_fingerprint(experiment_dir) == (2, 200)
+
+
+def test_get_changed_runs(experiment_dir: Path) -> None:
+    """The runs modified since the given time are returned, unless already seen.
+
+    Args:
+        experiment_dir (Path): [description]
+    """
+    assert get_changed_runs(experiment_dir, since=150) == ["run_b"]
+    assert get_changed_runs(experiment_dir, since=200) == ["run_b"]
+    assert get_changed_runs(experiment_dir, since=200, seen=["run_b"]) == []
+    assert get_changed_runs(experiment_dir, since=300) == []
+
+
+def test_get_changed_runs_same_tick(experiment_dir: Path) -> None:
+    """A run written in the same tick as the last seen run isn't skipped.
+
+    Args:
+        experiment_dir (Path): [description]
+    """
+    seen = get_last_runs(experiment_dir, 200)
+    run_dir = experiment_dir / "run_c"
+    run_dir.mkdir()
+    (run_dir / "meta.yaml").write_text("status: 1")
+    os.utime(run_dir / "meta.yaml", (200, 200))
+
+    assert seen == ["run_b"]
+    assert get_changed_runs(experiment_dir, since=200, seen=seen) == ["run_c"]
+
+
+@pytest.fixture
+def tracking_uri(tmp_path: Path) -> Iterator[str]:
+    """Returns a file store of five runs, one of them failed, as the current URI.
+
+    Args:
+        tmp_path (Path): [description]
+
+    Yields:
+        Iterator[str]: The URI of the file store.
+    """
+    uri = f"file://{tmp_path}/mlruns"
+    client = MlflowClient(tracking_uri=uri)
+    experiment_id = client.create_experiment("test")
+    for val_loss, status in [
+        (0.5, "FINISHED"),
+        (0.1, "FINISHED"),
+        (0.4, "FINISHED"),
+        (0.2, "FAILED"),
+        (0.3, "FINISHED"),
+    ]:
+        run_id = client.create_run(experiment_id).info.run_id
+        client.log_metric(run_id, "val_loss", val_loss)
+        client.log_param(run_id, "cnn_name", "ResNetV2")
+        client.set_terminated(run_id, status=status)
+
+    previous_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri(uri)
+    yield uri
+    mlflow.set_tracking_uri(previous_uri)
+
+
+def test_iter_sorted_runs_pages(tracking_uri: str) -> None:
+    """The runs are filtered and sorted by the store, and read page by page.
+
+    Args:
+        tracking_uri (str): [description]
+    """
+    pages = list(
+        iter_sorted_runs(
+            "test",
+            ["metrics.val_loss ASC"],
+            filter_string="attributes.status = 'FINISHED'",
+            columns=["metrics.val_loss"],
+            page_size=3,
+        )
+    )
+
+    assert [len(page) for page in pages] == [3, 1]
+    assert list(pages[0].columns) == ["run_id", "metrics.val_loss"]
+    assert [loss for page in pages for loss in page["metrics.val_loss"]] == [
+        0.1,
+        0.3,
+        0.4,
+        0.5,
+    ]
+
+
+@pytest.mark.parametrize("top_k, n_runs", [(2, 2), (None, 5)])
+def test_get_sorted_runs(tracking_uri: str, top_k: int, n_runs: int) -> None:
+    """Only the top_k best runs are returned, all of them for None.
+
+    Args:
+        tracking_uri (str): [description]
+        top_k (int): [description]
+        n_runs (int): [description]
+    """
+    runs = get_sorted_runs(
+        "test",
+        ["metrics.val_loss DESC"],
+        top_k=top_k,
+        columns=["metrics.val_loss", "params.cnn_name"],
+    )
+
+    assert len(runs) == n_runs
+    assert runs["metrics.val_loss"].iloc[0] == 0.5
+    assert set(runs["params.cnn_name"]) == {"ResNetV2"}
+
+
+@pytest.mark.parametrize("grayscale, channels", [(False, 3), (True, 1)])
+def test_get_img_shape(grayscale: bool, channels: int) -> None:
+    """The grayscale switch only changes the channels.
+
+    Args:
+        grayscale (bool): [description]
+        channels (int): [description]
+    """
+    assert get_img_shape([128, 128, 3], grayscale) == [128, 128, channels]